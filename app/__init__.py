@@ -1,19 +1,22 @@
 # app/__init__.py
 from dotenv import load_dotenv
 import os
+import hmac
 
 # Load environment variables from .env file
 load_dotenv()
 
-from flask import Flask, render_template
+from flask import Flask, render_template, request, jsonify, abort, session
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
-from flask_login import LoginManager
+from flask_login import LoginManager, current_user
 from flask_wtf.csrf import CSRFProtect  # Add this import
 from config import Config
 from datetime import timedelta
 import time
-from app.services.s3_service import S3Service
+from werkzeug.exceptions import RequestEntityTooLarge
+from app.services.storage import LazyStorage, get_storage
+from app.utils.uploads import UploadRequest
 
 # Remove these imports since we're not using them yet
 # from app.utils.telegram_bot import configure_telegram_bot
@@ -29,6 +32,8 @@ login_manager.login_message_category = 'info'
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    # Stream uploads into size-limited spooled buffers (see app/utils/uploads.py)
+    app.request_class = UploadRequest
     
     db.init_app(app)
     migrate.init_app(app, db)
@@ -40,6 +45,7 @@ def create_app(config_class=Config):
     from app.projects.routes import projects
     from app.models.models import User
     from app.friends.routes import friends as friends_bp  # Add this line
+    from app.media.routes import media
     
     @login_manager.user_loader
     def load_user(user_id):
@@ -49,11 +55,41 @@ def create_app(config_class=Config):
     app.register_blueprint(checkin, url_prefix='/checkin')
     app.register_blueprint(projects, url_prefix='/projects')
     app.register_blueprint(friends_bp, url_prefix='/friends')  # Add this line
+    app.register_blueprint(media, url_prefix='/media')
+    
+    from app.cli import register_commands
+    register_commands(app)
     
     @app.route('/')
     def index():
         return render_template('index.html')
     
+    @app.route('/metrics')
+    def metrics():
+        """Operational metrics as JSON (Redis circuit breaker state, ...)
+
+        Disabled (404) unless METRICS_TOKEN is set; callers send it as a bearer token.
+        """
+        metrics_token = app.config.get('METRICS_TOKEN')
+        if not metrics_token:
+            abort(404)
+        authorization = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(authorization.encode(), f'Bearer {metrics_token}'.encode()):
+            abort(403)
+        from app.services.metrics import collect_metrics
+        return jsonify(collect_metrics())
+    
+    @app.errorhandler(RequestEntityTooLarge)
+    def request_too_large(error):
+        """Request body above MAX_CONTENT_LENGTH: answer AJAX uploads in JSON so the page can show it"""
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or request.accept_mimetypes.best == 'application/json':
+            limit_mb = (app.config.get('MAX_CONTENT_LENGTH') or 0) / (1024 * 1024)
+            return jsonify({
+                'success': False,
+                'message': f'Upload is too large. The limit is {limit_mb:.0f} MB per check-in.'
+            }), 413
+        return error
+    
     @app.context_processor
     def inject_asset_version():
         # Get last modified time of main.js
@@ -68,8 +104,42 @@ def create_app(config_class=Config):
     
     @app.context_processor
     def inject_s3_service():
-        s3_service = S3Service()
-        return {'s3_service': s3_service}
+        # The proxy defers building the storage backend until a template needs a URL
+        return {'s3_service': LazyStorage()}
+    
+    @app.after_request
+    def issue_cloudfront_cookies(response):
+        """Give signed-in users CloudFront cookies so image URLs need no per-object signature"""
+        if not app.config.get('CLOUDFRONT_SIGNED_COOKIES') or request.endpoint in (None, 'static'):
+            return response
+        if not current_user.is_authenticated:
+            return response
+        
+        # Re-issue once less than a quarter of the validity window is left
+        refresh_margin = int(app.config.get('CLOUDFRONT_COOKIE_TTL', 24 * 60 * 60)) // 4
+        if session.get('cloudfront_cookies_expire', 0) - time.time() > refresh_margin:
+            return response
+        
+        storage = get_storage()
+        if not storage.use_signed_cookies:
+            return response
+        
+        cookies, expires_at = storage.get_signed_cookies()
+        for cookie_path, values in cookies:
+            for name, value in values.items():
+                response.set_cookie(
+                    name,
+                    value,
+                    expires=expires_at,
+                    path=cookie_path,
+                    domain=app.config.get('CLOUDFRONT_COOKIE_DOMAIN') or None,
+                    secure=True,
+                    httponly=True,
+                    samesite='Lax'
+                )
+        if expires_at:
+            session['cloudfront_cookies_expire'] = expires_at
+        return response
     
     @app.template_global()
     def get_pending_join_request_count(project_id):
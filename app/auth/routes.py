@@ -1,10 +1,12 @@
 # app/auth/routes.py
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session, current_app
 from flask_login import login_user, logout_user, current_user
 from app import db
 from app.models.models import User, Project, ProjectMember
 from app.auth.forms import RegistrationForm, LoginForm, UserSettingsForm
 from flask_login import login_required
+from app.services.storage import get_storage
+from app.services.s3_service import CLOUDFRONT_COOKIE_NAMES
 
 auth = Blueprint('auth', __name__)
 
@@ -44,7 +46,24 @@ def login():
 @auth.route('/logout')
 def logout():
     logout_user()
-    return redirect(url_for('index'))
+    session.pop('cloudfront_cookies_expire', None)
+    response = redirect(url_for('index'))
+    
+    # The CloudFront signed cookies would keep granting access to images until they expire
+    if current_app.config.get('CLOUDFRONT_SIGNED_COOKIES'):
+        storage = get_storage()
+        if storage.use_signed_cookies:
+            for cookie_path in storage.signed_cookie_paths():
+                for name in CLOUDFRONT_COOKIE_NAMES:
+                    response.delete_cookie(
+                        name,
+                        path=cookie_path,
+                        domain=current_app.config.get('CLOUDFRONT_COOKIE_DOMAIN') or None,
+                        secure=True,
+                        httponly=True,
+                        samesite='Lax'
+                    )
+    return response
 
 @auth.route('/settings', methods=['GET', 'POST'])
 @login_required
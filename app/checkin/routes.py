@@ -3,10 +3,16 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import login_required, current_user
 from datetime import datetime, date, timedelta  # 添加 timedelta 导入
 from app import db
-from app.services.s3_service import S3Service  # Import S3Service class
+from app.services.storage import get_storage
+from app.services import image_queue
+from app.services.project_stats import active_users, adjust_daily_rollup, adjust_project_stats, daily_rollups, is_active
+from app.services.streaks import user_streaks
+from app.services.checkin_calendar import checked_in_on, heatmap, mark_day
+from app.services import leaderboard as leaderboards
 from app.models.models import CheckIn, Project, ProjectMember, ProjectStat, UserProjectStat, User, FriendRelationship, CheckInImage  # 添加 CheckInImage
 from app.checkin.forms import CheckInForm, ProjectSelectForm
 from app.utils.timezone import get_user_timezone, to_user_timezone
+from app.utils.uploads import upload_size, upload_stream
 import pytz
 from app.utils.telegram_utils import notify_friends_of_checkin  # Import the notification function
 
@@ -65,13 +71,10 @@ def dashboard():
     start_of_day_utc = user_tz.localize(start_of_day_local).astimezone(pytz.UTC)
     end_of_day_utc = user_tz.localize(end_of_day_local).astimezone(pytz.UTC)
 
-    # Query using the UTC time range that corresponds to the user's local day
-    today_checkin = CheckIn.query.filter(
-        CheckIn.user_id == current_user.id,
-        CheckIn.project_id == project.id,
-        CheckIn.check_time >= start_of_day_utc,
-        CheckIn.check_time <= end_of_day_utc
-    ).first()
+    # Query using the UTC time range that corresponds to the user's local day;
+    # a submitted check-in always looks at the check-ins themselves
+    today_checkin = find_today_checkin(current_user.id, project.id, start_of_day_utc, end_of_day_utc,
+                                       use_calendar=request.method != 'POST')
     
     if form.validate_on_submit() and request.method == 'POST':
         if project.frequency_type == 'daily' and today_checkin:
@@ -95,12 +98,11 @@ def dashboard():
                 # Log error but don't interrupt the check-in process
                 current_app.logger.error(f"Failed to send check-in notifications: {str(e)}")
 
-            # 更新项目统计
-            update_project_stats(project.id)
-            # 更新用户项目统计 - pass UTC date
-            update_user_project_stats(current_user.id, project.id, now_utc.date())
+            # 更新用户和项目统计 - pass UTC date
+            user_stats = update_user_project_stats(current_user.id, project.id, now_utc.date())
             
             db.session.commit()
+            record_checkin_scores(user_stats)
             flash('Check-in successful!', 'success')
             return redirect(url_for('checkin.dashboard', project=project.id))
     
@@ -133,9 +135,9 @@ def dashboard():
             datetime.combine(checkin.check_date, datetime.min.time()).replace(tzinfo=pytz.UTC)
         ).date()
     
-    # Create S3 service for the template
-    from app.services.s3_service import S3Service
-    s3_service = S3Service()
+    # Shared S3 service for the template
+    storage = get_storage()
+    image_sources = resolve_image_sources(recent_checkins)
     
     return render_template(
         'checkin/dashboard.html',
@@ -147,7 +149,8 @@ def dashboard():
         project=project,
         projects=projects,
         user_stats=user_stats,
-        s3_service=s3_service
+        s3_service=storage,
+        image_sources=image_sources
     )
 
 @checkin.route('/history')
@@ -269,9 +272,9 @@ def history():
             datetime.combine(checkin.check_date, datetime.min.time()).replace(tzinfo=pytz.UTC)
         ).date()
     
-    # Create S3 service for the template
-    from app.services.s3_service import S3Service
-    s3_service = S3Service()
+    # Shared S3 service for the template
+    storage = get_storage()
+    image_sources = resolve_image_sources(checkin_tuple[0] for checkin_tuple in checkins.items)
     
     # Check if this is an AJAX request
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -281,7 +284,8 @@ def history():
                                    checkins=checkins,
                                    view_mode=view_mode,
                                    project=project,
-                                   s3_service=s3_service)
+                                   s3_service=storage,
+                                   image_sources=image_sources)
         })
     
     return render_template(
@@ -292,7 +296,46 @@ def history():
         checkins=checkins,
         view_mode=view_mode,
         project_stats=project_stats,
-        s3_service=s3_service
+        s3_service=storage,
+        image_sources=image_sources
+    )
+
+@checkin.route('/leaderboard')
+@login_required
+def leaderboard():
+    """Leaderboards of a project by current streak, highest streak and check-ins"""
+    project_id = request.args.get('project', type=int)
+    
+    # Get user's projects
+    projects = db.session.query(Project).join(
+        ProjectMember, Project.id == ProjectMember.project_id
+    ).filter(
+        ProjectMember.user_id == current_user.id
+    ).all()
+    
+    if project_id is None and projects:
+        project_id = projects[0].id
+    
+    project = next((p for p in projects if p.id == project_id), None) if project_id else None
+    
+    if not project:
+        flash('Project not found or you don\'t have access.', 'danger')
+        return redirect(url_for('projects.list_projects'))
+    
+    project_select_form = ProjectSelectForm()
+    project_select_form.project.choices = [(p.id, p.name) for p in projects]
+    project_select_form.project.default = project_id
+    project_select_form.process()
+    
+    visible_user_ids = get_visible_user_ids(current_user.id, project.id)
+    boards = [leaderboards.leaderboard(project.id, visible_user_ids, metric) for metric in leaderboards.METRICS]
+    
+    return render_template(
+        'checkin/leaderboard.html',
+        title='Leaderboard',
+        project=project,
+        project_select_form=project_select_form,
+        boards=boards
     )
 
 @checkin.route('/delete_checkin/<int:checkin_id>', methods=['POST'])
@@ -308,55 +351,75 @@ def delete_checkin(checkin_id):
         flash('You do not have permission to delete this check-in.', 'danger')
         return redirect(url_for('checkin.history'))
     
-    # Store project_id before deleting the record
+    # Store project_id and image keys before deleting the record
     project_id = checkin.project_id
+    check_date = checkin.check_date
+    image_keys = [image.s3_key for image in checkin.images]
+    image_renditions = [image.renditions for image in checkin.images]
     
-    # Delete the check-in
+    # Delete the check-in (images are removed by the cascade)
     db.session.delete(checkin)
+    db.session.flush()
     
-    # Update project statistics
-    update_project_stats(project_id)
-    
-    # Update user project statistics
-    # Get all remaining check-ins for this user in this project
-    user_checkins = CheckIn.query.filter_by(
-        user_id=current_user.id,
-        project_id=project_id
-    ).order_by(CheckIn.check_date).all()
-    
-    # Reset stats
+    # Recompute the user's streaks from the remaining check-ins in the database
     user_stats = UserProjectStat.query.filter_by(
         user_id=current_user.id,
         project_id=project_id
     ).first()
+    previous_checkin_date = None
+    previous_highest_streak = 0
     
     if user_stats:
-        user_stats.total_checkins = len(user_checkins)
-        
-        # Recalculate streak from scratch
-        current_streak = 0
-        highest_streak = 0
-        last_date = None
-        
-        for check in user_checkins:
-            if not last_date or (check.check_date - last_date).days == 1:
-                current_streak += 1
-            elif last_date and check.check_date == last_date:
-                # Same day check-in, don't increment streak
-                pass
-            else:
-                # Streak broken
-                current_streak = 1
-            
-            highest_streak = max(highest_streak, current_streak)
-            last_date = check.check_date
-        
-        user_stats.current_streak = current_streak
-        user_stats.highest_streak = highest_streak
-        user_stats.last_checkin_date = last_date if user_checkins else None
+        previous_checkin_date = user_stats.last_checkin_date
+        previous_highest_streak = user_stats.highest_streak or 0
+        recomputed = user_streaks(current_user.id, project_id)
+        for field, value in recomputed.items():
+            setattr(user_stats, field, value)
+    last_checkin_date = user_stats.last_checkin_date if user_stats else None
+    
+    # The user leaves the day's distinct users and calendar with their last check-in of that day
+    still_checked_in = db.session.query(CheckIn.query.filter_by(
+        user_id=current_user.id,
+        project_id=project_id,
+        check_date=check_date
+    ).exists()).scalar()
+    if not still_checked_in:
+        mark_day(current_user.id, project_id, check_date, checked_in=False)
+    adjust_daily_rollup(
+        project_id,
+        check_date,
+        checkins_delta=-1,
+        users_delta=0 if still_checked_in else -1,
+        previous_last_date=previous_checkin_date,
+        last_date=last_checkin_date
+    )
+    
+    highest_streak = user_stats.highest_streak if user_stats else 0
+    utc_today = datetime.now(pytz.UTC).date()
+    adjust_project_stats(
+        project_id,
+        checkins_delta=-1,
+        was_active=is_active(previous_checkin_date, utc_today),
+        now_active=is_active(last_checkin_date, utc_today),
+        highest_streak=highest_streak,
+        lowered_streak=highest_streak < previous_highest_streak
+    )
     
     db.session.commit()
     
+    if user_stats:
+        leaderboards.record_scores(project_id, current_user.id, last_checkin_date, scores={
+            metric: getattr(user_stats, metric) for metric in leaderboards.METRICS
+        })
+    
+    # Delete the images, thumbnails and renditions from S3
+    if image_keys:
+        try:
+            storage = get_storage()
+            storage.delete_keys(storage.image_keys(image_keys, image_renditions))
+        except Exception as e:
+            current_app.logger.error(f"Failed to delete check-in images from S3: {str(e)}")
+    
     # Check if this is an AJAX request
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return jsonify({
@@ -500,16 +563,17 @@ def view_checkin(checkin_id):
     # Get project details
     project = Project.query.get(checkin.project_id)
     
-    # Create S3 service for the template
-    from app.services.s3_service import S3Service
-    s3_service = S3Service()
+    # Shared S3 service for the template
+    storage = get_storage()
+    image_sources = resolve_image_sources([checkin])
     
     return render_template(
         'checkin/view_checkin.html',
         title='View Check-in',
         checkin=checkin,
         project=project,
-        s3_service=s3_service
+        s3_service=storage,
+        image_sources=image_sources
     )
 
 @checkin.route('/timeline')
@@ -537,11 +601,13 @@ def timeline():
     today = datetime.now(pytz.UTC).date()
     already_checked_in = False
     if project and project.frequency_type == 'daily':
-        already_checked_in = CheckIn.query.filter(
-            CheckIn.user_id == current_user.id,
-            CheckIn.project_id == project.id,
-            CheckIn.check_date == today
-        ).first() is not None
+        already_checked_in = checked_in_on(current_user.id, project.id, [today])
+        if already_checked_in is None:
+            already_checked_in = CheckIn.query.filter(
+                CheckIn.user_id == current_user.id,
+                CheckIn.project_id == project.id,
+                CheckIn.check_date == today
+            ).first() is not None
     
     # Get check-ins with pagination
     page = request.args.get('page', 1, type=int)
@@ -587,9 +653,9 @@ def timeline():
         else:
             grouped_checkins['earlier'].append(checkin)
     
-    # Create S3 service for the template
-    from app.services.s3_service import S3Service
-    s3_service = S3Service()
+    # Shared S3 service for the template
+    storage = get_storage()
+    image_sources = resolve_image_sources(checkins_pagination.items)
     
     return render_template(
         'checkin/timeline.html', 
@@ -599,42 +665,216 @@ def timeline():
         pagination=checkins_pagination,
         form=form,
         already_checked_in=already_checked_in,
-        s3_service=s3_service  # Add S3 service for image URLs
+        s3_service=storage,  # Add S3 service for image URLs
+        image_sources=image_sources
     )
 
-def update_project_stats(project_id):
-    """更新项目统计数据"""
-    stats = ProjectStat.query.filter_by(project_id=project_id).first()
-    if not stats:
-        stats = ProjectStat(project_id=project_id)
-        db.session.add(stats)
-    
-    # 计算总打卡次数
-    stats.total_checkins = CheckIn.query.filter_by(project_id=project_id).count()
-    
-    # 计算活跃用户数（过去30天有打卡记录的用户）
-    thirty_days_ago = datetime.now(pytz.UTC) - timedelta(days=30)
-    active_users = db.session.query(db.func.count(db.distinct(CheckIn.user_id))).filter(
-        CheckIn.project_id == project_id,
-        CheckIn.check_time >= thirty_days_ago
-    ).scalar()
-    stats.active_users = active_users or 0
+def resolve_image_sources(checkins):
+    """Resolve thumbnail URLs and srcsets for every image of a page of check-ins in one batch
     
-    # 找出最高连续打卡天数
-    all_user_stats = UserProjectStat.query.filter_by(project_id=project_id).all()
-    highest_streak = 0
-    for user_stat in all_user_stats:
-        if user_stat.highest_streak > highest_streak:
-            highest_streak = user_stat.highest_streak
+    Templates look sources up in the returned dict instead of calling
+    get_thumbnail_url per image, so a page costs one cache round trip.
     
-    stats.highest_streak = highest_streak
-    stats.last_updated = datetime.now(pytz.UTC)
+    Args:
+        checkins: Iterable of CheckIn objects
+        
+    Returns:
+        dict: {s3_key: {'src': url, 'srcsets': {content_type: srcset}, 'aspect_ratio': float or None}}
+    """
+    images = [image for checkin in checkins for image in checkin.images]
+    if not images:
+        return {}
+    
+    # Images still being processed (or that failed) have nothing in storage yet
+    image_sources = {
+        image.s3_key: {'src': image_placeholder_url(image), 'srcsets': {}, 'aspect_ratio': None}
+        for image in images if not image.is_ready()
+    }
+    ready_images = [image for image in images if image.is_ready()]
+    image_sources.update(get_storage().get_image_sources(
+        [image.s3_key for image in ready_images],
+        renditions={image.s3_key: image.renditions for image in ready_images if image.renditions}
+    ))
+    return image_sources
+
+def resolve_thumbnail_urls(checkins):
+    """Like resolve_image_sources(), for JSON responses that only need the thumbnail URL
     
-    return stats
+    Returns:
+        dict: {s3_key: thumbnail_url}
+    """
+    return {s3_key: source['src'] for s3_key, source in resolve_image_sources(checkins).items()}
+
+def image_placeholder_url(image):
+    """Placeholder shown while an image is processing, or after processing failed"""
+    filename = 'img/image-failed.svg' if image.status == 'failed' else 'img/image-processing.svg'
+    return url_for('static', filename=filename)
+
+def process_images_inline(checkin, project, images):
+    """Resize, thumbnail and upload check-in images within the request
+    
+    Args:
+        checkin: CheckIn the images belong to
+        project: Project of the check-in
+        images: Uploaded FileStorage objects
+        
+    Returns:
+        int: Number of images added
+    """
+    from app.utils.image_utils import prepare_images
+    
+    storage = get_storage()
+    max_image_size = current_app.config.get('MAX_IMAGE_SIZE', 5 * 1024 * 1024)
+    
+    # Check file sizes; oversized parts were already dropped while the request was parsed
+    candidates = []
+    for image in images:
+        if upload_size(image) > max_image_size:
+            current_app.logger.warning(f"Image {image.filename} exceeds maximum size")
+            continue
+        candidates.append((image, upload_stream(image)))
+        
+        # Limit the number of images per check-in if needed
+        if len(candidates) >= 5:  # Limit to 5 images per check-in
+            break
+    
+    # Decode, resize and thumbnail all images in parallel; results keep upload order
+    pending = []
+    prepared_images = prepare_images([image_data for _, image_data in candidates])
+    for (image, _), prepared in zip(candidates, prepared_images):
+        if prepared is None:
+            current_app.logger.warning(f"File {image.filename} is not a valid image, has unsupported format or could not be processed")
+            continue
+        
+        s3_key = storage.generate_s3_key(current_user.id, project.id, image.filename)
+        uploads, renditions = storage.image_uploads(s3_key, prepared)
+        pending.append({
+            'filename': image.filename,
+            's3_key': s3_key,
+            'content_type': prepared['content_type'],
+            'file_size': len(prepared['data']),
+            'uploads': uploads,
+            'renditions': renditions,
+            'width': prepared['width'],
+            'height': prepared['height'],
+            'placeholder': prepared['placeholder']
+        })
+    
+    # Upload originals, thumbnails and renditions to S3
+    results = {result['s3_key']: result for result in storage.upload_many(
+        [upload for item in pending for upload in item['uploads']]
+    )}
+    
+    images_added = 0
+    orphaned_keys = []
+    for item in pending:
+        item_keys = [s3_key for _, s3_key, _ in item['uploads']]
+        
+        failed = [results[key] for key in item_keys if not results[key]['success']]
+        if failed:
+            current_app.logger.error(f"Failed to upload image {item['filename']}: {failed[0]['error']}")
+            orphaned_keys.extend(key for key in item_keys if results[key]['success'])
+            continue
+        
+        # Add image to check-in
+        checkin.add_image(
+            s3_key=item['s3_key'],
+            original_filename=item['filename'],
+            content_type=item['content_type'],
+            file_size=item['file_size'],
+            is_public=False,  # Default to private
+            renditions=item['renditions'],
+            width=item['width'],
+            height=item['height'],
+            placeholder=item['placeholder']
+        )
+        
+        images_added += 1
+        current_app.logger.info(f"Successfully added image {item['filename']} to check-in {checkin.id}")
+    
+    # Remove the uploaded parts of images whose other uploads failed
+    if orphaned_keys:
+        storage.delete_keys(orphaned_keys)
+    
+    return images_added
+
+def queue_images(checkin, project, images):
+    """Stage check-in images for the background workers (flask process-images)
+    
+    Only the header is parsed here; the rows stay in the 'processing' state
+    until a worker has resized and uploaded them.
+    
+    Args:
+        checkin: CheckIn the images belong to
+        project: Project of the check-in
+        images: Uploaded FileStorage objects
+        
+    Returns:
+        int: Number of images queued
+    """
+    storage = get_storage()
+    max_image_size = current_app.config.get('MAX_IMAGE_SIZE', 5 * 1024 * 1024)
+    
+    images_queued = 0
+    for image in images:
+        file_size = upload_size(image)
+        if file_size > max_image_size:
+            current_app.logger.warning(f"Image {image.filename} exceeds maximum size")
+            continue
+        
+        image_data = upload_stream(image)
+        if not image_queue.looks_like_image(image_data):
+            current_app.logger.warning(f"File {image.filename} is not a valid image or has unsupported format")
+            continue
+        
+        checkin.add_image(
+            s3_key=storage.generate_s3_key(current_user.id, project.id, image.filename),
+            original_filename=image.filename,
+            content_type=image.mimetype or 'application/octet-stream',
+            file_size=file_size,
+            is_public=False,  # Default to private
+            status='processing',
+            staged_path=image_queue.stage_upload(image_data)
+        )
+        
+        images_queued += 1
+        if images_queued >= 5:  # Limit to 5 images per check-in
+            break
+    
+    return images_queued
+
+def find_today_checkin(user_id, project_id, start_of_day_utc, end_of_day_utc, use_calendar=True):
+    """查找用户本地"今天"(对应的UTC时间范围)内的打卡
+    
+    先查打卡日历: 没有打卡(最常见的情况，打卡前打开页面)时不查询打卡记录。
+    日历位在打卡提交之后、统计更新时才置位，两者之间(如处理图片时)
+    重复提交的打卡还看不到它，所以判断能否打卡的写入路径不能只信日历。
+    
+    Args:
+        user_id: 用户ID
+        project_id: 项目ID
+        start_of_day_utc: 用户本地今天开始的UTC时间
+        end_of_day_utc: 用户本地今天结束的UTC时间
+        use_calendar: 日历位未置位时直接返回 None；写入路径传 False，始终查询打卡记录
+    
+    Returns:
+        CheckIn 或 None
+    """
+    if use_calendar and checked_in_on(user_id, project_id, {start_of_day_utc.date(), end_of_day_utc.date()}) is False:
+        return None
+    return CheckIn.query.filter(
+        CheckIn.user_id == user_id,
+        CheckIn.project_id == project_id,
+        CheckIn.check_time >= start_of_day_utc,
+        CheckIn.check_time <= end_of_day_utc
+    ).first()
 
 def update_user_project_stats(user_id, project_id, utc_today):
     """更新用户项目统计数据
     
+    记录一次新打卡: 用户统计和项目统计(ProjectStat)都以增量方式更新，
+    开销与历史打卡数量无关。
+    
     Args:
         user_id: 用户ID
         project_id: 项目ID
@@ -646,24 +886,20 @@ def update_user_project_stats(user_id, project_id, utc_today):
     ).first()
     
     if not user_stats:
-        user_stats = UserProjectStat(user_id=user_id, project_id=project_id)
+        user_stats = UserProjectStat(user_id=user_id, project_id=project_id, total_checkins=1)
         db.session.add(user_stats)
+    else:
+        # 原子递增总打卡次数，避免每次打卡都 COUNT 全部历史
+        user_stats.total_checkins = UserProjectStat.total_checkins + 1
     
-    # 更新总打卡次数
-    user_stats.total_checkins = CheckIn.query.filter_by(
-        user_id=user_id, 
-        project_id=project_id
-    ).count()
+    previous_checkin_date = user_stats.last_checkin_date
     
     # 如果这是第一次打卡
-    if not user_stats.last_checkin_date:
+    if not previous_checkin_date:
         user_stats.current_streak = 1
         user_stats.highest_streak = 1
-        user_stats.last_checkin_date = utc_today
-        return user_stats
-    
     # 计算连续打卡天数 - 使用UTC日期进行比较
-    if user_stats.last_checkin_date == utc_today - timedelta(days=1):
+    elif previous_checkin_date == utc_today - timedelta(days=1):
         # 连续打卡
         user_stats.current_streak += 1
         if user_stats.current_streak > user_stats.highest_streak:
@@ -676,8 +912,70 @@ def update_user_project_stats(user_id, project_id, utc_today):
         user_stats.current_streak = 1
     
     user_stats.last_checkin_date = utc_today
+    
+    # 增量更新打卡日历、当天的汇总和项目统计
+    if previous_checkin_date != utc_today:
+        mark_day(user_id, project_id, utc_today)
+    adjust_daily_rollup(
+        project_id,
+        utc_today,
+        checkins_delta=1,
+        users_delta=int(previous_checkin_date != utc_today),
+        previous_last_date=previous_checkin_date,
+        last_date=utc_today
+    )
+    adjust_project_stats(
+        project_id,
+        checkins_delta=1,
+        was_active=is_active(previous_checkin_date, utc_today),
+        now_active=True,
+        highest_streak=user_stats.highest_streak
+    )
     return user_stats
 
+def record_checkin_scores(user_stats):
+    """把一次新打卡后的统计写入排行榜
+    
+    在 db.session.commit() 之后调用，回滚的打卡不会进入排行榜。
+    统计先从数据库重新读取，写入的是提交后的绝对值，与同时进行的重建不会重复计数。
+    
+    Args:
+        user_stats: update_user_project_stats() 返回的用户统计
+    """
+    db.session.refresh(user_stats)
+    leaderboards.record_scores(
+        user_stats.project_id,
+        user_stats.user_id,
+        user_stats.last_checkin_date,
+        scores={metric: getattr(user_stats, metric) for metric in leaderboards.METRICS}
+    )
+
+def get_visible_user_ids(viewer_id, project_id):
+    """IDs of the users whose check-ins a viewer can see in a project
+    
+    The same rules as can_view_checkin(): the viewer, and the project
+    members who are friends of the viewer.
+    
+    Args:
+        viewer_id: The user viewing
+        project_id: The project ID
+        
+    Returns:
+        list: User IDs, including the viewer
+    """
+    member_ids = {member_id for (member_id,) in db.session.query(ProjectMember.user_id).filter(
+        ProjectMember.project_id == project_id
+    )}
+    friend_ids = {friend_id for (friend_id,) in db.session.query(FriendRelationship.addressee_id).filter(
+        FriendRelationship.requester_id == viewer_id,
+        FriendRelationship.status == 'accepted'
+    )}
+    friend_ids.update(friend_id for (friend_id,) in db.session.query(FriendRelationship.requester_id).filter(
+        FriendRelationship.addressee_id == viewer_id,
+        FriendRelationship.status == 'accepted'
+    ))
+    return sorted((member_ids & friend_ids) | {viewer_id})
+
 def can_view_checkin(viewer_id, owner_id, project_id):
     """Determine if a user can view another user's check-ins
     
@@ -745,6 +1043,97 @@ def get_project_details(project_id):
         }
     })
 
+@checkin.route('/api/project/<int:project_id>/daily', methods=['GET'])
+@login_required
+def get_project_daily(project_id):
+    """API endpoint for a project's daily check-in chart
+    
+    Reads the daily rollups: ?days=N (1-366, default 30) rows at most,
+    whatever the number of check-ins.
+    """
+    is_member = ProjectMember.query.filter_by(
+        user_id=current_user.id,
+        project_id=project_id
+    ).first() is not None
+    
+    if not is_member:
+        return jsonify({
+            'success': False,
+            'message': 'Project not found or you don\'t have access'
+        }), 404
+    
+    days = min(max(request.args.get('days', 30, type=int), 1), 366)
+    return jsonify({
+        'success': True,
+        'active_users': active_users(project_id),
+        'days': daily_rollups(project_id, days)
+    })
+
+@checkin.route('/api/project/<int:project_id>/heatmap', methods=['GET'])
+@login_required
+def get_project_heatmap(project_id):
+    """API endpoint for a year of a user's check-in calendar
+    
+    ?user=ID (default: yourself) and ?year=YYYY (default: this UTC year).
+    Reads one calendar row; other users' calendars follow the same
+    visibility rules as their check-ins.
+    """
+    user_id = request.args.get('user', current_user.id, type=int)
+    year = request.args.get('year', datetime.now(pytz.UTC).year, type=int)
+    
+    is_member = ProjectMember.query.filter_by(
+        user_id=current_user.id,
+        project_id=project_id
+    ).first() is not None
+    
+    if not is_member or not can_view_checkin(current_user.id, user_id, project_id):
+        return jsonify({
+            'success': False,
+            'message': 'Project not found or you don\'t have access'
+        }), 404
+    
+    if not 1970 <= year <= 9999:
+        return jsonify({
+            'success': False,
+            'message': 'Invalid year'
+        }), 400
+    
+    return jsonify(dict(heatmap(user_id, project_id, year), success=True, user_id=user_id))
+
+@checkin.route('/api/project/<int:project_id>/leaderboard', methods=['GET'])
+@login_required
+def get_project_leaderboard(project_id):
+    """API endpoint for a project leaderboard
+    
+    ?metric=current_streak|highest_streak|total_checkins (default
+    current_streak) and ?limit=N (1-100). Ranks the current user and the
+    friends they can see in the project.
+    """
+    is_member = ProjectMember.query.filter_by(
+        user_id=current_user.id,
+        project_id=project_id
+    ).first() is not None
+    
+    if not is_member:
+        return jsonify({
+            'success': False,
+            'message': 'Project not found or you don\'t have access'
+        }), 404
+    
+    metric = request.args.get('metric', 'current_streak')
+    if metric not in leaderboards.METRICS:
+        return jsonify({
+            'success': False,
+            'message': f"metric must be one of {', '.join(leaderboards.METRICS)}"
+        }), 400
+    
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        limit = min(max(limit, 1), 100)
+    
+    board = leaderboards.leaderboard(project_id, get_visible_user_ids(current_user.id, project_id), metric, limit)
+    return jsonify(dict(board, success=True))
+
 @checkin.route('/api/checkin', methods=['POST'])
 @login_required
 def ajax_checkin():
@@ -799,12 +1188,8 @@ def ajax_checkin():
     start_of_day_utc = user_tz.localize(start_of_day_local).astimezone(pytz.UTC)
     end_of_day_utc = user_tz.localize(end_of_day_local).astimezone(pytz.UTC)
 
-    today_checkin = CheckIn.query.filter(
-        CheckIn.user_id == current_user.id,
-        CheckIn.project_id == project.id,
-        CheckIn.check_time >= start_of_day_utc,
-        CheckIn.check_time <= end_of_day_utc
-    ).first()
+    today_checkin = find_today_checkin(current_user.id, project.id, start_of_day_utc, end_of_day_utc,
+                                       use_calendar=False)
     
     if project.frequency_type == 'daily' and today_checkin:
         return jsonify({
@@ -812,6 +1197,17 @@ def ajax_checkin():
             'message': 'You have already checked in today for this project'
         }), 400
     
+    # Shed load before creating anything when the image workers are saturated
+    processing_mode = current_app.config.get('IMAGE_PROCESSING_MODE', 'inline')
+    if has_images and processing_mode == 'queue':
+        image_count = min(len([image for image in request.files.getlist('images') if image and image.filename]), 5)
+        if not image_queue.has_capacity(image_count):
+            retry_after = current_app.config.get('IMAGE_QUEUE_RETRY_AFTER', 30)
+            return jsonify({
+                'success': False,
+                'message': 'Image processing is busy right now. Please try again in a moment.'
+            }), 503, {'Retry-After': str(retry_after)}
+    
     # Create new check-in
     checkin = CheckIn(
         user_id=current_user.id,
@@ -827,65 +1223,15 @@ def ajax_checkin():
     
     # Process images if provided
     images_added = 0
+    images_processing = 0
     if has_images:
-        from app.utils.image_utils import process_image, create_thumbnail, is_valid_image
-        from app.services.s3_service import S3Service
-        
-        images = request.files.getlist('images')
-        if images and any(img.filename for img in images):
-            s3_service = S3Service()
-            max_image_size = current_app.config.get('MAX_IMAGE_SIZE', 5 * 1024 * 1024)
-            allowed_extensions = current_app.config.get('ALLOWED_IMAGE_EXTENSIONS', 
-                                                   ['jpg', 'jpeg', 'png', 'gif', 'webp'])
-            
-            for image in images:
-                if image and image.filename:
-                    # Check file size
-                    image_data = image.read()
-                    if len(image_data) > max_image_size:
-                        current_app.logger.warning(f"Image {image.filename} exceeds maximum size")
-                        continue
-                    
-                    # Validate image type
-                    if not is_valid_image(image_data, allowed_extensions):
-                        current_app.logger.warning(f"File {image.filename} is not a valid image or has unsupported format")
-                        continue
-                    
-                    try:
-                        # Process the image (resize, optimize)
-                        processed_data, content_type, width, height = process_image(image_data)
-                        
-                        if processed_data and content_type:
-                            # Generate thumbnail
-                            thumbnail_data = create_thumbnail(image_data)
-                            
-                            # Generate S3 keys
-                            s3_key = s3_service.generate_s3_key(current_user.id, project.id, image.filename)
-                            thumbnail_key = f"thumbnails/{s3_key}"
-                            
-                            # Upload to S3
-                            s3_service.upload_file(processed_data, s3_key, content_type)
-                            if thumbnail_data:
-                                s3_service.upload_file(thumbnail_data, thumbnail_key, 'image/jpeg')
-                            
-                            # Add image to check-in
-                            checkin.add_image(
-                                s3_key=s3_key,
-                                original_filename=image.filename,
-                                content_type=content_type,
-                                file_size=len(processed_data),
-                                is_public=False  # Default to private
-                            )
-                            
-                            images_added += 1
-                            current_app.logger.info(f"Successfully added image {image.filename} to check-in {checkin.id}")
-                            
-                            # Limit the number of images per check-in if needed
-                            if images_added >= 5:  # Limit to 5 images per check-in
-                                break
-                    except Exception as e:
-                        current_app.logger.error(f"Failed to process image {image.filename}: {str(e)}")
-                        continue
+        images = [image for image in request.files.getlist('images') if image and image.filename]
+        if images:
+            if processing_mode == 'queue':
+                images_processing = queue_images(checkin, project, images)
+                images_added = images_processing
+            else:
+                images_added = process_images_inline(checkin, project, images)
     
     try:
         # Notify friends
@@ -894,12 +1240,11 @@ def ajax_checkin():
         except Exception as e:
             current_app.logger.error(f"Failed to send check-in notifications: {str(e)}")
         
-        # Update project stats
-        update_project_stats(project.id)
-        # Update user project stats
-        update_user_project_stats(current_user.id, project.id, now_utc.date())
+        # Update user and project stats
+        user_stats = update_user_project_stats(current_user.id, project.id, now_utc.date())
         
         db.session.commit()
+        record_checkin_scores(user_stats)
         
         response_data = {
             'success': True,
@@ -909,6 +1254,8 @@ def ajax_checkin():
         
         if images_added > 0:
             response_data['images_added'] = images_added
+        if images_processing > 0:
+            response_data['images_processing'] = images_processing
             
         return jsonify(response_data)
         
@@ -945,6 +1292,7 @@ def get_recent_checkins(project_id):
     # Format the check-ins as JSON with proper timezone conversion
     checkins_json = []
     user_tz = get_user_timezone()  # Get the user's timezone
+    thumbnail_urls = resolve_thumbnail_urls(recent_checkins)
     
     for check in recent_checkins:
         # Convert UTC time to user's local timezone
@@ -955,14 +1303,14 @@ def get_recent_checkins(project_id):
         images_json = []
         if check.has_images():
             for image in check.images:
-                # Generate the thumbnail URL through S3 service
-                s3_service = S3Service()
-                thumbnail_url = s3_service.get_thumbnail_url(image.s3_key)
-                
                 images_json.append({
                     'id': image.id,
                     's3_key': image.s3_key,
-                    'thumbnail_url': thumbnail_url
+                    'status': image.status,
+                    'thumbnail_url': thumbnail_urls.get(image.s3_key),
+                    'width': image.width,
+                    'height': image.height,
+                    'placeholder': image.placeholder
                 })
         
         checkins_json.append({
@@ -978,6 +1326,50 @@ def get_recent_checkins(project_id):
         'recent_checkins': checkins_json
     })
 
+@checkin.route('/api/images/status', methods=['GET'])
+@login_required
+def image_status():
+    """API endpoint polled by the browser while images are processed in the background
+    
+    Query args:
+    - ids: Comma-separated image IDs (at most 50)
+    """
+    image_ids = [int(i) for i in request.args.get('ids', '').split(',') if i.strip().isdigit()][:50]
+    if not image_ids:
+        return jsonify({'success': True, 'images': {}})
+    
+    rows = db.session.query(CheckInImage, CheckIn).join(
+        CheckIn, CheckIn.id == CheckInImage.checkin_id
+    ).filter(
+        CheckInImage.id.in_(image_ids)
+    ).all()
+    
+    images = [
+        image for image, check in rows
+        if image.is_public or can_view_checkin(current_user.id, check.user_id, check.project_id)
+    ]
+    ready_images = [image for image in images if image.is_ready()]
+    thumbnail_urls = get_storage().get_thumbnail_urls(
+        [image.s3_key for image in ready_images],
+        renditions={image.s3_key: image.renditions for image in ready_images if image.renditions}
+    )
+    
+    response = jsonify({
+        'success': True,
+        'images': {
+            str(image.id): {
+                'status': image.status,
+                'thumbnail_url': thumbnail_urls.get(image.s3_key) or image_placeholder_url(image),
+                'width': image.width,
+                'height': image.height,
+                'placeholder': image.placeholder
+            }
+            for image in images
+        }
+    })
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
 @checkin.route('/image/<int:image_id>')
 @login_required
 def view_image(image_id):
@@ -990,9 +1382,15 @@ def view_image(image_id):
         flash('You do not have permission to view this image.', 'danger')
         return redirect(url_for('checkin.dashboard'))
     
-    # Get image URL from S3
-    s3_service = S3Service()
-    image_url = s3_service.generate_presigned_url(image.s3_key)
+    # Get image URL from S3; browsers that support srcset pick a rendition instead
+    image_sources = {}
+    if image.is_ready():
+        storage = get_storage()
+        image_url = storage.generate_presigned_url(image.s3_key)
+        if image.renditions:
+            image_sources = storage.get_image_sources([image.s3_key], renditions={image.s3_key: image.renditions})
+    else:
+        image_url = image_placeholder_url(image)
     
     if not image_url:
         flash('Failed to retrieve image.', 'danger')
@@ -1003,7 +1401,8 @@ def view_image(image_id):
         title='View Image',
         image=image,
         checkin=checkin,
-        image_url=image_url
+        image_url=image_url,
+        image_sources=image_sources
     )
 
 @checkin.route('/image/<int:image_id>/delete', methods=['POST'])
@@ -1018,21 +1417,18 @@ def delete_image(image_id):
         flash('You can only delete your own images.', 'danger')
         return redirect(url_for('checkin.view_checkin', checkin_id=checkin.id))
     
-    # Delete from S3
-    try:
-        s3_service = S3Service()
-        s3_service.delete_file(image.s3_key)
-        
-        # Also delete thumbnail if it exists
-        thumbnail_key = f"thumbnails/{image.s3_key}"
-        s3_service.delete_file(thumbnail_key)
-    except Exception as e:
-        current_app.logger.error(f"Failed to delete image from S3: {str(e)}")
-        # Continue with database deletion even if S3 deletion fails
-    
     # Delete from database
+    s3_key = image.s3_key
+    renditions = image.renditions
     db.session.delete(image)
     db.session.commit()
     
+    # Delete the image, its thumbnail (if it exists) and renditions from S3
+    try:
+        storage = get_storage()
+        storage.delete_keys(storage.image_keys([s3_key], [renditions]))
+    except Exception as e:
+        current_app.logger.error(f"Failed to delete image from S3: {str(e)}")
+    
     flash('Image deleted successfully.', 'success')
     return redirect(url_for('checkin.view_checkin', checkin_id=checkin.id))
@@ -0,0 +1,67 @@
+# app/cli.py
+import click
+
+
+def register_commands(app):
+    """Register maintenance commands with the Flask CLI"""
+
+    @app.cli.command('invalidate-url-cache')
+    def invalidate_url_cache():
+        """Invalidate every cached file URL (run after changing CloudFront keys)"""
+        from app.services.storage import get_storage
+        get_storage().invalidate_all_urls()
+        click.echo('URL cache invalidated.')
+
+    @app.cli.command('process-images')
+    @click.option('--workers', type=int, default=None, help='Worker processes (default: IMAGE_WORKER_PROCESSES)')
+    @click.option('--once', is_flag=True, help='Exit when the queue is empty instead of polling')
+    def process_images(workers, once):
+        """Resize, thumbnail and upload images queued by check-ins (IMAGE_PROCESSING_MODE=queue)"""
+        from app.services.image_queue import run_worker_pool
+        if workers is None:
+            workers = int(app.config.get('IMAGE_WORKER_PROCESSES', 2))
+        click.echo(f'Processing images with {workers} worker process(es)...')
+        run_worker_pool(workers, once=once)
+
+    @app.cli.command('backfill-image-metadata')
+    @click.option('--concurrency', type=int, default=4, help='Images read from storage in parallel')
+    @click.option('--batch-size', type=int, default=100, help='Images per database batch')
+    @click.option('--limit', type=int, default=None, help='Stop after this many images')
+    def backfill_image_metadata(concurrency, batch_size, limit):
+        """Record dimensions and placeholders of images processed before they were stored"""
+        from app.services.image_backfill import backfill_image_metadata as backfill
+
+        def progress(updated, failed):
+            click.echo(f'{updated} updated, {failed} failed...')
+
+        updated, failed = backfill(concurrency=concurrency, batch_size=batch_size, limit=limit, progress=progress)
+        click.echo(f'Backfilled {updated} image(s); {failed} could not be read.')
+
+    @app.cli.command('reconcile-stats')
+    @click.option('--project', 'project_id', type=int, default=None, help='Only this project ID')
+    def reconcile_stats(project_id):
+        """Recompute project statistics from check-ins and fix drift (run e.g. hourly from cron)"""
+        from app.services.project_stats import reconcile_project_stats
+        fixed = reconcile_project_stats(project_id)
+        click.echo(f"Corrected {fixed['projects']} project stat(s) and {fixed['users']} user stat(s).")
+
+    @app.cli.command('rebuild-stats')
+    @click.option('--project', 'project_id', type=int, default=None, help='Only this project ID')
+    @click.option('--engine', type=click.Choice(['auto', 'numpy', 'python']), default='auto',
+                  help='How streaks are computed (auto: NumPy when installed)')
+    def rebuild_stats(project_id, engine):
+        """Recompute user stats, daily rollups and calendars from the check-ins, then the project stats"""
+        from app.services.streaks import NUMPY_AVAILABLE, rebuild_user_stats
+        from app.services.checkin_calendar import rebuild_calendars
+        from app.services import leaderboard
+        from app.services.project_stats import rebuild_daily_rollups, reconcile_project_stats
+        if engine == 'numpy' and not NUMPY_AVAILABLE:
+            raise click.ClickException('NumPy is not installed (pip install numpy)')
+        use_numpy = {'auto': None, 'numpy': True, 'python': False}[engine]
+        rows = rebuild_user_stats(project_id, use_numpy=use_numpy)
+        days = rebuild_daily_rollups(project_id)
+        calendars = rebuild_calendars(project_id)
+        fixed = reconcile_project_stats(project_id)
+        leaderboard.invalidate(project_id)
+        click.echo(f"Rebuilt {rows} user stat(s), {days} daily rollup(s) and {calendars} calendar(s); "
+                   f"corrected {fixed['projects']} project stat(s).")
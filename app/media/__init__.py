@@ -0,0 +1 @@
+# 空文件，仅用于标识模块
\ No newline at end of file
@@ -0,0 +1,48 @@
+# app/media/routes.py
+import os
+from flask import Blueprint, abort
+from flask_login import login_required, current_user
+from app.models.models import CheckInImage
+from app.services.storage import get_storage
+from app.checkin.routes import can_view_checkin
+
+media = Blueprint('media', __name__)
+
+def find_owning_image(s3_key):
+    """The CheckInImage a stored file belongs to: its original, thumbnail or one of its renditions
+
+    Returns:
+        CheckInImage or None
+    """
+    if s3_key.startswith('thumbnails/'):
+        return CheckInImage.query.filter_by(s3_key=s3_key[len('thumbnails/'):]).first()
+
+    if s3_key.startswith('renditions/'):
+        # renditions/<original key without extension>_<width>w<extension>
+        stem, _, width = os.path.splitext(s3_key[len('renditions/'):])[0].rpartition('_')
+        if not stem or not width.endswith('w'):
+            return None
+        candidates = CheckInImage.query.filter(CheckInImage.s3_key.startswith(stem, autoescape=True))
+        for image in candidates:
+            if any(rendition['key'] == s3_key for rendition in image.renditions or []):
+                return image
+        return None
+
+    return CheckInImage.query.filter_by(s3_key=s3_key).first()
+
+@media.route('/<path:s3_key>')
+@login_required
+def serve_file(s3_key):
+    """Serve an image stored by the local or in-memory storage backend
+
+    The same privacy rules as the image view apply; files the user may not
+    see, or that belong to no image, are a 404 rather than a 403 so keys
+    can't be probed.
+    """
+    image = find_owning_image(s3_key)
+    if image is None:
+        abort(404)
+    checkin = image.check_in
+    if not image.is_public and not can_view_checkin(current_user.id, checkin.user_id, checkin.project_id):
+        abort(404)
+    return get_storage().serve_file(s3_key)
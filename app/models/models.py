@@ -92,10 +92,17 @@ class CheckIn(db.Model):
     note = db.Column(db.Text, nullable=True)
     location = db.Column(db.String(200), nullable=True)  # 可选：位置信息
     
+    __table_args__ = (
+        # 连续打卡重算按用户和项目取有序的打卡日期，走索引不回表
+        db.Index('ix_check_in_user_project_date', 'user_id', 'project_id', 'check_date'),
+    )
+    
     def __repr__(self):
         return f'<CheckIn user_id={self.user_id} project_id={self.project_id} on {self.check_date}>'
 
-    def add_image(self, s3_key, original_filename, content_type, file_size, is_public=False):
+    def add_image(self, s3_key, original_filename, content_type, file_size, is_public=False,
+                  status='ready', staged_path=None, renditions=None, width=None, height=None,
+                  placeholder=None):
         """向当前打卡添加一张图片"""
         # 确定显示顺序
         max_order = 0
@@ -109,7 +116,13 @@ class CheckIn(db.Model):
             content_type=content_type,
             file_size=file_size,
             is_public=is_public,
-            display_order=max_order + 1
+            display_order=max_order + 1,
+            status=status,
+            staged_path=staged_path,
+            renditions=renditions,
+            width=width,
+            height=height,
+            placeholder=placeholder
         )
         db.session.add(image)
         return image
@@ -144,11 +157,56 @@ class UserProjectStat(db.Model):
     
     __table_args__ = (
         db.UniqueConstraint('user_id', 'project_id', name='unique_user_project_stat'),
+        # 活跃用户统计和项目最高连续打卡数按项目走索引，不扫描打卡记录
+        db.Index('ix_user_project_stat_project_last_checkin', 'project_id', 'last_checkin_date'),
+        db.Index('ix_user_project_stat_project_highest_streak', 'project_id', 'highest_streak'),
+        # 排行榜在没有 Redis 时按项目和指标走索引取前几名
+        db.Index('ix_user_project_stat_project_current_streak', 'project_id', 'current_streak'),
+        db.Index('ix_user_project_stat_project_total_checkins', 'project_id', 'total_checkins'),
     )
     
     def __repr__(self):
         return f'<UserProjectStat user_id={self.user_id} project_id={self.project_id}>'
 
+class ProjectDailyRollup(db.Model):
+    """项目每日打卡汇总
+    
+    每次打卡和删除时增量更新，项目统计、图表和近30天活跃用户数只读
+    最多几十行汇总，不扫描打卡记录。可以用 flask rebuild-stats 从打卡记录重建。
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, nullable=False)
+    day = db.Column(db.Date, nullable=False)  # UTC日期
+    checkins = db.Column(db.Integer, nullable=False, default=0)  # 当天打卡次数
+    distinct_users = db.Column(db.Integer, nullable=False, default=0)  # 当天打卡的用户数
+    latest_users = db.Column(db.Integer, nullable=False, default=0)  # 最后一次打卡在当天的用户数，按天求和即活跃用户数
+    
+    __table_args__ = (
+        db.UniqueConstraint('project_id', 'day', name='uq_project_daily_rollup'),
+    )
+    
+    def __repr__(self):
+        return f'<ProjectDailyRollup project_id={self.project_id} day={self.day}>'
+
+class UserCalendar(db.Model):
+    """用户在项目中一年的打卡日历
+    
+    days 是 366 位的位图(46 字节)，第 n 位表示当年第 n+1 天(UTC)有打卡。
+    日历视图和"某天是否打过卡"只读一行，不扫描打卡记录。
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    project_id = db.Column(db.Integer, nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    days = db.Column(db.LargeBinary(46), nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'project_id', 'year', name='uq_user_calendar'),
+    )
+    
+    def __repr__(self):
+        return f'<UserCalendar user_id={self.user_id} project_id={self.project_id} year={self.year}>'
+
 class FriendRelationship(db.Model):
     """用户好友关系模型
     
@@ -290,9 +348,23 @@ class CheckInImage(db.Model):
     upload_time = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     is_public = db.Column(db.Boolean, default=False)  # 是否公开可访问
     display_order = db.Column(db.Integer, default=0)  # 显示顺序
+    # 处理状态: processing(等待后台处理) / ready / failed
+    status = db.Column(db.String(20), nullable=False, default='ready', server_default='ready', index=True)
+    staged_path = db.Column(db.String(255), nullable=True)  # 待处理原图在暂存目录中的文件名
+    claimed_at = db.Column(db.DateTime, nullable=True)  # 后台进程领取任务的时间
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # 已处理次数
+    # 响应式图片版本(srcset): [{"key", "width", "height", "content_type"}, ...]，按宽度从小到大
+    renditions = db.Column(db.JSON, nullable=True)
+    width = db.Column(db.Integer, nullable=True)  # 处理后图片的宽度(像素)，用于预留布局
+    height = db.Column(db.Integer, nullable=True)  # 处理后图片的高度(像素)
+    placeholder = db.Column(db.Text, nullable=True)  # 加载前显示的极小模糊预览图(data: URI)
     
     # 建立与CheckIn表的关系
     check_in = db.relationship('CheckIn', backref=db.backref('images', lazy=True, cascade='all, delete-orphan'))
     
+    def is_ready(self):
+        """图片是否已处理完成并上传"""
+        return self.status == 'ready'
+    
     def __repr__(self):
-        return f'<CheckInImage id={self.id} checkin_id={self.checkin_id}>'
+        return f'<CheckInImage id={self.id} checkin_id={self.checkin_id} status={self.status}>'
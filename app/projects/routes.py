@@ -1,8 +1,11 @@
 # app/projects/routes.py
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
 from flask_login import login_required, current_user
 from app import db
-from app.models.models import Project, ProjectMember, UserProjectStat, User, ProjectInvitation, FriendRelationship, ProjectJoinRequest
+from app.models.models import Project, ProjectMember, UserProjectStat, User, ProjectInvitation, FriendRelationship, ProjectJoinRequest, CheckIn, CheckInImage, ProjectStat, ProjectDailyRollup, UserCalendar
+from app.services.project_stats import active_users, daily_rollups
+from app.services import leaderboard
+from app.services.storage import get_storage
 from app.projects.forms import ProjectForm, ProjectInvitationForm
 from datetime import datetime
 
@@ -145,6 +148,9 @@ def view_project(project_id):
     from app.models.models import ProjectStat
     stats = ProjectStat.query.filter_by(project_id=project_id).first()
     
+    # 活跃用户和近30天图表读每日汇总，不扫描打卡记录
+    daily = daily_rollups(project_id, days=30)
+    
     # 获取用户项目统计
     user_stats = None
     if member:
@@ -159,6 +165,9 @@ def view_project(project_id):
         project=project,
         member=member,
         stats=stats,
+        active_users=active_users(project_id),
+        daily=daily,
+        daily_max=max(day['checkins'] for day in daily),
         user_stats=user_stats
     )
 
@@ -248,9 +257,30 @@ def delete_project(project_id):
         flash('只有项目创建者可以删除项目', 'danger')
         return redirect(url_for('projects.view_project', project_id=project_id))
     
-    # 删除项目
+    # 收集项目下所有打卡图片的存储路径
+    checkin_ids = db.session.query(CheckIn.id).filter(CheckIn.project_id == project_id)
+    image_rows = db.session.query(CheckInImage.s3_key, CheckInImage.renditions).filter(
+        CheckInImage.checkin_id.in_(checkin_ids)
+    ).all()
+    image_keys = [s3_key for s3_key, _ in image_rows]
+    image_renditions = [renditions for _, renditions in image_rows]
+    
+    # 删除项目及其打卡、图片、成员和统计数据
+    CheckInImage.query.filter(CheckInImage.checkin_id.in_(checkin_ids)).delete(synchronize_session=False)
+    for model in (CheckIn, ProjectMember, ProjectStat, UserProjectStat, ProjectDailyRollup, UserCalendar,
+                  ProjectInvitation, ProjectJoinRequest):
+        model.query.filter(model.project_id == project_id).delete(synchronize_session=False)
     db.session.delete(project)
     db.session.commit()
+    leaderboard.invalidate(project_id)
+    
+    # 批量删除 S3 上的原图、缩略图和响应式版本
+    if image_keys:
+        try:
+            storage = get_storage()
+            storage.delete_keys(storage.image_keys(image_keys, image_renditions))
+        except Exception as e:
+            current_app.logger.error(f"Failed to delete project images from S3: {str(e)}")
     
     flash(f'项目 "{project.name}" 已被删除', 'success')
     return redirect(url_for('projects.list_projects'))
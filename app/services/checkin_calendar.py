@@ -0,0 +1,154 @@
+"""
+Check-in calendars: the days a user checked in to a project, as bitmaps
+
+Each UserCalendar row covers one UTC year. Bit n (byte n // 8, bit n % 8)
+is set when the user checked in on day n + 1 of the year, so a whole year
+is 46 bytes read in one fetch. Calendar views and "did they check in on
+day X" become bit tests instead of CheckIn queries.
+
+Rows are created by the first check-in of a year. Calendars of check-ins
+made before this table existed are filled in by rebuild_calendars()
+(flask rebuild-stats); until then a missing row means "unknown", not "no
+check-ins".
+"""
+import base64
+from datetime import date, timedelta
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.models import CheckIn, UserCalendar
+
+# 366 bits
+CALENDAR_BYTES = 46
+
+# Calendars inserted per statement by rebuild_calendars()
+CALENDAR_BATCH_SIZE = 1000
+
+
+def day_index(day):
+    """Bit number of a date within its year"""
+    return day.timetuple().tm_yday - 1
+
+
+def is_set(bitmap, day):
+    """Whether the bit of day is set in a year's bitmap"""
+    index = day_index(day)
+    return bool(bitmap[index // 8] & (1 << (index % 8)))
+
+
+def bitmap_dates(bitmap, year):
+    """The dates whose bit is set in a year's bitmap, in order"""
+    first = date(year, 1, 1)
+    dates = []
+    for byte_index, byte in enumerate(bitmap):
+        while byte:
+            bit = (byte & -byte).bit_length() - 1
+            dates.append(first + timedelta(days=byte_index * 8 + bit))
+            byte &= byte - 1
+    return dates
+
+
+def mark_day(user_id, project_id, day, checked_in=True):
+    """Set (or clear) a day in the user's calendar
+
+    The row is locked for the read-modify-write. Clearing a day of a year
+    without a calendar is a no-op.
+
+    Args:
+        user_id: User ID
+        project_id: Project ID
+        day: UTC date
+        checked_in: Set the bit if True, clear it if False
+    """
+    rows = UserCalendar.query.filter_by(user_id=user_id, project_id=project_id, year=day.year)
+    calendar = rows.with_for_update().first()
+    if calendar is None:
+        if not checked_in:
+            return
+        try:
+            with db.session.begin_nested():
+                calendar = UserCalendar(user_id=user_id, project_id=project_id, year=day.year,
+                                        days=bytes(CALENDAR_BYTES))
+                db.session.add(calendar)
+        except IntegrityError:
+            # A concurrent check-in created the row first
+            calendar = rows.with_for_update().one()
+
+    bits = bytearray(calendar.days)
+    index = day_index(day)
+    if checked_in:
+        bits[index // 8] |= 1 << (index % 8)
+    else:
+        bits[index // 8] &= ~(1 << (index % 8)) & 0xFF
+    calendar.days = bytes(bits)
+
+
+def year_bitmap(user_id, project_id, year):
+    """A year's bitmap, or None if the user has no calendar for that year"""
+    return db.session.query(UserCalendar.days).filter_by(
+        user_id=user_id, project_id=project_id, year=year
+    ).scalar()
+
+
+def checked_in_on(user_id, project_id, days):
+    """Whether the user checked in on any of the given UTC dates
+
+    Returns:
+        bool or None: None if a calendar is missing and the answer is unknown
+    """
+    for year in sorted({day.year for day in days}):
+        bitmap = year_bitmap(user_id, project_id, year)
+        if bitmap is None:
+            return None
+        if any(is_set(bitmap, day) for day in days if day.year == year):
+            return True
+    return False
+
+
+def heatmap(user_id, project_id, year):
+    """A year of calendar data for the heatmap endpoint, from one row
+
+    Returns:
+        dict: year, the check-in dates, their count and the raw base64 bitmap
+    """
+    bitmap = year_bitmap(user_id, project_id, year) or bytes(CALENDAR_BYTES)
+    dates = bitmap_dates(bitmap, year)
+    return {
+        'year': year,
+        'days': [day.isoformat() for day in dates],
+        'total_days': len(dates),
+        'bitmap': base64.b64encode(bitmap).decode('ascii')
+    }
+
+
+def rebuild_calendars(project_id=None, commit=True):
+    """Rebuild every UserCalendar from the check-ins in one scan
+
+    Args:
+        project_id: Only this project, None for all
+        commit: Commit the rebuilt rows
+
+    Returns:
+        int: Number of calendar rows written
+    """
+    days = db.session.query(CheckIn.user_id, CheckIn.project_id, CheckIn.check_date).distinct()
+    existing = UserCalendar.query
+    if project_id is not None:
+        days = days.filter(CheckIn.project_id == project_id)
+        existing = existing.filter_by(project_id=project_id)
+
+    calendars = {}
+    for user_id, pid, check_date in days.yield_per(10000):
+        bits = calendars.setdefault((user_id, pid, check_date.year), bytearray(CALENDAR_BYTES))
+        index = day_index(check_date)
+        bits[index // 8] |= 1 << (index % 8)
+
+    existing.delete(synchronize_session=False)
+    mappings = [
+        {'user_id': user_id, 'project_id': pid, 'year': year, 'days': bytes(bits)}
+        for (user_id, pid, year), bits in calendars.items()
+    ]
+    for start in range(0, len(mappings), CALENDAR_BATCH_SIZE):
+        db.session.bulk_insert_mappings(UserCalendar, mappings[start:start + CALENDAR_BATCH_SIZE])
+    if commit:
+        db.session.commit()
+    return len(mappings)
@@ -0,0 +1,128 @@
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is skipped because the circuit is open"""
+
+
+class CircuitBreaker:
+    """Circuit breaker for a flaky dependency such as Redis
+
+    States:
+    - closed: calls go through; consecutive failures are counted
+    - open: calls are rejected immediately without touching the dependency.
+      A background thread probes the dependency with exponential backoff
+      and closes the circuit once a probe succeeds.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+
+    def __init__(self, name, probe, failure_threshold=3, probe_interval=1.0, max_probe_interval=30.0):
+        """
+        Args:
+            name: Name used in logs and metrics
+            probe: Callable that raises if the dependency is still down
+            failure_threshold: Consecutive failures before the circuit opens
+            probe_interval: Initial delay between probes (seconds)
+            max_probe_interval: Upper bound for the probe backoff (seconds)
+        """
+        self.name = name
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.max_probe_interval = max_probe_interval
+
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.total_failures = 0
+        self.rejected_calls = 0
+        self.trips = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """Whether calls should be attempted right now; rejections are counted"""
+        if self.state == self.CLOSED:
+            return True
+        self.rejected_calls += 1
+        return False
+
+    def call(self, fn, *args, **kwargs):
+        """Call fn through the breaker
+
+        Raises:
+            CircuitOpenError: if the circuit is open
+        """
+        if not self.allow_request():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+
+        self.record_success()
+        return result
+
+    def record_success(self):
+        self.consecutive_failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self.total_failures += 1
+            if self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold:
+                self._open()
+
+    def trip(self):
+        """Open the circuit right away, e.g. when the initial connection fails"""
+        with self._lock:
+            self.consecutive_failures += 1
+            self.total_failures += 1
+            if self.state == self.CLOSED:
+                self._open()
+
+    def metrics(self):
+        """Current breaker state for the metrics endpoint"""
+        return {
+            'state': self.state,
+            'consecutive_failures': self.consecutive_failures,
+            'total_failures': self.total_failures,
+            'rejected_calls': self.rejected_calls,
+            'trips': self.trips,
+            'open_for_seconds': round(time.monotonic() - self.opened_at, 1) if self.opened_at else 0
+        }
+
+    def _open(self):
+        # Caller holds self._lock
+        self.state = self.OPEN
+        self.trips += 1
+        self.opened_at = time.monotonic()
+        logger.warning(f"{self.name} circuit opened after {self.consecutive_failures} consecutive failures")
+
+        thread = threading.Thread(target=self._probe_until_healthy, name=f"{self.name}-probe", daemon=True)
+        thread.start()
+
+    def _probe_until_healthy(self):
+        interval = self.probe_interval
+        while True:
+            time.sleep(interval)
+            try:
+                self.probe()
+            except Exception as e:
+                interval = min(interval * 2, self.max_probe_interval)
+                logger.info(f"{self.name} probe failed ({e}), next probe in {interval:.0f}s")
+                continue
+
+            with self._lock:
+                self.state = self.CLOSED
+                self.consecutive_failures = 0
+                self.opened_at = None
+            logger.warning(f"{self.name} circuit closed, dependency is healthy again")
+            return
@@ -0,0 +1,83 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy import or_
+from app import db
+from app.models.models import CheckInImage
+from app.services.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+
+def missing_metadata_filter():
+    """Processed images stored before dimensions and placeholders were recorded"""
+    return (
+        CheckInImage.status == 'ready',
+        or_(CheckInImage.width.is_(None), CheckInImage.height.is_(None), CheckInImage.placeholder.is_(None))
+    )
+
+
+def read_image_metadata(s3_key):
+    """Read a stored image back and compute its dimensions and placeholder
+
+    Returns:
+        dict: width, height and placeholder, or None if the file is missing or unreadable
+    """
+    from app.utils.image_utils import image_metadata
+
+    try:
+        with get_storage().open_file(s3_key) as f:
+            return image_metadata(f)
+    except Exception as e:
+        logger.warning(f"Could not read {s3_key}: {e}")
+        return None
+
+
+def backfill_image_metadata(concurrency=4, batch_size=100, limit=None, progress=None):
+    """Fill in width, height and placeholder of older images
+
+    Images are read from storage in batches of batch_size, at most
+    concurrency at a time, so memory use stays bounded however many images
+    there are. Each batch is committed before the next one is read, so an
+    interrupted run resumes where it stopped. Images that can't be read
+    keep their empty fields and are reported as failed.
+
+    Args:
+        concurrency: Images downloaded and decoded in parallel
+        batch_size: Images per query and commit
+        limit: Stop after this many images, None for all
+        progress: Optional callable(updated, failed) called after each batch
+
+    Returns:
+        tuple: (updated, failed) image counts
+    """
+    app = current_app._get_current_object()
+
+    def read(s3_key):
+        with app.app_context():
+            return read_image_metadata(s3_key)
+
+    updated = failed = 0
+    last_id = 0
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='backfill') as executor:
+        while limit is None or updated + failed < limit:
+            size = batch_size if limit is None else min(batch_size, limit - updated - failed)
+            batch = db.session.query(CheckInImage.id, CheckInImage.s3_key).filter(
+                CheckInImage.id > last_id, *missing_metadata_filter()
+            ).order_by(CheckInImage.id).limit(size).all()
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            for (image_id, s3_key), metadata in zip(batch, executor.map(read, [row.s3_key for row in batch])):
+                if metadata is None:
+                    failed += 1
+                    continue
+                CheckInImage.query.filter_by(id=image_id).update(metadata, synchronize_session=False)
+                updated += 1
+            db.session.commit()
+
+            if progress is not None:
+                progress(updated, failed)
+
+    return updated, failed
@@ -0,0 +1,279 @@
+import os
+import time
+import uuid
+import shutil
+import logging
+import multiprocessing
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_
+from PIL import Image
+from io import BytesIO
+from app import db
+from app.models.models import CheckInImage
+from app.services.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+
+def get_staging_dir():
+    """Directory holding raw uploads until a worker processes them
+
+    Web and worker processes must see the same directory (same host or a
+    shared volume).
+    """
+    path = current_app.config.get('IMAGE_STAGING_PATH') or os.path.join(current_app.instance_path, 'staging')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def looks_like_image(image_data):
+    """Cheap validity check for the request path: parse the header without decoding pixels
+
+    Images above MAX_IMAGE_PIXELS (decompression bombs) are rejected here
+    already, before they are staged.
+
+    Args:
+        image_data: Raw image data (bytes or a seekable file)
+    """
+    max_pixels = current_app.config.get('MAX_IMAGE_PIXELS')
+    try:
+        if hasattr(image_data, 'read'):
+            image_data.seek(0)
+        else:
+            image_data = BytesIO(image_data)
+        img = Image.open(image_data)
+        width, height = img.size
+        return bool(img.format) and width > 0 and height > 0 and not (max_pixels and width * height > max_pixels)
+    except Exception:
+        return False
+
+
+def stage_upload(image_data):
+    """Save a raw upload to the staging directory
+
+    Args:
+        image_data: Raw image data (bytes or a file, copied in chunks)
+
+    Returns:
+        str: Staged file name, stored on the CheckInImage row
+    """
+    staging_dir = get_staging_dir()
+    name = uuid.uuid4().hex
+    tmp_path = os.path.join(staging_dir, f"{name}.tmp")
+    with open(tmp_path, 'wb') as f:
+        if hasattr(image_data, 'read'):
+            image_data.seek(0)
+            shutil.copyfileobj(image_data, f)
+        else:
+            f.write(image_data)
+    os.replace(tmp_path, os.path.join(staging_dir, name))
+    return name
+
+
+def queue_depth():
+    """Number of images waiting for or being processed"""
+    return CheckInImage.query.filter_by(status='processing').count()
+
+
+def has_capacity(count):
+    """Whether count more images fit in the queue (IMAGE_QUEUE_MAX_DEPTH)
+
+    When workers fall behind, new uploads are rejected instead of letting the
+    backlog and the staging directory grow without bound.
+    """
+    max_depth = int(current_app.config.get('IMAGE_QUEUE_MAX_DEPTH', 500))
+    return queue_depth() + count <= max_depth
+
+
+def claim_next_image():
+    """Atomically claim the oldest unclaimed image
+
+    Claims expire after IMAGE_WORKER_LEASE seconds, so images held by a
+    crashed worker are picked up again.
+
+    Returns:
+        CheckInImage or None if the queue is empty
+    """
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=int(current_app.config.get('IMAGE_WORKER_LEASE', 300)))
+    claimable = (
+        CheckInImage.status == 'processing',
+        or_(CheckInImage.claimed_at.is_(None), CheckInImage.claimed_at < stale_before)
+    )
+
+    candidates = db.session.query(CheckInImage.id).filter(*claimable).order_by(CheckInImage.id).limit(10).all()
+    for (image_id,) in candidates:
+        # Compare-and-set: only one worker's update matches the row
+        claimed = CheckInImage.query.filter(CheckInImage.id == image_id, *claimable).update(
+            {'claimed_at': now, 'attempts': CheckInImage.attempts + 1},
+            synchronize_session=False
+        )
+        db.session.commit()
+        if claimed:
+            return db.session.get(CheckInImage, image_id)
+    return None
+
+
+def process_claimed_image(image):
+    """Resize, thumbnail and upload a claimed image, then mark it ready
+
+    Returns:
+        bool: Whether the image is ready
+    """
+    from app.utils.image_utils import prepare_image, rendition_config, get_image_encoder
+
+    staged_path = os.path.join(get_staging_dir(), image.staged_path or '')
+    storage = get_storage()
+    try:
+        with open(staged_path, 'rb') as f:
+            image_data = f.read()
+
+        prepared = prepare_image(
+            image_data,
+            renditions=rendition_config(),
+            rendition_quality=current_app.config.get('IMAGE_RENDITION_QUALITY', 80),
+            encoder=get_image_encoder()
+        )
+        if prepared is None:
+            raise ValueError('not a valid image')
+
+        uploads, renditions = storage.image_uploads(image.s3_key, prepared)
+        failed = [result for result in storage.upload_many(uploads) if not result['success']]
+        if failed:
+            raise IOError(f"upload failed: {failed[0]['error']}")
+    except Exception as e:
+        _record_failure(image, staged_path, e)
+        return False
+
+    # The image may have been deleted while it was being processed
+    updated = CheckInImage.query.filter_by(id=image.id, status='processing').update({
+        'status': 'ready',
+        'content_type': prepared['content_type'],
+        'file_size': len(prepared['data']),
+        'renditions': renditions,
+        'width': prepared['width'],
+        'height': prepared['height'],
+        'placeholder': prepared['placeholder'],
+        'staged_path': None,
+        'claimed_at': None
+    }, synchronize_session=False)
+    db.session.commit()
+
+    if not updated:
+        storage.delete_keys([key for _, key, _ in uploads])
+    _remove_staged(staged_path)
+    current_app.logger.info(f"Processed image {image.id} ({image.s3_key})")
+    return bool(updated)
+
+
+def _record_failure(image, staged_path, error):
+    """Release the claim for a retry, or mark the image failed after IMAGE_MAX_ATTEMPTS"""
+    max_attempts = int(current_app.config.get('IMAGE_MAX_ATTEMPTS', 3))
+    permanent = isinstance(error, (FileNotFoundError, ValueError)) or image.attempts >= max_attempts
+
+    if permanent:
+        current_app.logger.error(f"Image {image.id} failed after {image.attempts} attempt(s): {error}")
+        CheckInImage.query.filter_by(id=image.id, status='processing').update(
+            {'status': 'failed', 'staged_path': None, 'claimed_at': None},
+            synchronize_session=False
+        )
+        db.session.commit()
+        _remove_staged(staged_path)
+    else:
+        current_app.logger.warning(f"Image {image.id} attempt {image.attempts} failed, will retry: {error}")
+        CheckInImage.query.filter_by(id=image.id, status='processing').update(
+            {'claimed_at': None},
+            synchronize_session=False
+        )
+        db.session.commit()
+
+
+def _remove_staged(staged_path):
+    try:
+        os.remove(staged_path)
+    except FileNotFoundError:
+        pass
+
+
+def sweep_staging():
+    """Delete staged uploads older than IMAGE_STAGING_MAX_AGE (e.g. of deleted check-ins)"""
+    max_age = int(current_app.config.get('IMAGE_STAGING_MAX_AGE', 7 * 24 * 60 * 60))
+    cutoff = time.time() - max_age
+    removed = 0
+    with os.scandir(get_staging_dir()) as entries:
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+    if removed:
+        current_app.logger.info(f"Removed {removed} stale staged uploads")
+    return removed
+
+
+def run_worker(once=False):
+    """Process queued images until interrupted
+
+    Args:
+        once: Return when the queue is empty instead of polling
+
+    Returns:
+        int: Number of images processed
+    """
+    poll_interval = float(current_app.config.get('IMAGE_WORKER_POLL_INTERVAL', 1.0))
+    processed = 0
+    last_sweep = None
+
+    while True:
+        if last_sweep is None or time.monotonic() - last_sweep > 3600:
+            sweep_staging()
+            last_sweep = time.monotonic()
+
+        image = claim_next_image()
+        if image is None:
+            if once:
+                return processed
+            time.sleep(poll_interval)
+            continue
+
+        process_claimed_image(image)
+        processed += 1
+
+
+def _worker_main(once):
+    """Entry point of a spawned worker process"""
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        run_worker(once)
+
+
+def run_worker_pool(processes, once=False):
+    """Run image workers in separate processes
+
+    Processes are spawned rather than forked so that none of them inherits
+    the parent's database, Redis or S3 connections.
+    """
+    if processes <= 1:
+        return run_worker(once)
+
+    context = multiprocessing.get_context('spawn')
+    workers = [
+        context.Process(target=_worker_main, args=(once,), name=f"image-worker-{index}")
+        for index in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
@@ -0,0 +1,236 @@
+"""
+Per-project leaderboards by current streak, highest streak and check-ins
+
+Scores live in Redis sorted sets, one per project and metric
+(leaderboard:<project>:<metric>, member = user ID), kept current by the
+check-in and delete routes once their changes are committed. A project's
+sets are built from UserProjectStat the first time they are read and
+rebuilt every LEADERBOARD_REDIS_TTL seconds, which also drops any drift
+from writes missed while Redis was unreachable. Only one request builds a
+project's sets at a time (a SET NX lock); reads that arrive during the
+build use the database.
+
+Without Redis, or while its circuit breaker is open, the same leaderboard
+is read from UserProjectStat through its (project_id, metric) indexes.
+
+Either way a leaderboard only ranks the users the viewer may see, by the
+rules of the check-in history: themselves and their friends in the
+project. A current streak counts only while it is alive, i.e. the last
+check-in was today or yesterday (UTC).
+"""
+import logging
+from datetime import datetime, timedelta
+import pytz
+from flask import current_app
+from app import db
+from app.models.models import User, UserProjectStat
+from app.services.redis_client import get_redis_breaker, get_redis_client
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('current_streak', 'highest_streak', 'total_checkins')
+
+# Extra sorted set holding each user's last check-in date (as an ordinal),
+# to tell live current streaks from broken ones
+LAST_CHECKIN = 'last_checkin'
+
+# How long a build may hold its lock before another request can take over
+BUILD_LOCK_SECONDS = 30
+
+
+def _keys(project_id):
+    return {name: f"leaderboard:{project_id}:{name}" for name in METRICS + (LAST_CHECKIN,)}
+
+
+def _ready_key(project_id):
+    return f"leaderboard:{project_id}:ready"
+
+
+def _build_lock_key(project_id):
+    return f"leaderboard:{project_id}:building"
+
+
+def _redis():
+    """The Redis client and breaker, or (None, None) if Redis is unconfigured or its circuit is open"""
+    client = get_redis_client()
+    if client is None:
+        return None, None
+    breaker = get_redis_breaker()
+    if not breaker.allow_request():
+        return None, None
+    return client, breaker
+
+
+def record_scores(project_id, user_id, last_checkin_date, scores):
+    """Write a user's changed stats to the project's sorted sets
+
+    Call after the stats are committed, so rolled-back writes never reach
+    the rankings. Scores are absolute values read back from the database,
+    so a rebuild running at the same time can't count a change twice.
+
+    Args:
+        project_id: Project ID
+        user_id: User ID
+        last_checkin_date: The user's last check-in date (UTC), None if they have none left
+        scores: {metric: value} to set
+    """
+    client, breaker = _redis()
+    if client is None:
+        return
+
+    keys = _keys(project_id)
+    pipe = client.pipeline(transaction=False)
+    for metric, value in scores.items():
+        pipe.zadd(keys[metric], {user_id: value})
+    if last_checkin_date is None:
+        pipe.zrem(keys[LAST_CHECKIN], user_id)
+    else:
+        pipe.zadd(keys[LAST_CHECKIN], {user_id: last_checkin_date.toordinal()})
+    try:
+        breaker.call(pipe.execute)
+    except Exception as e:
+        # The next rebuild corrects the sets
+        logger.error(f"Failed to update leaderboard of project {project_id}: {e}")
+
+
+def invalidate(project_id=None):
+    """Drop the sorted sets of a project (or of all projects) so the next read rebuilds them
+
+    Used after stats were rewritten outside the incremental path, e.g. by
+    flask rebuild-stats, and when a project is deleted.
+    """
+    client, breaker = _redis()
+    if client is None:
+        return
+    try:
+        if project_id is not None:
+            breaker.call(client.delete, _ready_key(project_id), *_keys(project_id).values())
+        else:
+            for key in breaker.call(lambda: list(client.scan_iter(match='leaderboard:*:ready', count=1000))):
+                breaker.call(client.delete, key)
+    except Exception as e:
+        logger.error(f"Failed to invalidate leaderboards: {e}")
+
+
+def _build(client, breaker, project_id):
+    """Load a project's stats into its sorted sets, replacing what was there"""
+    rows = db.session.query(
+        UserProjectStat.user_id,
+        UserProjectStat.current_streak,
+        UserProjectStat.highest_streak,
+        UserProjectStat.total_checkins,
+        UserProjectStat.last_checkin_date
+    ).filter(UserProjectStat.project_id == project_id)
+
+    mappings = {name: {} for name in METRICS + (LAST_CHECKIN,)}
+    for user_id, current_streak, highest_streak, total_checkins, last_checkin_date in rows:
+        mappings['current_streak'][user_id] = current_streak or 0
+        mappings['highest_streak'][user_id] = highest_streak or 0
+        mappings['total_checkins'][user_id] = total_checkins or 0
+        if last_checkin_date is not None:
+            mappings[LAST_CHECKIN][user_id] = last_checkin_date.toordinal()
+
+    ttl = int(current_app.config.get('LEADERBOARD_REDIS_TTL', 3600))
+    keys = _keys(project_id)
+    pipe = client.pipeline(transaction=True)
+    pipe.delete(*keys.values())
+    for name, mapping in mappings.items():
+        if mapping:
+            pipe.zadd(keys[name], mapping)
+            pipe.expire(keys[name], ttl)
+    pipe.set(_ready_key(project_id), 1, ex=ttl)
+    pipe.delete(_build_lock_key(project_id))
+    breaker.call(pipe.execute)
+
+
+def _redis_scores(project_id, user_ids, metric):
+    """{user_id: (score, last check-in ordinal)} from Redis, or None to fall back to the database"""
+    client, breaker = _redis()
+    if client is None:
+        return None
+
+    keys = _keys(project_id)
+    try:
+        if not breaker.call(client.exists, _ready_key(project_id)):
+            # One request rebuilds an expired leaderboard, the others read the database meanwhile
+            if not breaker.call(client.set, _build_lock_key(project_id), 1, nx=True, ex=BUILD_LOCK_SECONDS):
+                return None
+            _build(client, breaker, project_id)
+        pipe = client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.zscore(keys[metric], user_id)
+            pipe.zscore(keys[LAST_CHECKIN], user_id)
+        results = breaker.call(pipe.execute)
+    except Exception as e:
+        logger.error(f"Leaderboard of project {project_id} unavailable in Redis, using the database: {e}")
+        return None
+
+    return {
+        user_id: (int(score), int(last_day) if last_day is not None else None)
+        for user_id, score, last_day in zip(user_ids, results[::2], results[1::2])
+        if score is not None
+    }
+
+
+def _ranked_from_redis(project_id, user_ids, metric, limit, live_since):
+    scores = _redis_scores(project_id, user_ids, metric)
+    if scores is None:
+        return None
+    ranked = [
+        (user_id, score) for user_id, (score, last_day) in scores.items()
+        if score > 0 and (metric != 'current_streak' or (last_day or 0) >= live_since.toordinal())
+    ]
+    ranked.sort(key=lambda entry: (-entry[1], entry[0]))
+    return ranked[:limit]
+
+
+def _ranked_from_database(project_id, user_ids, metric, limit, live_since):
+    column = getattr(UserProjectStat, metric)
+    query = db.session.query(UserProjectStat.user_id, column).filter(
+        UserProjectStat.project_id == project_id,
+        UserProjectStat.user_id.in_(user_ids),
+        column > 0
+    )
+    if metric == 'current_streak':
+        query = query.filter(UserProjectStat.last_checkin_date >= live_since)
+    return query.order_by(column.desc(), UserProjectStat.user_id).limit(limit).all()
+
+
+def leaderboard(project_id, visible_user_ids, metric='current_streak', limit=None, today=None):
+    """Top users of a project by one metric, among the users the viewer may see
+
+    Args:
+        project_id: Project ID
+        visible_user_ids: The viewer and the friends they may see in this project
+        metric: One of METRICS
+        limit: Number of entries, defaults to LEADERBOARD_SIZE
+        today: UTC date current streaks must reach back to yesterday of
+
+    Returns:
+        dict: metric, source ('redis' or 'database') and the entries
+            ({'rank', 'user_id', 'username', 'score'}), best first
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown leaderboard metric: {metric}")
+    limit = limit or int(current_app.config.get('LEADERBOARD_SIZE', 10))
+    today = today or datetime.now(pytz.UTC).date()
+    live_since = today - timedelta(days=1)
+    user_ids = sorted(set(visible_user_ids))
+
+    source = 'redis'
+    ranked = _ranked_from_redis(project_id, user_ids, metric, limit, live_since)
+    if ranked is None:
+        source = 'database'
+        ranked = _ranked_from_database(project_id, user_ids, metric, limit, live_since)
+
+    usernames = dict(db.session.query(User.id, User.username).filter(
+        User.id.in_([user_id for user_id, _ in ranked])
+    )) if ranked else {}
+    return {
+        'metric': metric,
+        'source': source,
+        'entries': [
+            {'rank': index + 1, 'user_id': user_id, 'username': usernames.get(user_id), 'score': score}
+            for index, (user_id, score) in enumerate(ranked)
+        ]
+    }
@@ -0,0 +1,159 @@
+import os
+import io
+import uuid
+import hashlib
+import mimetypes
+import threading
+import time
+from flask import current_app, url_for, send_file, abort
+from werkzeug.security import safe_join
+from app.services.storage_backend import StorageBackend
+
+# Suffix of the sidecar file recording a content type the file extension doesn't imply
+CONTENT_TYPE_SUFFIX = '.content-type'
+
+# The media route checks who is asking, so unlike the signed S3/CloudFront
+# objects these responses must stay out of shared caches
+MEDIA_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+
+
+class LocalStorageBackend(StorageBackend):
+    """
+    Stores images on the local filesystem and serves them through the media route
+
+    Meant for single-node installs and for load-testing the upload and render
+    pipeline without AWS. Files are served with send_file, which supports
+    conditional and range requests and hands the open file to the WSGI
+    server's file wrapper (zero-copy sendfile under gunicorn), or to the
+    front-end proxy when USE_X_SENDFILE is enabled.
+    """
+
+    def __init__(self, root=None):
+        """
+        Args:
+            root: Storage directory, defaults to LOCAL_STORAGE_PATH or instance/uploads
+        """
+        root = root or current_app.config.get('LOCAL_STORAGE_PATH') or os.path.join(current_app.instance_path, 'uploads')
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+        current_app.logger.info(f"Local storage configured: {self.root}")
+
+    def _path(self, s3_key):
+        """Absolute path of a key, refusing keys that escape the storage root"""
+        path = safe_join(self.root, s3_key)
+        if path is None:
+            raise ValueError(f"Invalid storage key: {s3_key}")
+        return path
+
+    def upload_file(self, file_data, s3_key, content_type):
+        path = self._path(s3_key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file first so readers never see a partial image
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(file_data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            current_app.logger.error(f"Error writing {s3_key} to local storage: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        # Processed images may not match the original extension (e.g. HEIC -> JPEG)
+        if mimetypes.guess_type(path)[0] != content_type:
+            with open(path + CONTENT_TYPE_SUFFIX, 'w') as f:
+                f.write(content_type)
+
+        return s3_key, len(file_data)
+
+    def open_file(self, s3_key):
+        return open(self._path(s3_key), 'rb')
+
+    def get_file_url(self, s3_key, expires=None):
+        # Local URLs are not signed; the media route requires a login instead
+        return url_for('media.serve_file', s3_key=s3_key)
+
+    def serve_file(self, s3_key):
+        try:
+            path = self._path(s3_key)
+        except ValueError:
+            abort(404)
+        if not os.path.isfile(path):
+            abort(404)
+
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        try:
+            with open(path + CONTENT_TYPE_SUFFIX) as f:
+                mimetype = f.read().strip()
+        except FileNotFoundError:
+            pass
+
+        response = send_file(path, mimetype=mimetype, conditional=True)
+        response.headers['Cache-Control'] = MEDIA_CACHE_CONTROL
+        return response
+
+    def delete_file(self, s3_key):
+        try:
+            path = self._path(s3_key)
+            for file_path in (path, path + CONTENT_TYPE_SUFFIX):
+                try:
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    pass
+            return True
+        except (OSError, ValueError) as e:
+            current_app.logger.error(f"Error deleting {s3_key} from local storage: {e}")
+            return False
+
+
+class MemoryStorageBackend(StorageBackend):
+    """
+    Keeps images in a dict for tests and benchmarks
+
+    Contents live only as long as the worker process.
+    """
+
+    def __init__(self):
+        # s3_key -> (data, content_type, etag, uploaded_at)
+        self.files = {}
+        self._lock = threading.Lock()
+
+    def upload_file(self, file_data, s3_key, content_type):
+        etag = hashlib.md5(file_data).hexdigest()
+        with self._lock:
+            self.files[s3_key] = (bytes(file_data), content_type, etag, time.time())
+        return s3_key, len(file_data)
+
+    def open_file(self, s3_key):
+        with self._lock:
+            entry = self.files.get(s3_key)
+        if entry is None:
+            raise FileNotFoundError(s3_key)
+        return io.BytesIO(entry[0])
+
+    def get_file_url(self, s3_key, expires=None):
+        return url_for('media.serve_file', s3_key=s3_key)
+
+    def serve_file(self, s3_key):
+        with self._lock:
+            entry = self.files.get(s3_key)
+        if entry is None:
+            abort(404)
+
+        data, content_type, etag, uploaded_at = entry
+        response = send_file(
+            io.BytesIO(data),
+            mimetype=content_type,
+            conditional=True,
+            etag=etag,
+            last_modified=uploaded_at
+        )
+        response.headers['Cache-Control'] = MEDIA_CACHE_CONTROL
+        return response
+
+    def delete_file(self, s3_key):
+        with self._lock:
+            self.files.pop(s3_key, None)
+        return True
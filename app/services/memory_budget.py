@@ -0,0 +1,154 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from flask import current_app
+from app.services.metrics import register_metric
+
+logger = logging.getLogger(__name__)
+
+# Process-wide budget for decoded image pixels
+_decode_budget = None
+_decode_budget_pid = None
+_decode_budget_lock = threading.Lock()
+
+
+class MemoryBudgetExceeded(Exception):
+    """Raised when a reservation could not be made within the wait timeout"""
+
+
+class MemoryBudget:
+    """Weighted semaphore over a number of bytes
+
+    Callers reserve the memory they are about to allocate and release it
+    when done. Reservations that don't fit wait in FIFO order, so a large
+    image is not starved by a stream of small ones. A waiter that can't be
+    served within the timeout gets MemoryBudgetExceeded.
+
+    A single reservation larger than the whole budget is clamped to it: it
+    runs alone instead of never.
+    """
+
+    def __init__(self, name, capacity, timeout=10.0):
+        """
+        Args:
+            name: Name used in logs and metrics
+            capacity: Budget in bytes
+            timeout: Default seconds to wait for a reservation, 0 to fail fast
+        """
+        self.name = name
+        self.capacity = capacity
+        self.timeout = timeout
+
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.reservations = 0
+        self.waits = 0
+        self.rejections = 0
+        self._waiters = deque()
+        self._condition = threading.Condition()
+
+    def acquire(self, weight, timeout=None):
+        """Reserve weight bytes, waiting up to timeout seconds
+
+        Returns:
+            int: The reserved weight (clamped to the capacity), pass it to release()
+
+        Raises:
+            MemoryBudgetExceeded: if the reservation didn't fit in time
+        """
+        weight = min(max(0, int(weight)), self.capacity)
+        timeout = self.timeout if timeout is None else timeout
+
+        with self._condition:
+            if not self._waiters and self.in_use + weight <= self.capacity:
+                self._reserve(weight)
+                return weight
+
+            if timeout <= 0:
+                self.rejections += 1
+                raise MemoryBudgetExceeded(f"{self.name}: {weight} bytes don't fit ({self.in_use}/{self.capacity} in use)")
+
+            ticket = object()
+            self._waiters.append(ticket)
+            self.waits += 1
+            deadline = time.monotonic() + timeout
+            try:
+                while self._waiters[0] is not ticket or self.in_use + weight > self.capacity:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejections += 1
+                        raise MemoryBudgetExceeded(
+                            f"{self.name}: waited {timeout}s for {weight} bytes ({self.in_use}/{self.capacity} in use)"
+                        )
+                    self._condition.wait(remaining)
+                self._reserve(weight)
+                return weight
+            finally:
+                self._waiters.remove(ticket)
+                # The next waiter in line may fit now
+                self._condition.notify_all()
+
+    def release(self, weight):
+        """Return a reservation made by acquire()"""
+        with self._condition:
+            self.in_use -= weight
+            self._condition.notify_all()
+
+    @contextmanager
+    def reserve(self, weight, timeout=None):
+        """Hold a reservation for the duration of a with block"""
+        weight = self.acquire(weight, timeout)
+        try:
+            yield
+        finally:
+            self.release(weight)
+
+    def metrics(self):
+        """Current usage for the metrics endpoint"""
+        return {
+            'capacity_bytes': self.capacity,
+            'in_use_bytes': self.in_use,
+            'peak_in_use_bytes': self.peak_in_use,
+            'waiting': len(self._waiters),
+            'reservations': self.reservations,
+            'waits': self.waits,
+            'rejections': self.rejections
+        }
+
+    def _reserve(self, weight):
+        # Caller holds self._condition
+        self.in_use += weight
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+        self.reservations += 1
+
+
+def get_decode_budget():
+    """Get the process-wide budget for decoded image memory
+
+    Sized by IMAGE_DECODE_MEMORY_BUDGET (bytes); decodes wait up to
+    IMAGE_DECODE_WAIT_TIMEOUT seconds for room. Reported by /metrics as
+    image_decode_memory.
+
+    Returns:
+        MemoryBudget
+    """
+    global _decode_budget, _decode_budget_pid
+
+    pid = os.getpid()
+    if _decode_budget_pid == pid:
+        return _decode_budget
+
+    with _decode_budget_lock:
+        if _decode_budget_pid != pid:
+            budget = MemoryBudget(
+                'image_decode',
+                capacity=int(current_app.config.get('IMAGE_DECODE_MEMORY_BUDGET', 512 * 1024 * 1024)),
+                timeout=float(current_app.config.get('IMAGE_DECODE_WAIT_TIMEOUT', 10))
+            )
+            register_metric('image_decode_memory', budget.metrics)
+            _decode_budget = budget
+            _decode_budget_pid = pid
+        return _decode_budget
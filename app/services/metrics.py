@@ -0,0 +1,33 @@
+import threading
+
+# Metric name -> callable returning a JSON-serialisable value
+_metric_sources = {}
+_metric_sources_lock = threading.Lock()
+
+
+def register_metric(name, source):
+    """Register a callable whose value is reported by the /metrics endpoint
+
+    Registering the same name again replaces the previous source, so
+    components rebuilt after a fork can re-register safely.
+    """
+    with _metric_sources_lock:
+        _metric_sources[name] = source
+
+
+def collect_metrics():
+    """Evaluate every registered metric source
+
+    Returns:
+        dict: {name: value}; a failing source reports its error instead
+    """
+    with _metric_sources_lock:
+        sources = dict(_metric_sources)
+
+    metrics = {}
+    for name, source in sorted(sources.items()):
+        try:
+            metrics[name] = source()
+        except Exception as e:
+            metrics[name] = {'error': str(e)}
+    return metrics
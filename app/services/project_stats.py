@@ -0,0 +1,274 @@
+import logging
+from datetime import datetime, timedelta
+import pytz
+from sqlalchemy import case, func
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.models import CheckIn, Project, ProjectDailyRollup, ProjectStat, UserProjectStat
+
+logger = logging.getLogger(__name__)
+
+# A user is active in a project if they checked in within this many days
+ACTIVE_USER_DAYS = 30
+
+# Rollup rows inserted per statement by rebuild_daily_rollups()
+ROLLUP_BATCH_SIZE = 1000
+
+
+def is_active(last_checkin_date, today):
+    """Whether a user whose last check-in was on last_checkin_date counts as active on today"""
+    return last_checkin_date is not None and last_checkin_date >= today - timedelta(days=ACTIVE_USER_DAYS)
+
+
+def adjust_project_stats(project_id, checkins_delta, was_active, now_active, highest_streak, lowered_streak=False):
+    """Apply one check-in write to ProjectStat with a single atomic UPDATE
+
+    The cost doesn't depend on the project's history: the total is
+    incremented, active users change by the one user whose activity
+    changed, and the highest streak is a running max. Only when a delete
+    lowered a user's highest streak is the project's maximum looked up
+    again, through the (project_id, highest_streak) index.
+
+    Active users drop out of the 30-day window without any write, so
+    active_users may be too high until the next reconcile_project_stats()
+    run (flask reconcile-stats).
+
+    Args:
+        project_id: Project ID
+        checkins_delta: +1 for a new check-in, -1 for a deleted one
+        was_active: Whether the user was active before the write
+        now_active: Whether the user is active after it
+        highest_streak: The user's highest streak after the write
+        lowered_streak: The write lowered the user's highest streak
+
+    Returns:
+        bool: False if there was no ProjectStat row and it was built from scratch instead
+    """
+    if lowered_streak:
+        db.session.flush()
+        new_highest = db.session.query(func.coalesce(func.max(UserProjectStat.highest_streak), 0)).filter(
+            UserProjectStat.project_id == project_id
+        ).scalar_subquery()
+    else:
+        new_highest = case(
+            (ProjectStat.highest_streak < highest_streak, highest_streak),
+            else_=ProjectStat.highest_streak
+        )
+
+    updated = ProjectStat.query.filter_by(project_id=project_id).update({
+        'total_checkins': ProjectStat.total_checkins + checkins_delta,
+        'active_users': ProjectStat.active_users + (int(now_active) - int(was_active)),
+        'highest_streak': new_highest,
+        'last_updated': datetime.now(pytz.UTC)
+    }, synchronize_session=False)
+
+    if not updated:
+        # Projects created before ProjectStat existed: build the row from scratch
+        db.session.flush()
+        reconcile_project_stats(project_id, commit=False)
+        return False
+    return True
+
+
+def reconcile_project_stats(project_id=None, today=None, commit=True):
+    """Recompute project and user check-in totals from scratch and fix any drift
+
+    Run periodically (flask reconcile-stats) to correct totals changed
+    outside the app, lost updates and active users that went inactive.
+    Uses grouped aggregate queries, not per-row loading; active users are
+    summed from the daily rollups.
+
+    Args:
+        project_id: Only this project, None for all
+        today: UTC date the active-user window ends on, defaults to today
+        commit: Commit the fixes
+
+    Returns:
+        dict: Number of corrected 'projects' and 'users' rows
+    """
+    today = today or datetime.now(pytz.UTC).date()
+    cutoff = today - timedelta(days=ACTIVE_USER_DAYS)
+
+    checkin_counts = db.session.query(CheckIn.project_id, CheckIn.user_id, func.count(CheckIn.id)).group_by(
+        CheckIn.project_id, CheckIn.user_id
+    )
+    highest_streaks = db.session.query(
+        UserProjectStat.project_id, func.max(UserProjectStat.highest_streak)
+    ).group_by(UserProjectStat.project_id)
+    active_counts = db.session.query(
+        ProjectDailyRollup.project_id, func.sum(ProjectDailyRollup.latest_users)
+    ).filter(ProjectDailyRollup.day >= cutoff).group_by(ProjectDailyRollup.project_id)
+    project_ids = db.session.query(Project.id)
+    user_stats = UserProjectStat.query
+    project_stats = ProjectStat.query
+    if project_id is not None:
+        checkin_counts = checkin_counts.filter(CheckIn.project_id == project_id)
+        highest_streaks = highest_streaks.filter(UserProjectStat.project_id == project_id)
+        active_counts = active_counts.filter(ProjectDailyRollup.project_id == project_id)
+        project_ids = project_ids.filter(Project.id == project_id)
+        user_stats = user_stats.filter_by(project_id=project_id)
+        project_stats = project_stats.filter_by(project_id=project_id)
+
+    user_totals = {(p, u): count for p, u, count in checkin_counts}
+    project_totals = {}
+    for (p, _), count in user_totals.items():
+        project_totals[p] = project_totals.get(p, 0) + count
+    highest_by_project = {p: highest or 0 for p, highest in highest_streaks}
+    active_by_project = {p: active or 0 for p, active in active_counts}
+
+    fixed_users = 0
+    for stat in user_stats:
+        expected = user_totals.get((stat.project_id, stat.user_id), 0)
+        if stat.total_checkins != expected:
+            stat.total_checkins = expected
+            fixed_users += 1
+
+    fixed_projects = 0
+    existing = {stat.project_id: stat for stat in project_stats}
+    for (pid,) in project_ids:
+        stat = existing.get(pid)
+        if stat is None:
+            stat = ProjectStat(project_id=pid, total_checkins=0, active_users=0, highest_streak=0)
+            db.session.add(stat)
+        expected = (project_totals.get(pid, 0), active_by_project.get(pid, 0), highest_by_project.get(pid, 0))
+        if (stat.total_checkins, stat.active_users, stat.highest_streak) != expected:
+            stat.total_checkins, stat.active_users, stat.highest_streak = expected
+            stat.last_updated = datetime.now(pytz.UTC)
+            fixed_projects += 1
+
+    if commit:
+        db.session.commit()
+    if fixed_projects or fixed_users:
+        logger.info(f"Reconciled stats of {fixed_projects} project(s) and {fixed_users} user(s)")
+    return {'projects': fixed_projects, 'users': fixed_users}
+
+
+def adjust_daily_rollup(project_id, day, checkins_delta, users_delta, previous_last_date, last_date):
+    """Apply one check-in write to the project's ProjectDailyRollup rows
+
+    Besides the day's check-ins and distinct users, each row counts the
+    users whose last check-in is on that day, so summing the last
+    ACTIVE_USER_DAYS rows gives the active users. A write moves the user's
+    last check-in date from one row to another.
+
+    Args:
+        project_id: Project ID
+        day: UTC date of the check-in written or deleted
+        checkins_delta: +1 for a new check-in, -1 for a deleted one
+        users_delta: +1 for the user's first check-in of the day, -1 when
+            their last one of the day was deleted, 0 otherwise
+        previous_last_date: The user's last check-in date before the write
+        last_date: The user's last check-in date after it
+    """
+    deltas = {day: {'checkins': checkins_delta, 'distinct_users': users_delta}}
+    if previous_last_date != last_date:
+        if previous_last_date is not None:
+            deltas.setdefault(previous_last_date, {})['latest_users'] = -1
+        if last_date is not None:
+            deltas.setdefault(last_date, {})['latest_users'] = 1
+    for rollup_day, changes in sorted(deltas.items()):
+        _add_to_rollup(project_id, rollup_day, {name: delta for name, delta in changes.items() if delta})
+
+
+def _add_to_rollup(project_id, day, changes):
+    """Atomically add changes ({column: delta}) to one rollup row, creating it if needed"""
+    if not changes:
+        return
+    rows = ProjectDailyRollup.query.filter_by(project_id=project_id, day=day)
+    values = {name: getattr(ProjectDailyRollup, name) + delta for name, delta in changes.items()}
+    if rows.update(values, synchronize_session=False):
+        return
+
+    if min(changes.values()) < 0:
+        # The day predates the rollups; flask rebuild-stats fills it in
+        logger.debug(f"No rollup of project {project_id} on {day} to subtract from")
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(ProjectDailyRollup(project_id=project_id, day=day, **{
+                name: changes.get(name, 0) for name in ('checkins', 'distinct_users', 'latest_users')
+            }))
+    except IntegrityError:
+        # A concurrent write created the row first
+        rows.update(values, synchronize_session=False)
+
+
+def active_users(project_id, today=None):
+    """Users whose last check-in was within ACTIVE_USER_DAYS, summed from at most 31 rollup rows"""
+    today = today or datetime.now(pytz.UTC).date()
+    return db.session.query(func.coalesce(func.sum(ProjectDailyRollup.latest_users), 0)).filter(
+        ProjectDailyRollup.project_id == project_id,
+        ProjectDailyRollup.day >= today - timedelta(days=ACTIVE_USER_DAYS)
+    ).scalar()
+
+
+def daily_rollups(project_id, days=30, today=None):
+    """Check-ins and distinct users per day for a chart, oldest first
+
+    Args:
+        project_id: Project ID
+        days: Number of days ending on today
+        today: UTC date of the last day, defaults to today
+
+    Returns:
+        list: {'date', 'checkins', 'users'} dicts, one per day, zero on days without check-ins
+    """
+    today = today or datetime.now(pytz.UTC).date()
+    start = today - timedelta(days=days - 1)
+    rows = {row.day: row for row in ProjectDailyRollup.query.filter(
+        ProjectDailyRollup.project_id == project_id,
+        ProjectDailyRollup.day >= start,
+        ProjectDailyRollup.day <= today
+    )}
+    series = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        row = rows.get(day)
+        series.append({
+            'date': day.isoformat(),
+            'checkins': row.checkins if row else 0,
+            'users': row.distinct_users if row else 0
+        })
+    return series
+
+
+def rebuild_daily_rollups(project_id=None, commit=True):
+    """Rebuild ProjectDailyRollup from the check-ins with grouped queries
+
+    Args:
+        project_id: Only this project, None for all
+        commit: Commit the rebuilt rows
+
+    Returns:
+        int: Number of rollup rows written
+    """
+    per_day = db.session.query(
+        CheckIn.project_id, CheckIn.check_date, func.count(CheckIn.id), func.count(CheckIn.user_id.distinct())
+    ).group_by(CheckIn.project_id, CheckIn.check_date)
+    last_dates = db.session.query(
+        CheckIn.project_id, func.max(CheckIn.check_date).label('last_date')
+    ).group_by(CheckIn.project_id, CheckIn.user_id)
+    existing = ProjectDailyRollup.query
+    if project_id is not None:
+        per_day = per_day.filter(CheckIn.project_id == project_id)
+        last_dates = last_dates.filter(CheckIn.project_id == project_id)
+        existing = existing.filter_by(project_id=project_id)
+    last_dates = last_dates.subquery()
+    latest = db.session.query(last_dates.c.project_id, last_dates.c.last_date, func.count()).group_by(
+        last_dates.c.project_id, last_dates.c.last_date
+    )
+
+    rows = {
+        (pid, day): {'project_id': pid, 'day': day, 'checkins': checkins, 'distinct_users': users, 'latest_users': 0}
+        for pid, day, checkins, users in per_day
+    }
+    for pid, day, users in latest:
+        rows[(pid, day)]['latest_users'] = users
+
+    existing.delete(synchronize_session=False)
+    mappings = list(rows.values())
+    for start in range(0, len(mappings), ROLLUP_BATCH_SIZE):
+        db.session.bulk_insert_mappings(ProjectDailyRollup, mappings[start:start + ROLLUP_BATCH_SIZE])
+    if commit:
+        db.session.commit()
+    return len(mappings)
@@ -0,0 +1,140 @@
+import os
+import threading
+import redis
+from flask import current_app
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.metrics import register_metric
+
+# One connection pool per worker process, shared by every Redis user
+_redis_client = None
+_redis_breaker = None
+_redis_client_pid = None
+_redis_client_lock = threading.Lock()
+
+
+def _build_connection_pool():
+    """Create the Redis connection pool from app config
+
+    Returns:
+        redis.ConnectionPool or None if Redis is not configured
+    """
+    max_connections = int(current_app.config.get('REDIS_MAX_CONNECTIONS', 50))
+    socket_timeout = float(current_app.config.get('REDIS_SOCKET_TIMEOUT', 0.8))
+
+    # If REDIS_URL is provided, use it instead of individual settings
+    redis_url = current_app.config.get('REDIS_URL')
+    if redis_url:
+        current_app.logger.info(f"Initializing Redis pool using URL, max_connections={max_connections}")
+        return redis.ConnectionPool.from_url(
+            redis_url,
+            max_connections=max_connections,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=socket_timeout
+        )
+
+    redis_host = current_app.config.get('REDIS_HOST')
+    if not redis_host:
+        return None
+
+    redis_port = int(current_app.config.get('REDIS_PORT', 6379))
+    redis_password = current_app.config.get('REDIS_PASSWORD')
+    redis_ssl = current_app.config.get('REDIS_SSL', False)
+    redis_db = int(current_app.config.get('REDIS_DB', 0))
+
+    current_app.logger.info(
+        f"Initializing Redis pool using host: {redis_host}, port: {redis_port}, "
+        f"max_connections={max_connections}"
+    )
+    return redis.ConnectionPool(
+        connection_class=redis.SSLConnection if redis_ssl else redis.Connection,
+        host=redis_host,
+        port=redis_port,
+        password=redis_password if redis_password else None,
+        db=redis_db,
+        max_connections=max_connections,
+        socket_timeout=socket_timeout,
+        socket_connect_timeout=socket_timeout
+    )
+
+
+def get_redis_client():
+    """Get the process-wide Redis client
+
+    The client is built lazily on first use and shares a single connection
+    pool. It is rebuilt after a fork so that worker processes never share
+    sockets with their parent. Callers should route commands through
+    get_redis_breaker() so that an outage doesn't stall every request.
+
+    Returns:
+        redis.Redis or None if Redis is not configured
+    """
+    global _redis_client, _redis_breaker, _redis_client_pid
+
+    pid = os.getpid()
+    if _redis_client_pid == pid:
+        return _redis_client
+
+    with _redis_client_lock:
+        if _redis_client_pid == pid:
+            return _redis_client
+
+        client = None
+        try:
+            pool = _build_connection_pool()
+            if pool is None:
+                current_app.logger.warning("Redis configuration not found. URL caching disabled.")
+            else:
+                client = redis.Redis(connection_pool=pool)
+        except Exception as e:
+            current_app.logger.error(f"Failed to initialize Redis client: {e}")
+            client = None
+
+        breaker = None
+        if client is not None:
+            breaker = CircuitBreaker(
+                'redis',
+                probe=client.ping,
+                failure_threshold=int(current_app.config.get('REDIS_BREAKER_FAILURE_THRESHOLD', 3)),
+                probe_interval=float(current_app.config.get('REDIS_BREAKER_PROBE_INTERVAL', 1.0)),
+                max_probe_interval=float(current_app.config.get('REDIS_BREAKER_MAX_PROBE_INTERVAL', 30.0))
+            )
+            register_metric('redis_circuit', breaker.metrics)
+
+            # Test Redis connection once per process. Keep the client even if
+            # Redis is down right now; the breaker probes it in the background.
+            try:
+                client.ping()
+                current_app.logger.info("Successfully connected to Redis")
+            except Exception as e:
+                current_app.logger.error(f"Redis ping failed: {e}")
+                breaker.trip()
+
+        _redis_client = client
+        _redis_breaker = breaker
+        _redis_client_pid = pid
+        return _redis_client
+
+
+def get_redis_breaker():
+    """Get the circuit breaker guarding the process-wide Redis client
+
+    Returns:
+        CircuitBreaker or None if Redis is not configured
+    """
+    get_redis_client()
+    return _redis_breaker
+
+
+def reset_redis_client():
+    """Drop the process-wide Redis client (used by tests and after config changes)"""
+    global _redis_client, _redis_breaker, _redis_client_pid
+
+    with _redis_client_lock:
+        if _redis_client is not None:
+            try:
+                _redis_client.connection_pool.disconnect()
+            except Exception:
+                pass
+        _redis_client = None
+        _redis_breaker = None
+        _redis_client_pid = None
@@ -1,12 +1,21 @@
 import os
-import uuid
+import base64
+import fnmatch
+import hashlib
+import random
+import threading
 import boto3
-import redis
 import time
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+from botocore.config import Config as BotoConfig
 from botocore.exceptions import ClientError
-from datetime import datetime, timedelta
+from datetime import datetime
 from flask import current_app
 import logging
+from app.services.redis_client import get_redis_client, get_redis_breaker
+from app.services.url_cache import TTLCache, SingleFlight
+from app.services.storage_backend import StorageBackend
 
 # Add imports for CloudFront signed URLs (if using private content)
 try:
@@ -19,10 +28,31 @@ try:
 except ImportError:
     CLOUDFRONT_SIGNING_AVAILABLE = False
 
-class S3Service:
+# Redis counter that namespaces all cached URLs, see S3Service._url_namespace()
+URL_CACHE_GENERATION_KEY = 'url_cache:generation'
+
+# Maximum number of keys S3 accepts in one DeleteObjects request
+DELETE_OBJECTS_BATCH_SIZE = 1000
+
+# Cookies that make up one CloudFront signed-cookie grant
+CLOUDFRONT_COOKIE_NAMES = ('CloudFront-Policy', 'CloudFront-Signature', 'CloudFront-Key-Pair-Id')
+
+# Bucketed URLs stay cached up to this fraction of their validity window past
+# the bucket's end, so workers don't all re-sign at the same moment
+URL_CACHE_TTL_JITTER = 0.1
+
+# Process-wide S3Service instance, see get_s3_service()
+_s3_service = None
+_s3_service_pid = None
+_s3_service_lock = threading.Lock()
+
+class S3Service(StorageBackend):
     """
     S3 Storage Service
     Handles image upload, retrieval, and deletion operations
+
+    Building an S3Service creates a boto3 client, so use get_s3_service()
+    to share one instance per worker process instead of constructing it directly.
     """
     
     def __init__(self):
@@ -31,11 +61,17 @@ class S3Service:
         region = current_app.config['AWS_REGION']
         current_app.logger.info(f"Initializing S3 client with region: {region}")
         
+        # botocore keeps a urllib3 pool per client; size it for concurrent requests
+        max_pool_connections = int(current_app.config.get('S3_MAX_POOL_CONNECTIONS', 20))
         self.s3_client = boto3.client(
             's3',
             aws_access_key_id=current_app.config['AWS_ACCESS_KEY'],
             aws_secret_access_key=current_app.config['AWS_SECRET_KEY'],
-            region_name=region
+            region_name=region,
+            config=BotoConfig(
+                max_pool_connections=max_pool_connections,
+                retries={'max_attempts': 3, 'mode': 'standard'}
+            )
         )
         self.bucket_name = current_app.config['S3_BUCKET_NAME']
         
@@ -45,136 +81,364 @@ class S3Service:
         self.cloudfront_key_pair_id = current_app.config.get('CLOUDFRONT_KEY_PAIR_ID', '')
         self.cloudfront_private_key_path = current_app.config.get('CLOUDFRONT_PRIVATE_KEY_PATH', '')
         
+        # Signed-cookie mode: one cookie per path grants access to every object under it
+        self.cloudfront_cookie_paths = [
+            path.strip().lstrip('/')
+            for path in current_app.config.get('CLOUDFRONT_COOKIE_PATHS', 'checkins/*,thumbnails/checkins/*').split(',')
+            if path.strip()
+        ]
+        self.cloudfront_cookie_expires = int(current_app.config.get('CLOUDFRONT_COOKIE_TTL', 24 * 60 * 60))
+        self.use_signed_cookies = bool(
+            current_app.config.get('CLOUDFRONT_SIGNED_COOKIES', False)
+            and self.use_cloudfront and self.cloudfront_domain
+            and self.cloudfront_key_pair_id and self.cloudfront_private_key_path
+            and CLOUDFRONT_SIGNING_AVAILABLE
+        )
+        
+        # Parsed private key and signer, see _get_cloudfront_signer()
+        self._cloudfront_signer_state = (None, None)
+        self._cloudfront_signer_lock = threading.Lock()
+        
         # Default URL expiration (30 days in seconds)
         self.default_expires = 30 * 24 * 60 * 60  # 30 days
         
+        # URL expiries are aligned to buckets of this many seconds (0 disables)
+        self.url_expiry_bucket = int(current_app.config.get('URL_EXPIRY_BUCKET', 24 * 60 * 60))
+        
+        # Object keys are unique per upload, so stored objects never change; access is
+        # enforced by the URL or cookie signature, so CloudFront may cache them at the edge
+        self.object_cache_control = current_app.config.get('S3_OBJECT_CACHE_CONTROL', 'public, max-age=31536000, immutable')
+        
         # Initialize Redis client for URL caching
         self._init_redis_client()
         
+        # Bounded pool for parallel S3 requests; shares the pooled client above
+        self.io_concurrency = max(1, int(current_app.config.get('S3_IO_CONCURRENCY', 10)))
+        self._io_executor = None
+        self._io_executor_lock = threading.Lock()
+        
+        # Two-tier URL cache: a per-worker LRU in front of Redis
+        self._local_urls = TTLCache(
+            maxsize=int(current_app.config.get('URL_LOCAL_CACHE_SIZE', 10000)),
+            ttl=int(current_app.config.get('URL_LOCAL_CACHE_TTL', 300))
+        )
+        self._url_flight = SingleFlight()
+        self.generation_refresh = int(current_app.config.get('URL_CACHE_GENERATION_REFRESH', 30))
+        self._generation_state = (0, None)
+        fingerprint_source = f"{self.bucket_name}|{self.use_cloudfront}|{self.cloudfront_domain}|{self.cloudfront_key_pair_id}"
+        self._config_fingerprint = hashlib.sha1(fingerprint_source.encode('utf-8')).hexdigest()[:8]
+        
         if self.use_cloudfront:
             current_app.logger.info(f"CloudFront distribution configured: {self.cloudfront_domain}")
+        if self.use_signed_cookies:
+            current_app.logger.info(f"CloudFront signed cookies enabled for: {', '.join(self.cloudfront_cookie_paths)}")
     
     def _init_redis_client(self):
-        """Initialize Redis client for URL caching"""
+        """Attach the process-wide Redis client used for URL caching"""
+        self.redis_client = get_redis_client()
+        self.redis_breaker = get_redis_breaker()
+    
+    def _redis_available(self):
+        """Whether Redis is configured and its circuit breaker is closed
+        
+        While the breaker is open, Redis is skipped entirely instead of
+        waiting for a socket timeout on every call.
+        """
+        return self.redis_client is not None and self.redis_breaker.allow_request()
+    
+    def _url_namespace(self):
+        """Key prefix for the current URL cache generation
+        
+        The prefix combines a fingerprint of the delivery config (bucket,
+        CloudFront domain, key pair) with a generation counter stored in Redis.
+        Changing the config or bumping the counter with invalidate_all_urls()
+        makes every previously cached URL unreachable at once.
+        """
+        generation, fetched_at = self._generation_state
+        now = time.monotonic()
+        if fetched_at is None or now - fetched_at > self.generation_refresh:
+            generation = self._load_generation(generation)
+            self._generation_state = (generation, now)
+        return f"url:{self._config_fingerprint}:{generation}:"
+    
+    def _load_generation(self, current):
+        """Read the URL cache generation from Redis, keeping the current one on errors"""
+        if not self._redis_available():
+            return current
+        
         try:
-            redis_host = current_app.config.get('REDIS_HOST')
-            redis_port = int(current_app.config.get('REDIS_PORT', 6379))
-            redis_password = current_app.config.get('REDIS_PASSWORD')
-            redis_ssl = current_app.config.get('REDIS_SSL', False)  # Changed to take boolean directly
-            redis_db = int(current_app.config.get('REDIS_DB', 0))
-            
-            # If REDIS_URL is provided, use it instead of individual settings
-            redis_url = current_app.config.get('REDIS_URL')
-            
-            if redis_url:
-                self.redis_client = redis.from_url(
-                    redis_url,
-                    socket_timeout=0.8,  # 800ms timeout instead of default
-                    socket_connect_timeout=0.8  # 800ms connection timeout
-                )
-                current_app.logger.info(f"Initialized Redis client using URL with 800ms timeout")
-            elif redis_host:
-                self.redis_client = redis.Redis(
-                    host=redis_host,
-                    port=redis_port,
-                    password=redis_password if redis_password else None,
-                    ssl=redis_ssl,
-                    db=redis_db,
-                    socket_timeout=0.8,  # 800ms timeout instead of 5s
-                    socket_connect_timeout=0.8  # 800ms connection timeout instead of 5s
-                )
-                current_app.logger.info(f"Initialized Redis client using host: {redis_host}, port: {redis_port}, timeout: 800ms")
-            else:
-                current_app.logger.warning("Redis configuration not found. URL caching disabled.")
-                self.redis_client = None
-                
-            # Test Redis connection
-            if self.redis_client:
-                self.redis_client.ping()
-                current_app.logger.info("Successfully connected to Redis")
+            generation = self.redis_breaker.call(self.redis_client.get, URL_CACHE_GENERATION_KEY)
+            return int(generation) if generation else 0
         except Exception as e:
-            current_app.logger.error(f"Failed to initialize Redis client: {e}")
-            self.redis_client = None
+            current_app.logger.error(f"Error reading URL cache generation from Redis: {e}")
+            return current
     
-    def _get_cached_url(self, cache_key):
+    def invalidate_all_urls(self):
+        """Invalidate every cached URL, e.g. after rotating the CloudFront key
+        
+        Other workers pick up the new generation within URL_CACHE_GENERATION_REFRESH seconds.
         """
-        Get a URL from Redis cache if available
+        self._local_urls.clear()
+        if not self.redis_client:
+            return
+        
+        try:
+            generation = self.redis_breaker.call(self.redis_client.incr, URL_CACHE_GENERATION_KEY)
+            self._generation_state = (generation, time.monotonic())
+            current_app.logger.info(f"URL cache generation bumped to {generation}")
+        except Exception as e:
+            current_app.logger.error(f"Error bumping URL cache generation: {e}")
+    
+    def _get_cached_url(self, cache_key, expires=None):
+        """
+        Get a URL from the in-process cache, then from Redis
         
         Args:
-            cache_key: Redis cache key for the URL
+            cache_key: Cache key for the URL
+            expires: Validity period the URL was signed with (seconds)
             
         Returns:
             cached_url or None if not found
         """
+        if expires is None:
+            expires = self.default_expires
+        
+        cached_url = self._local_urls.get(cache_key)
+        if cached_url:
+            return cached_url
+        
         if not self.redis_client:
             return None
+        
+        if not self.redis_breaker.allow_request():
+            return self._local_urls.get_stale(cache_key)
             
         try:
-            cached_url = self.redis_client.get(cache_key)
+            cached_url = self.redis_breaker.call(self.redis_client.get, cache_key)
             if cached_url:
                 current_app.logger.debug(f"Cache hit for {cache_key}")
-                return cached_url.decode('utf-8')
+                cached_url = cached_url.decode('utf-8')
+                self._local_urls.set(
+                    cache_key, cached_url,
+                    valid_for=self._remaining_validity(expires),
+                    ttl=self._cache_ttl(expires)
+                )
+                return cached_url
             current_app.logger.debug(f"Cache miss for {cache_key}")
             return None
         except Exception as e:
             current_app.logger.error(f"Error retrieving from Redis: {e}")
-            return None
+            # Redis is unavailable; a stale but unexpired URL is better than re-signing
+            return self._local_urls.get_stale(cache_key)
     
     def _cache_url(self, cache_key, url, expires):
         """
-        Store URL in Redis cache with expiration
+        Store URL in the in-process cache and in Redis with expiration
         
         Args:
-            cache_key: Redis cache key
+            cache_key: Cache key
             url: The URL to cache
             expires: Validity period in seconds
         """
-        if not self.redis_client or not url:
+        if not url:
+            return
+        
+        ttl = self._cache_ttl(expires)
+        self._local_urls.set(cache_key, url, valid_for=self._signed_validity(expires), ttl=ttl)
+        
+        if not self._redis_available():
             return
             
         try:
-            # Set TTL slightly shorter than actual URL expiry (90%)
-            ttl = int(expires * 0.9)
-            self.redis_client.setex(cache_key, ttl, url)
+            self.redis_breaker.call(self.redis_client.setex, cache_key, ttl, url)
             current_app.logger.debug(f"Cached URL for {cache_key} with TTL {ttl}s")
         except Exception as e:
             current_app.logger.error(f"Error storing in Redis: {e}")
     
-    def _invalidate_cache(self, s3_key):
+    def _get_cached_urls(self, cache_keys, expires=None):
         """
-        Invalidate cache entries for a specific S3 key
+        Get many URLs from Redis cache in a single round trip
         
         Args:
-            s3_key: S3 object key to invalidate
+            cache_keys: List of cache keys
+            expires: Validity period the URLs were signed with (seconds)
+            
+        Returns:
+            list: cached URL or None for each cache key, in the same order
         """
-        if not self.redis_client:
+        if expires is None:
+            expires = self.default_expires
+        
+        if not self.redis_client or not cache_keys:
+            return [None] * len(cache_keys)
+        
+        if not self.redis_breaker.allow_request():
+            return [self._local_urls.get_stale(cache_key) for cache_key in cache_keys]
+            
+        try:
+            cached_urls = self.redis_breaker.call(self.redis_client.mget, cache_keys)
+        except Exception as e:
+            current_app.logger.error(f"Error retrieving from Redis: {e}")
+            return [self._local_urls.get_stale(cache_key) for cache_key in cache_keys]
+        
+        valid_for = self._remaining_validity(expires)
+        ttl = self._cache_ttl(expires)
+        results = []
+        for cache_key, cached_url in zip(cache_keys, cached_urls):
+            if cached_url:
+                cached_url = cached_url.decode('utf-8')
+                self._local_urls.set(cache_key, cached_url, valid_for=valid_for, ttl=ttl)
+            results.append(cached_url)
+        return results
+    
+    def _cache_urls(self, entries, expires):
+        """
+        Store many URLs in the in-process cache and in Redis with a single pipelined round trip
+        
+        Args:
+            entries: dict of {cache_key: url}
+            expires: Validity period in seconds
+        """
+        if not entries:
+            return
+        
+        ttl = self._cache_ttl(expires)
+        valid_for = self._signed_validity(expires)
+        for cache_key, url in entries.items():
+            self._local_urls.set(cache_key, url, valid_for=valid_for, ttl=ttl)
+        
+        if not self._redis_available():
             return
             
         try:
-            # Remove both S3 and CloudFront URL cache entries
-            s3_cache_key = f"s3_url:{s3_key}"
-            cf_cache_key = f"cf_url:{s3_key}"
-            thumb_cache_key = f"s3_url:thumbnails/{s3_key}"
-            cf_thumb_cache_key = f"cf_url:thumbnails/{s3_key}"
-            
-            self.redis_client.delete(s3_cache_key, cf_cache_key, thumb_cache_key, cf_thumb_cache_key)
-            current_app.logger.debug(f"Invalidated cache for {s3_key}")
+            pipe = self.redis_client.pipeline(transaction=False)
+            for cache_key, url in entries.items():
+                pipe.setex(cache_key, ttl, url)
+            self.redis_breaker.call(pipe.execute)
+            current_app.logger.debug(f"Cached {len(entries)} URLs with TTL {ttl}s")
         except Exception as e:
-            current_app.logger.error(f"Error invalidating Redis cache: {e}")
+            current_app.logger.error(f"Error storing in Redis: {e}")
+    
+    def _url_expires_at(self, expires):
+        """Unix time at which a URL signed now should expire
+        
+        Expiry is aligned to the end of the current time bucket plus the
+        validity window, so every worker signing the same key within a
+        bucket produces a byte-identical, browser-cacheable URL. Buckets
+        are never longer than the validity window itself.
+        """
+        now = int(time.time())
+        bucket = min(self.url_expiry_bucket, expires)
+        if bucket <= 0:
+            return now + expires
+        return (now // bucket + 1) * bucket + expires
+    
+    def _cache_ttl(self, expires):
+        """How long a URL signed now may be cached
+        
+        With time buckets, cached URLs expire after the bucket ends, plus a
+        random delay of up to URL_CACHE_TTL_JITTER of the validity window
+        so that the re-signing is spread out instead of every worker doing it
+        at the boundary. The URL is still valid for at least the rest of the
+        window. Otherwise the TTL is slightly shorter than the URL expiry (90%).
+        """
+        bucket = min(self.url_expiry_bucket, expires)
+        if bucket <= 0:
+            return int(expires * 0.9)
+        now = time.time()
+        jitter = random.uniform(0, expires * URL_CACHE_TTL_JITTER)
+        return max(1, int((int(now) // bucket + 1) * bucket - now + jitter))
+    
+    def _signed_validity(self, expires):
+        """How long a URL signed now can be served as a stale fallback"""
+        return int((self._url_expires_at(expires) - time.time()) * 0.9)
+    
+    def _remaining_validity(self, expires):
+        """Lower bound on how long a URL read back from Redis stays valid
+        
+        A bucketed URL found in Redis was signed at most the TTL jitter before
+        the current bucket began, so at least 90% of the window is left.
+        Unbucketed Redis entries live for 90% of the URL lifetime, leaving at
+        least the remaining 10%.
+        """
+        if min(self.url_expiry_bucket, expires) > 0:
+            return int(expires * 0.9)
+        return int(expires * 0.1)
+    
+    def _refresh_url(self, cache_key, s3_key, expires, new_entries=None):
+        """Generate a URL after a cache miss
+        
+        Runs through SingleFlight, so concurrent misses for the same key sign
+        the URL only once. If generation fails, a stale but unexpired URL
+        from the in-process cache is served instead.
+        
+        Args:
+            cache_key: Cache key for the URL
+            s3_key: File path in S3
+            expires: URL validity period (seconds)
+            new_entries: Optional dict collecting new URLs for a batched
+                cache write; when omitted the URL is cached immediately
+        """
+        # An earlier flight may have filled the cache while we were waiting
+        url = self._local_urls.get(cache_key)
+        if url:
+            return url
+        
+        try:
+            url = self._generate_url(s3_key, expires)
+        except Exception as e:
+            current_app.logger.error(f"Error generating URL for {s3_key}: {e}")
+            url = None
+        
+        if url:
+            if new_entries is None:
+                self._cache_url(cache_key, url, expires)
+            else:
+                new_entries[cache_key] = url
+            return url
+        
+        stale_url = self._local_urls.get_stale(cache_key)
+        if stale_url:
+            current_app.logger.warning(f"Serving stale URL for {s3_key}")
+        return stale_url
     
-    def generate_s3_key(self, user_id, project_id, filename):
-        """Generate unique S3 storage path
+    def _invalidate_cache(self, s3_key):
+        """
+        Invalidate cache entries for a specific S3 key
         
-        Format: checkins/{user_id}/{project_id}/{timestamp}_{uuid}_{filename}
+        Args:
+            s3_key: S3 object key to invalidate
         """
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        unique_id = str(uuid.uuid4())[:8]
-        extension = os.path.splitext(filename)[1].lower()
+        self._invalidate_cache_many([s3_key, f"thumbnails/{s3_key}"])
+    
+    def _invalidate_cache_many(self, s3_keys):
+        """
+        Invalidate cache entries for many S3 keys with one Redis pipeline
         
-        # Ensure filename is safe
-        safe_filename = f"{timestamp}_{unique_id}{extension}"
+        Args:
+            s3_keys: S3 object keys to invalidate
+        """
+        # Remove both S3 and CloudFront URL cache entries
+        namespace = self._url_namespace()
+        cache_keys = []
+        for s3_key in s3_keys:
+            cache_keys.append(f"{namespace}s3_url:{s3_key}")
+            cache_keys.append(f"{namespace}cf_url:{s3_key}")
+        if not cache_keys:
+            return
+        self._local_urls.delete(*cache_keys)
         
-        return f"checkins/{user_id}/{project_id}/{safe_filename}"
+        if not self._redis_available():
+            return
+            
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for start in range(0, len(cache_keys), DELETE_OBJECTS_BATCH_SIZE):
+                pipe.delete(*cache_keys[start:start + DELETE_OBJECTS_BATCH_SIZE])
+            self.redis_breaker.call(pipe.execute)
+            current_app.logger.debug(f"Invalidated cache for {len(s3_keys)} keys")
+        except Exception as e:
+            current_app.logger.error(f"Error invalidating Redis cache: {e}")
     
     def upload_file(self, file_data, s3_key, content_type):
         """Upload file to S3
@@ -193,7 +457,8 @@ class S3Service:
                 Bucket=self.bucket_name,
                 Key=s3_key,
                 Body=file_data,
-                ContentType=content_type
+                ContentType=content_type,
+                CacheControl=self.object_cache_control
             )
             
             file_size = len(file_data)
@@ -203,6 +468,101 @@ class S3Service:
             current_app.logger.error(f"Error uploading to S3: {e}")
             raise
     
+    def open_file(self, s3_key):
+        """Download a file from S3
+        
+        The object is streamed into a temporary file that stays in memory up
+        to UPLOAD_SPOOL_THRESHOLD bytes and spills to disk beyond that.
+        
+        Args:
+            s3_key: S3 storage path
+            
+        Returns:
+            file: Seekable binary file positioned at the start; the caller closes it
+        """
+        spool = SpooledTemporaryFile(max_size=int(current_app.config.get('UPLOAD_SPOOL_THRESHOLD', 1024 * 1024)))
+        try:
+            self.s3_client.download_fileobj(self.bucket_name, s3_key, spool)
+        except ClientError as e:
+            spool.close()
+            current_app.logger.error(f"Error downloading {s3_key} from S3: {e}")
+            raise
+        spool.seek(0)
+        return spool
+    
+    def _get_io_executor(self):
+        """Get the thread pool used for parallel S3 requests, built on first use"""
+        if self._io_executor is None:
+            with self._io_executor_lock:
+                if self._io_executor is None:
+                    self._io_executor = ThreadPoolExecutor(
+                        max_workers=self.io_concurrency,
+                        thread_name_prefix='s3-io'
+                    )
+        return self._io_executor
+    
+    def _submit(self, fn, *args):
+        """Run fn(*args) on the I/O pool inside the caller's app context"""
+        app = current_app._get_current_object()
+        
+        def run():
+            with app.app_context():
+                return fn(*args)
+        
+        return self._get_io_executor().submit(run)
+    
+    def submit_upload(self, file_data, s3_key, content_type):
+        """Start uploading a file to S3 in the background
+        
+        Args:
+            file_data: File content
+            s3_key: S3 storage path
+            content_type: File MIME type
+            
+        Returns:
+            Future resolving to (s3_key, file_size) like upload_file
+        """
+        return self._submit(self.upload_file, file_data, s3_key, content_type)
+    
+    def upload_many(self, files):
+        """Upload several files to S3 in parallel
+        
+        Args:
+            files: List of (file_data, s3_key, content_type) tuples
+            
+        Returns:
+            list: One dict per file, in input order, with keys
+                  s3_key, success, file_size and error (message or None)
+        """
+        futures = [self.submit_upload(*item) for item in files]
+        results = []
+        for (file_data, s3_key, content_type), future in zip(files, futures):
+            try:
+                _, file_size = future.result()
+                results.append({'s3_key': s3_key, 'success': True, 'file_size': file_size, 'error': None})
+            except Exception as e:
+                results.append({'s3_key': s3_key, 'success': False, 'file_size': 0, 'error': str(e)})
+        return results
+    
+    def delete_many(self, s3_keys):
+        """Delete several files from S3 in parallel
+        
+        Args:
+            s3_keys: List of S3 storage paths
+            
+        Returns:
+            list: Whether each deletion was successful, in input order
+        """
+        futures = [self._submit(self.delete_file, s3_key) for s3_key in s3_keys]
+        results = []
+        for s3_key, future in zip(s3_keys, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                current_app.logger.error(f"Error deleting {s3_key} from S3: {e}")
+                results.append(False)
+        return results
+    
     def get_cloudfront_url(self, s3_key, expires=None):
         """Get a CloudFront URL for a file
         
@@ -220,54 +580,42 @@ class S3Service:
             # Fall back to S3 if CloudFront is not configured
             return self.get_file_url(s3_key, expires)
         
+        # Objects covered by the signed cookies need no per-URL signature or caching
+        if self._covered_by_signed_cookies(s3_key):
+            return self._unsigned_cloudfront_url(s3_key)
+        
         # Create cache key
-        cache_key = f"cf_url:{s3_key}"
+        cache_key = self._url_cache_key(s3_key)
         
         # Check cache first
-        cached_url = self._get_cached_url(cache_key)
+        cached_url = self._get_cached_url(cache_key, expires)
         if cached_url:
             return cached_url
         
+        return self._url_flight.do(cache_key, lambda: self._refresh_url(cache_key, s3_key, expires))
+    
+    def _generate_cloudfront_url(self, s3_key, expires):
+        """Build a CloudFront URL for a file without consulting the cache
+        
+        Signs the URL when a key pair is configured, falling back to an S3
+        presigned URL if signing is not possible.
+        """
         # If using CloudFront with private content, sign the URL
         if self.cloudfront_key_pair_id and self.cloudfront_private_key_path and CLOUDFRONT_SIGNING_AVAILABLE:
             try:
-                # Check if the private key file exists
-                if not os.path.exists(self.cloudfront_private_key_path):
+                # Reuse the process-wide signer; None means the key file is missing
+                cloudfront_signer = self._get_cloudfront_signer()
+                if cloudfront_signer is None:
                     current_app.logger.error(f"CloudFront private key not found at: {self.cloudfront_private_key_path}")
                     # Fall back to S3 presigned URL
-                    url = self.s3_client.generate_presigned_url(
-                        'get_object',
-                        Params={'Bucket': self.bucket_name, 'Key': s3_key},
-                        ExpiresIn=expires
-                    )
-                    self._cache_url(cache_key, url, expires)
-                    return url
-                
-                # Read the private key
-                with open(self.cloudfront_private_key_path, 'rb') as key_file:
-                    private_key = serialization.load_pem_private_key(
-                        key_file.read(),
-                        password=None,
-                        backend=default_backend()
-                    )
-                
-                # Create a signer
-                def rsa_signer(message):
-                    return private_key.sign(
-                        message,
-                        padding.PKCS1v15(),
-                        hashes.SHA1()
-                    )
+                    return self._generate_presigned_url(s3_key, expires)
                 
                 # Ensure s3_key doesn't start with a slash
                 if s3_key.startswith('/'):
                     s3_key = s3_key[1:]
                     
-                # Calculate expiration time
-                expire_date = datetime.utcnow() + timedelta(seconds=expires)
-                
-                # Create CloudFront signer
-                cloudfront_signer = CloudFrontSigner(self.cloudfront_key_pair_id, rsa_signer)
+                # Calculate expiration time, aligned to the current time bucket
+                expire_date = datetime.utcfromtimestamp(self._url_expires_at(expires))
                 
                 # Generate the signed URL
                 signed_url = cloudfront_signer.generate_presigned_url(
@@ -275,27 +623,16 @@ class S3Service:
                     date_less_than=expire_date
                 )
                 
-                # Cache the URL
-                self._cache_url(cache_key, signed_url, expires)
-                
                 current_app.logger.debug(f"Generated signed CloudFront URL for {s3_key}")
                 return signed_url
                 
             except Exception as e:
                 current_app.logger.error(f"Error generating signed CloudFront URL: {e}")
                 # Fall back to S3 presigned URL
-                url = self.s3_client.generate_presigned_url(
-                    'get_object',
-                    Params={'Bucket': self.bucket_name, 'Key': s3_key},
-                    ExpiresIn=expires
-                )
-                self._cache_url(cache_key, url, expires)
-                return url
+                return self._generate_presigned_url(s3_key, expires)
         
         # Regular CloudFront URL (fallback)
-        url = f"https://{self.cloudfront_domain}/{s3_key}"
-        self._cache_url(cache_key, url, expires)
-        return url
+        return f"https://{self.cloudfront_domain}/{s3_key}"
     
     def _get_signed_cloudfront_url(self, s3_key, expires=3600):
         """Generate a signed CloudFront URL for private content
@@ -306,21 +643,13 @@ class S3Service:
             current_app.logger.warning("CloudFront signing packages not installed.")
             return f"https://{self.cloudfront_domain}/{s3_key}"
             
-        key_path = self.cloudfront_private_key_path
-        if not os.path.exists(key_path):
-            current_app.logger.error(f"CloudFront private key not found at: {key_path}")
-            return f"https://{self.cloudfront_domain}/{s3_key}"
-        
         try:
-            with open(key_path, 'rb') as key_file:
-                private_key = serialization.load_pem_private_key(
-                    key_file.read(),
-                    password=None,
-                    backend=default_backend()
-                )
+            cloudfront_signer = self._get_cloudfront_signer()
+            if cloudfront_signer is None:
+                current_app.logger.error(f"CloudFront private key not found at: {self.cloudfront_private_key_path}")
+                return f"https://{self.cloudfront_domain}/{s3_key}"
                 
-            expire_date = datetime.utcnow() + timedelta(seconds=expires)
-            cloudfront_signer = CloudFrontSigner(self.cloudfront_key_pair_id, self._rsa_signer(private_key))
+            expire_date = datetime.utcfromtimestamp(self._url_expires_at(expires))
             
             # Generate the signed URL
             signed_url = cloudfront_signer.generate_presigned_url(
@@ -332,6 +661,105 @@ class S3Service:
             current_app.logger.error(f"Error creating signed CloudFront URL: {e}")
             return f"https://{self.cloudfront_domain}/{s3_key}"
     
+    def _get_cloudfront_signer(self):
+        """Get the cached CloudFront signer for this process
+        
+        The private key is parsed once and reloaded only when the key file's
+        mtime changes, so key rotation works without a restart.
+        
+        Returns:
+            CloudFrontSigner or None if the private key file does not exist
+        """
+        try:
+            mtime = os.stat(self.cloudfront_private_key_path).st_mtime_ns
+        except OSError:
+            return None
+        
+        # Read the (mtime, signer) pair once so it can't change under us
+        cached_mtime, signer = self._cloudfront_signer_state
+        if signer is not None and cached_mtime == mtime:
+            return signer
+        
+        with self._cloudfront_signer_lock:
+            cached_mtime, signer = self._cloudfront_signer_state
+            if signer is None or cached_mtime != mtime:
+                with open(self.cloudfront_private_key_path, 'rb') as key_file:
+                    private_key = serialization.load_pem_private_key(
+                        key_file.read(),
+                        password=None,
+                        backend=default_backend()
+                    )
+                signer = CloudFrontSigner(self.cloudfront_key_pair_id, self._rsa_signer(private_key))
+                self._cloudfront_signer_state = (mtime, signer)
+                current_app.logger.info(f"Loaded CloudFront private key from {self.cloudfront_private_key_path}")
+            return signer
+    
+    def get_signed_cookies(self, expires=None):
+        """Build CloudFront signed cookies for the configured cookie paths
+        
+        Each path (e.g. ``checkins/*``) gets its own custom wildcard policy,
+        scoped to the matching cookie Path so the browser sends the right
+        cookies with each image request.
+        
+        Args:
+            expires: Cookie validity period (seconds), default CLOUDFRONT_COOKIE_TTL
+            
+        Returns:
+            tuple: (cookies, expires_at) where cookies is a list of
+            (cookie_path, {cookie_name: value}) and expires_at is a Unix timestamp,
+            or ([], None) if the signing key is unavailable
+        """
+        if expires is None:
+            expires = self.cloudfront_cookie_expires
+        
+        cloudfront_signer = self._get_cloudfront_signer()
+        if cloudfront_signer is None:
+            current_app.logger.error(f"CloudFront private key not found at: {self.cloudfront_private_key_path}")
+            return [], None
+        
+        expire_date = datetime.utcfromtimestamp(self._url_expires_at(expires))
+        cookies = []
+        for resource_path in self.cloudfront_cookie_paths:
+            policy = cloudfront_signer.build_policy(
+                f"https://{self.cloudfront_domain}/{resource_path}",
+                date_less_than=expire_date
+            ).encode('utf-8')
+            signature = cloudfront_signer.rsa_signer(policy)
+            cookies.append((self._cookie_path(resource_path), {
+                'CloudFront-Policy': self._cloudfront_b64encode(policy),
+                'CloudFront-Signature': self._cloudfront_b64encode(signature),
+                'CloudFront-Key-Pair-Id': self.cloudfront_key_pair_id
+            }))
+        
+        expires_at = int((expire_date - datetime(1970, 1, 1)).total_seconds())
+        return cookies, expires_at
+    
+    def signed_cookie_paths(self):
+        """Cookie Path attributes get_signed_cookies() sets cookies on, e.g. to clear them at logout"""
+        return list(dict.fromkeys(self._cookie_path(resource_path) for resource_path in self.cloudfront_cookie_paths))
+    
+    def _covered_by_signed_cookies(self, s3_key):
+        """Whether an object is readable through the signed cookies alone"""
+        if not self.use_signed_cookies:
+            return False
+        s3_key = s3_key.lstrip('/')
+        return any(fnmatch.fnmatchcase(s3_key, pattern) for pattern in self.cloudfront_cookie_paths)
+    
+    def _unsigned_cloudfront_url(self, s3_key):
+        """Stable CloudFront URL for an object covered by the signed cookies"""
+        return f"https://{self.cloudfront_domain}/{s3_key.lstrip('/')}"
+    
+    @staticmethod
+    def _cookie_path(resource_path):
+        """Cookie Path attribute for a policy resource, e.g. 'checkins/*' -> '/checkins/'"""
+        directory = resource_path.rsplit('/', 1)[0] if '/' in resource_path else ''
+        return f"/{directory}/" if directory else '/'
+    
+    @staticmethod
+    def _cloudfront_b64encode(data):
+        """CloudFront's URL-safe base64 variant"""
+        return base64.b64encode(data).decode('utf-8').replace('+', '-').replace('=', '_').replace('/', '~')
+    
     def _rsa_signer(self, private_key):
         """Return a signer function for CloudFront signed URLs"""
         def sign_with_key(message):
@@ -360,62 +788,101 @@ class S3Service:
             return self.get_cloudfront_url(s3_key, expires)
         
         # Create cache key
-        cache_key = f"s3_url:{s3_key}"
+        cache_key = self._url_cache_key(s3_key)
         
         # Check cache first
-        cached_url = self._get_cached_url(cache_key)
+        cached_url = self._get_cached_url(cache_key, expires)
         if cached_url:
             return cached_url
-            
+        
+        return self._url_flight.do(cache_key, lambda: self._refresh_url(cache_key, s3_key, expires))
+    
+    def _generate_presigned_url(self, s3_key, expires):
+        """Build an S3 presigned URL without consulting the cache"""
         try:
             # Log the key we're trying to access for debugging
             current_app.logger.debug(f"Cache miss - Generating presigned URL for bucket:{self.bucket_name}, key:{s3_key}")
             
-            presigned_url = self.s3_client.generate_presigned_url(
+            # Relative expiry that lands on the bucketed expiry time. SigV2 URLs
+            # are then identical across workers; SigV4 URLs embed the signing
+            # time, so they are shared through the cache instead.
+            return self.s3_client.generate_presigned_url(
                 'get_object',
                 Params={
                     'Bucket': self.bucket_name,
                     'Key': s3_key
                 },
-                ExpiresIn=expires
+                ExpiresIn=self._url_expires_at(expires) - int(time.time())
             )
             
-            # Cache the URL
-            self._cache_url(cache_key, presigned_url, expires)
-            
-            return presigned_url
-            
         except ClientError as e:
             current_app.logger.error(f"Error generating presigned URL: {e}")
             return None
     
-    def generate_presigned_url(self, s3_key, expires=3600):
-        """Alias for get_file_url method to maintain compatibility with templates"""
-        return self.get_file_url(s3_key, expires)
-    
-    def get_thumbnail_url(self, original_key, expires=None):
-        """Get thumbnail URL for an image
+    def get_file_urls(self, s3_keys, expires=None):
+        """Get access URLs for many files at once
+        
+        Serves what it can from the in-process cache, looks up the rest with
+        a single Redis MGET, generates URLs only for the misses and writes
+        those back in a single pipeline.
         
         Args:
-            original_key: Original image key
+            s3_keys: Iterable of file paths in S3
             expires: URL validity period (seconds), default 30 days
             
         Returns:
-            presigned_url: Signed thumbnail URL
+            dict: {s3_key: url}
         """
         if expires is None:
             expires = self.default_expires
+        
+        # Preserve order but drop duplicates and empty keys
+        s3_keys = list(dict.fromkeys(key for key in s3_keys if key))
+        if not s3_keys:
+            return {}
+        
+        urls = {}
+        misses = []
+        for s3_key in s3_keys:
+            if self._covered_by_signed_cookies(s3_key):
+                urls[s3_key] = self._unsigned_cloudfront_url(s3_key)
+                continue
             
-        # Make sure we don't have multiple 'thumbnails/' prefixes
-        if original_key.startswith('thumbnails/'):
-            thumbnail_key = original_key
-        else:
-            thumbnail_key = f"thumbnails/{original_key}"
+            cache_key = self._url_cache_key(s3_key)
+            cached_url = self._local_urls.get(cache_key)
+            if cached_url:
+                urls[s3_key] = cached_url
+            else:
+                misses.append((s3_key, cache_key))
+        
+        cached_urls = self._get_cached_urls([cache_key for _, cache_key in misses], expires)
         
-        # For debugging
-        current_app.logger.debug(f"Getting thumbnail URL for original key: {original_key}, thumbnail key: {thumbnail_key}")
+        new_entries = {}
+        for (s3_key, cache_key), cached_url in zip(misses, cached_urls):
+            if cached_url:
+                urls[s3_key] = cached_url
+                continue
             
-        return self.get_file_url(thumbnail_key, expires)
+            urls[s3_key] = self._url_flight.do(
+                cache_key,
+                lambda s3_key=s3_key, cache_key=cache_key: self._refresh_url(cache_key, s3_key, expires, new_entries)
+            )
+        
+        self._cache_urls(new_entries, expires)
+        current_app.logger.debug(f"Resolved {len(urls)} URLs, {len(new_entries)} cache misses")
+        return urls
+    
+    def _url_cache_key(self, s3_key):
+        """Cache key for a file URL in the current delivery mode and cache generation"""
+        if self.use_cloudfront and self.cloudfront_domain:
+            return f"{self._url_namespace()}cf_url:{s3_key}"
+        return f"{self._url_namespace()}s3_url:{s3_key}"
+    
+    def _generate_url(self, s3_key, expires):
+        """Build a file URL in the current delivery mode without consulting the cache"""
+        if self.use_cloudfront and self.cloudfront_domain:
+            return self._generate_cloudfront_url(s3_key, expires)
+        return self._generate_presigned_url(s3_key, expires)
     
     def get_direct_url(self, s3_key):
         """Get a direct (non-presigned) URL to the S3 object
@@ -451,4 +918,86 @@ class S3Service:
             return True
             
         except ClientError as e:
-            current_app.logger.error(f"Error deleting file from S3: {e}")
\ No newline at end of file
+            current_app.logger.error(f"Error deleting file from S3: {e}")
+            return False
+    
+    def delete_keys(self, s3_keys):
+        """Delete many files from S3 with batched DeleteObjects requests
+        
+        Keys are sent up to 1000 per request, with batches running in
+        parallel on the I/O pool. Cached URLs for every key are invalidated
+        with a single Redis pipeline.
+        
+        Args:
+            s3_keys: List of S3 storage paths
+            
+        Returns:
+            list: Keys that could not be deleted
+        """
+        keys = list(dict.fromkeys(key for key in s3_keys if key))
+        if not keys:
+            return []
+        
+        batches = [keys[start:start + DELETE_OBJECTS_BATCH_SIZE]
+                   for start in range(0, len(keys), DELETE_OBJECTS_BATCH_SIZE)]
+        futures = [self._submit(self._delete_batch, batch) for batch in batches]
+        
+        failed = []
+        for batch, future in zip(batches, futures):
+            try:
+                failed.extend(future.result())
+            except Exception as e:
+                current_app.logger.error(f"Error deleting {len(batch)} files from S3: {e}")
+                failed.extend(batch)
+        
+        self._invalidate_cache_many(keys)
+        
+        if failed:
+            current_app.logger.error(f"Failed to delete {len(failed)} of {len(keys)} files from S3")
+        return failed
+    
+    def _delete_batch(self, keys):
+        """Delete up to 1000 keys in one DeleteObjects request
+        
+        Returns:
+            list: Keys S3 reported as not deleted
+        """
+        response = self.s3_client.delete_objects(
+            Bucket=self.bucket_name,
+            Delete={
+                'Objects': [{'Key': key} for key in keys],
+                'Quiet': True
+            }
+        )
+        errors = response.get('Errors', [])
+        for error in errors:
+            current_app.logger.error(f"Error deleting {error.get('Key')} from S3: {error.get('Code')} {error.get('Message')}")
+        return [error.get('Key') for error in errors]
+
+def get_s3_service():
+    """Get the process-wide S3Service, building it on first use
+    
+    boto3 clients are thread-safe, so a single instance is shared by all
+    threads of a worker process. A new instance is built after a fork.
+    """
+    global _s3_service, _s3_service_pid
+    
+    pid = os.getpid()
+    if _s3_service_pid == pid:
+        return _s3_service
+    
+    with _s3_service_lock:
+        if _s3_service_pid != pid:
+            _s3_service = S3Service()
+            _s3_service_pid = pid
+        return _s3_service
+
+def reset_s3_service():
+    """Drop the process-wide S3Service (used by tests and after config changes)"""
+    global _s3_service, _s3_service_pid
+    
+    with _s3_service_lock:
+        if _s3_service is not None and _s3_service._io_executor is not None:
+            _s3_service._io_executor.shutdown(wait=False)
+        _s3_service = None
+        _s3_service_pid = None
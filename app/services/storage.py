@@ -0,0 +1,63 @@
+import os
+import threading
+from flask import current_app
+from app.services.s3_service import get_s3_service
+
+# Process-wide non-S3 backend; S3Service keeps its own singleton
+_storage = None
+_storage_pid = None
+_storage_lock = threading.Lock()
+
+
+def _build_storage(name):
+    if name == 'local':
+        from app.services.local_storage import LocalStorageBackend
+        return LocalStorageBackend()
+    if name == 'memory':
+        from app.services.local_storage import MemoryStorageBackend
+        return MemoryStorageBackend()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {name}")
+
+
+def get_storage():
+    """Get the process-wide storage backend selected by STORAGE_BACKEND
+
+    Returns:
+        StorageBackend: S3Service ('s3', the default), LocalStorageBackend
+        ('local') or MemoryStorageBackend ('memory')
+    """
+    global _storage, _storage_pid
+
+    name = current_app.config.get('STORAGE_BACKEND', 's3')
+    if name == 's3':
+        return get_s3_service()
+
+    pid = os.getpid()
+    if _storage_pid == pid:
+        return _storage
+
+    with _storage_lock:
+        if _storage_pid != pid:
+            _storage = _build_storage(name)
+            _storage_pid = pid
+        return _storage
+
+
+def reset_storage():
+    """Drop the process-wide storage backend (used by tests and after config changes)"""
+    global _storage, _storage_pid
+
+    with _storage_lock:
+        _storage = None
+        _storage_pid = None
+
+
+class LazyStorage:
+    """Template proxy that only builds the storage backend when a template uses it
+
+    Injected into every template context, so pages without images (login,
+    settings, ...) never pay for storage setup.
+    """
+
+    def __getattr__(self, name):
+        return getattr(get_storage(), name)
@@ -0,0 +1,294 @@
+import os
+import uuid
+import mimetypes
+from abc import ABC, abstractmethod
+from datetime import datetime
+from flask import abort, current_app
+
+
+class StorageBackend(ABC):
+    """
+    Interface for image storage
+
+    Backends implement the abstract upload_file, open_file, get_file_url
+    and delete_file, and serve_file if their URLs point at the app. Batch
+    operations and thumbnail helpers have generic implementations built on
+    those; backends override them when they can do better (e.g. S3Service
+    batches deletes and caches URLs).
+
+    Use app.services.storage.get_storage() to get the configured backend.
+    """
+
+    # Only S3Service with CloudFront can issue signed cookies
+    use_signed_cookies = False
+
+    def generate_s3_key(self, user_id, project_id, filename):
+        """Generate unique storage path
+
+        Format: checkins/{user_id}/{project_id}/{timestamp}_{uuid}{extension}
+        """
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        unique_id = str(uuid.uuid4())[:8]
+        extension = os.path.splitext(filename)[1].lower()
+
+        # Ensure filename is safe
+        safe_filename = f"{timestamp}_{unique_id}{extension}"
+
+        return f"checkins/{user_id}/{project_id}/{safe_filename}"
+
+    @abstractmethod
+    def upload_file(self, file_data, s3_key, content_type):
+        """Store a file
+
+        Args:
+            file_data: File content
+            s3_key: Storage path
+            content_type: File MIME type
+
+        Returns:
+            s3_key: Storage path
+            file_size: File size
+        """
+
+    def upload_many(self, files):
+        """Store several files
+
+        Args:
+            files: List of (file_data, s3_key, content_type) tuples
+
+        Returns:
+            list: One dict per file, in input order, with keys
+                  s3_key, success, file_size and error (message or None)
+        """
+        results = []
+        for file_data, s3_key, content_type in files:
+            try:
+                _, file_size = self.upload_file(file_data, s3_key, content_type)
+                results.append({'s3_key': s3_key, 'success': True, 'file_size': file_size, 'error': None})
+            except Exception as e:
+                results.append({'s3_key': s3_key, 'success': False, 'file_size': 0, 'error': str(e)})
+        return results
+
+    @abstractmethod
+    def open_file(self, s3_key):
+        """Open a stored file for reading (e.g. to reprocess an image)
+
+        Args:
+            s3_key: Storage path
+
+        Returns:
+            file: Seekable binary file; the caller closes it
+        """
+
+    @abstractmethod
+    def get_file_url(self, s3_key, expires=None):
+        """Get a URL the browser can load the file from
+
+        Args:
+            s3_key: Storage path
+            expires: URL validity period (seconds), if the backend signs URLs
+
+        Returns:
+            url: File URL
+        """
+
+    def get_file_urls(self, s3_keys, expires=None):
+        """Get URLs for many files at once
+
+        Returns:
+            dict: {s3_key: url}
+        """
+        return {key: self.get_file_url(key, expires) for key in dict.fromkeys(s3_keys) if key}
+
+    def generate_presigned_url(self, s3_key, expires=3600):
+        """Alias for get_file_url method to maintain compatibility with templates"""
+        return self.get_file_url(s3_key, expires)
+
+    def get_thumbnail_url(self, original_key, expires=None, renditions=None):
+        """Get thumbnail URL for an image
+
+        Args:
+            original_key: Original image key
+            expires: URL validity period (seconds)
+            renditions: The image's recorded renditions (CheckInImage.renditions);
+                        the best one replaces the legacy thumbnail
+
+        Returns:
+            url: Thumbnail URL
+        """
+        return self.get_thumbnail_urls([original_key], expires, {original_key: renditions}).get(original_key)
+
+    def get_thumbnail_urls(self, original_keys, expires=None, renditions=None):
+        """Get thumbnail URLs for many images at once
+
+        Args:
+            original_keys: Iterable of original image keys
+            expires: URL validity period (seconds)
+            renditions: {original_key: renditions} for images that have them
+
+        Returns:
+            dict: {original_key: thumbnail_url}
+        """
+        sources = self.get_image_sources(original_keys, expires, renditions)
+        return {key: source['src'] for key, source in sources.items()}
+
+    def get_image_sources(self, original_keys, expires=None, renditions=None):
+        """Resolve everything an <img>/<picture> needs for many images in one batch
+
+        Images with renditions get the smallest JPEG rendition covering
+        THUMBNAIL_SIZE as src, plus a srcset per rendition content type.
+        Older images only have the legacy thumbnail.
+
+        Args:
+            original_keys: Iterable of original image keys
+            expires: URL validity period (seconds)
+            renditions: {original_key: renditions} for images that have them
+
+        Returns:
+            dict: {original_key: {'src': url, 'srcsets': {content_type: srcset},
+                   'aspect_ratio': width / height or None}}
+        """
+        renditions = renditions or {}
+        min_width = current_app.config.get('THUMBNAIL_SIZE', (300, 300))[0]
+
+        wanted = {}
+        for original_key in original_keys:
+            if not original_key:
+                continue
+            image_renditions = renditions.get(original_key)
+            if image_renditions:
+                best = self.best_rendition(image_renditions, min_width)
+                wanted[original_key] = (best['key'], image_renditions)
+            else:
+                wanted[original_key] = (self._thumbnail_key(original_key), [])
+
+        keys = [src_key for src_key, _ in wanted.values()]
+        keys.extend(rendition['key'] for _, image_renditions in wanted.values() for rendition in image_renditions)
+        urls = self.get_file_urls(keys, expires)
+
+        sources = {}
+        for original_key, (src_key, image_renditions) in wanted.items():
+            srcsets = {}
+            for rendition in image_renditions:
+                url = urls.get(rendition['key'])
+                if url:
+                    srcsets.setdefault(rendition['content_type'], []).append(f"{url} {rendition['width']}w")
+            largest = image_renditions[-1] if image_renditions else None
+            sources[original_key] = {
+                'src': urls.get(src_key),
+                'srcsets': {content_type: ', '.join(entries) for content_type, entries in srcsets.items()},
+                'aspect_ratio': largest['width'] / largest['height'] if largest else None
+            }
+        return sources
+
+    @staticmethod
+    def best_rendition(renditions, min_width, content_type='image/jpeg'):
+        """Smallest rendition of content_type at least min_width wide
+
+        Falls back to the largest one of that type, then to any rendition.
+        Renditions are recorded smallest first.
+        """
+        candidates = [r for r in renditions if r['content_type'] == content_type] or renditions
+        for rendition in candidates:
+            if rendition['width'] >= min_width:
+                return rendition
+        return candidates[-1]
+
+    def rendition_key(self, original_key, width, content_type):
+        """Storage path of a rendition, e.g. renditions/checkins/1/2/20250101_ab12cd34_640w.webp"""
+        extension = mimetypes.guess_extension(content_type) or ''
+        if extension == '.jpe':
+            extension = '.jpg'
+        return f"renditions/{os.path.splitext(original_key)[0]}_{width}w{extension}"
+
+    def serve_file(self, s3_key):
+        """Build a response for the media route
+
+        Only backends whose URLs point at the app itself serve files;
+        for the others the media route returns 404.
+
+        Returns:
+            flask.Response
+        """
+        abort(404)
+
+    @abstractmethod
+    def delete_file(self, s3_key):
+        """Delete a file
+
+        Returns:
+            bool: Whether deletion was successful
+        """
+
+    def delete_many(self, s3_keys):
+        """Delete several files
+
+        Returns:
+            list: Whether each deletion was successful, in input order
+        """
+        return [self.delete_file(s3_key) for s3_key in s3_keys]
+
+    def delete_keys(self, s3_keys):
+        """Delete many files
+
+        Returns:
+            list: Keys that could not be deleted
+        """
+        keys = list(dict.fromkeys(key for key in s3_keys if key))
+        return [key for key, deleted in zip(keys, self.delete_many(keys)) if not deleted]
+
+    def invalidate_all_urls(self):
+        """Drop every cached URL; a no-op for backends without a URL cache"""
+
+    def image_uploads(self, original_key, prepared):
+        """Files to store for an image prepared by prepare_image()
+
+        Args:
+            original_key: Storage path of the image
+            prepared: prepare_image() result
+
+        Returns:
+            tuple: (list of (file_data, s3_key, content_type) uploads,
+                    renditions to record on the CheckInImage or None)
+        """
+        uploads = [(prepared['data'], original_key, prepared['content_type'])]
+        if prepared['thumbnail']:
+            uploads.append((prepared['thumbnail'], self._thumbnail_key(original_key), 'image/jpeg'))
+
+        renditions = []
+        for rendition in prepared.get('renditions') or []:
+            key = self.rendition_key(original_key, rendition['width'], rendition['content_type'])
+            uploads.append((rendition['data'], key, rendition['content_type']))
+            renditions.append({
+                'key': key,
+                'width': rendition['width'],
+                'height': rendition['height'],
+                'content_type': rendition['content_type']
+            })
+        return uploads, renditions or None
+
+    def image_keys(self, original_keys, renditions=None):
+        """All storage paths of the given images: originals, thumbnails and renditions
+
+        Args:
+            original_keys: List of original image keys
+            renditions: Recorded renditions of the images (CheckInImage.renditions),
+                        one list per image
+
+        Returns:
+            list: Keys to delete when the images are removed
+        """
+        keys = []
+        for original_key in original_keys:
+            keys.append(original_key)
+            keys.append(self._thumbnail_key(original_key))
+        for image_renditions in renditions or []:
+            keys.extend(rendition['key'] for rendition in image_renditions or [])
+        return keys
+
+    def _thumbnail_key(self, original_key):
+        """Thumbnail storage path for an original image key"""
+        # Make sure we don't have multiple 'thumbnails/' prefixes
+        if original_key.startswith('thumbnails/'):
+            return original_key
+        return f"thumbnails/{original_key}"
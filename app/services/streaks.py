@@ -0,0 +1,252 @@
+"""
+Streak engine: recompute check-in streaks from the CheckIn table
+
+A streak is a run of consecutive UTC days with at least one check-in
+(several check-ins on one day count once). current_streak is the run
+ending at the user's last check-in, highest_streak the longest run.
+
+Two modes:
+
+- user_streaks() recomputes one user in one project with a
+  gaps-and-islands query: numbering the distinct days in order, day minus
+  row number is constant within a run of consecutive days. The database
+  returns one row per run instead of every check-in.
+- bulk_streaks() computes every user of a project, or of the whole
+  database, from one ordered scan of (user_id, project_id, day) rows.
+  The runs are found with array operations when NumPy is installed, and
+  with a plain loop otherwise.
+"""
+import logging
+from datetime import date, timedelta
+from sqlalchemy import Integer, cast, func, literal_column, select
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from app import db
+from app.models.models import CheckIn, UserProjectStat
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Day ordinals count from this date
+EPOCH = date(1970, 1, 1)
+
+# Rows fetched per round trip in bulk mode
+BULK_FETCH_SIZE = 100_000
+
+
+def day_ordinal(column, dialect_name):
+    """SQL expression numbering a DATE column in days, so consecutive days differ by 1
+
+    Returns None for databases it doesn't know.
+    """
+    if dialect_name == 'postgresql':
+        return column - literal_column("DATE '1970-01-01'")
+    if dialect_name in ('mysql', 'mariadb'):
+        return func.to_days(column) - 719528  # TO_DAYS('1970-01-01')
+    if dialect_name == 'sqlite':
+        return cast(func.julianday(column) - 2440587.5, Integer)  # julianday('1970-01-01')
+    return None
+
+
+def user_streaks(user_id, project_id):
+    """Recompute one user's stats in a project with a window-function query
+
+    Falls back to walking the distinct check-in days in Python on
+    databases without a day ordinal or without window functions.
+
+    Returns:
+        dict: total_checkins, current_streak, highest_streak and last_checkin_date
+    """
+    dialect_name = db.session.get_bind().dialect.name
+    day = day_ordinal(CheckIn.check_date, dialect_name)
+    runs = None
+    if day is None:
+        logger.warning(f"No day ordinal for {dialect_name}, walking days in Python")
+    else:
+        try:
+            # A savepoint, so a failed query doesn't roll back the caller's changes
+            with db.session.begin_nested():
+                runs = _runs_query(user_id, project_id, day)
+        except (OperationalError, ProgrammingError) as e:
+            logger.warning(f"Streak query not supported, walking days in Python: {e}")
+    if runs is None:
+        days = db.session.query(CheckIn.check_date, func.count(CheckIn.id)).filter(
+            CheckIn.user_id == user_id, CheckIn.project_id == project_id
+        ).group_by(CheckIn.check_date).order_by(CheckIn.check_date)
+        runs = _runs_from_days([((d - EPOCH).days, count) for d, count in days])
+
+    if not runs:
+        return {'total_checkins': 0, 'current_streak': 0, 'highest_streak': 0, 'last_checkin_date': None}
+    last_run = max(runs, key=lambda run: run[1])
+    return {
+        'total_checkins': sum(count for _, _, count in runs),
+        'current_streak': last_run[0],
+        'highest_streak': max(length for length, _, _ in runs),
+        'last_checkin_date': EPOCH + timedelta(days=last_run[1])
+    }
+
+
+def _runs_query(user_id, project_id, day):
+    """(length, last day ordinal, check-ins) of each run of consecutive days, computed by the database"""
+    day = day.label('day')
+    days = select(day, func.count().label('checkins')).where(
+        CheckIn.user_id == user_id, CheckIn.project_id == project_id
+    ).group_by(day).subquery()
+    islands = select(
+        days.c.day,
+        days.c.checkins,
+        (days.c.day - func.row_number().over(order_by=days.c.day)).label('island')
+    ).subquery()
+    runs = select(
+        func.count(), func.max(islands.c.day), func.sum(islands.c.checkins)
+    ).group_by(islands.c.island)
+    return [(length, last_day, checkins) for length, last_day, checkins in db.session.execute(runs)]
+
+
+def _runs_from_days(days):
+    """(length, last day, check-ins) of each run of consecutive days in an ascending list of (day, check-ins)"""
+    runs = []
+    for day, count in days:
+        if runs and day == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0] + 1, day, runs[-1][2] + count)
+        else:
+            runs.append((1, day, count))
+    return runs
+
+
+def bulk_streaks(project_id=None, use_numpy=None):
+    """Compute the stats of every user in a project, or in all projects
+
+    Reads (user_id, project_id, day) once, ordered, and finds all runs in
+    one pass.
+
+    Args:
+        project_id: Only this project, None for all
+        use_numpy: Use NumPy (default: when installed)
+
+    Returns:
+        dict: {(user_id, project_id): stats dict as returned by user_streaks()}
+    """
+    use_numpy = NUMPY_AVAILABLE if use_numpy is None else use_numpy
+    if use_numpy and not NUMPY_AVAILABLE:
+        raise RuntimeError('NumPy is not installed')
+
+    totals = db.session.query(CheckIn.user_id, CheckIn.project_id, func.count(CheckIn.id)).group_by(
+        CheckIn.user_id, CheckIn.project_id
+    )
+    days = db.session.query(CheckIn.user_id, CheckIn.project_id, CheckIn.check_date).distinct().order_by(
+        CheckIn.user_id, CheckIn.project_id, CheckIn.check_date
+    )
+    if project_id is not None:
+        totals = totals.filter(CheckIn.project_id == project_id)
+        days = days.filter(CheckIn.project_id == project_id)
+
+    stats = {
+        (user_id, pid): {'total_checkins': total, 'current_streak': 0, 'highest_streak': 0, 'last_checkin_date': None}
+        for user_id, pid, total in totals
+    }
+    rows = days.yield_per(BULK_FETCH_SIZE)
+    streaks = _bulk_streaks_numpy(rows) if use_numpy else _bulk_streaks_python(rows)
+    for key, (current, highest, last_day) in streaks:
+        entry = stats[key]
+        entry['current_streak'] = current
+        entry['highest_streak'] = highest
+        entry['last_checkin_date'] = EPOCH + timedelta(days=last_day)
+    return stats
+
+
+def _bulk_streaks_python(rows):
+    """Yield ((user_id, project_id), (current, highest, last day ordinal)) from ordered rows"""
+    key = None
+    current = highest = last_day = 0
+    for user_id, project_id, check_date in rows:
+        day = (check_date - EPOCH).days
+        if (user_id, project_id) != key:
+            if key is not None:
+                yield key, (current, highest, last_day)
+            key = (user_id, project_id)
+            current = highest = 0
+        elif day == last_day + 1:
+            current += 1
+            highest = max(highest, current)
+            last_day = day
+            continue
+        current = 1
+        highest = max(highest, 1)
+        last_day = day
+    if key is not None:
+        yield key, (current, highest, last_day)
+
+
+def _bulk_streaks_numpy(rows):
+    """_bulk_streaks_python() with the runs found by array operations"""
+    users = []
+    projects = []
+    days = []
+    for user_id, project_id, check_date in rows:
+        users.append(user_id)
+        projects.append(project_id)
+        days.append((check_date - EPOCH).days)
+    if not days:
+        return
+
+    users = np.asarray(users, dtype=np.int64)
+    projects = np.asarray(projects, dtype=np.int64)
+    days = np.asarray(days, dtype=np.int64)
+
+    # A new (user, project) pair starts where either id changes; a new run
+    # starts there too, and wherever the gap to the previous day isn't 1
+    new_pair = np.ones(len(days), dtype=bool)
+    new_pair[1:] = (users[1:] != users[:-1]) | (projects[1:] != projects[:-1])
+    new_run = new_pair.copy()
+    new_run[1:] |= np.diff(days) != 1
+
+    run_starts = np.flatnonzero(new_run)
+    run_lengths = np.diff(np.append(run_starts, len(days)))
+    run_pair = np.cumsum(new_pair)[run_starts] - 1
+
+    pair_starts = np.flatnonzero(new_pair)
+    first_run_of_pair = np.searchsorted(run_pair, np.arange(len(pair_starts)))
+    highest = np.maximum.reduceat(run_lengths, first_run_of_pair)
+    last_run_of_pair = np.append(first_run_of_pair[1:], len(run_starts)) - 1
+    current = run_lengths[last_run_of_pair]
+    last_index = np.append(pair_starts[1:], len(days)) - 1
+
+    for i, start in enumerate(pair_starts):
+        yield (int(users[start]), int(projects[start])), (int(current[i]), int(highest[i]), int(days[last_index[i]]))
+
+
+def rebuild_user_stats(project_id=None, use_numpy=None, batch_size=1000):
+    """Rewrite every UserProjectStat from the check-ins with bulk_streaks()
+
+    Rows without check-ins are reset to zero; missing rows are created.
+
+    Returns:
+        int: Number of UserProjectStat rows written
+    """
+    stats = bulk_streaks(project_id, use_numpy)
+
+    existing = db.session.query(UserProjectStat.id, UserProjectStat.user_id, UserProjectStat.project_id)
+    if project_id is not None:
+        existing = existing.filter(UserProjectStat.project_id == project_id)
+    empty = {'total_checkins': 0, 'current_streak': 0, 'highest_streak': 0, 'last_checkin_date': None}
+
+    updates = []
+    seen = set()
+    for row_id, user_id, pid in existing:
+        seen.add((user_id, pid))
+        updates.append(dict(stats.get((user_id, pid), empty), id=row_id))
+    inserts = [dict(entry, user_id=user_id, project_id=pid) for (user_id, pid), entry in stats.items()
+               if (user_id, pid) not in seen]
+
+    for start in range(0, len(updates), batch_size):
+        db.session.bulk_update_mappings(UserProjectStat, updates[start:start + batch_size])
+    for start in range(0, len(inserts), batch_size):
+        db.session.bulk_insert_mappings(UserProjectStat, inserts[start:start + batch_size])
+    db.session.commit()
+    return len(updates) + len(inserts)
@@ -0,0 +1,119 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Bounded, thread-safe LRU cache with per-entry freshness and validity
+
+    Each entry has two deadlines:
+    - fresh_until: until then the value is served without any lookup
+    - valid_until: after fresh_until the value is stale, but may still be
+      served as a fallback (e.g. a signed URL that has not expired yet)
+    Entries past valid_until are dropped.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Get a fresh value
+
+        Returns:
+            value or None if missing or stale
+        """
+        entry = self._get_entry(key)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    def get_stale(self, key):
+        """Get a value that is past its freshness but still valid
+
+        Returns:
+            value or None if missing or no longer valid
+        """
+        entry = self._get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def set(self, key, value, valid_for, ttl=None):
+        """Store a value
+
+        Args:
+            key: Cache key
+            value: Value to store
+            valid_for: Seconds the value stays usable as a stale fallback
+            ttl: Seconds the value stays fresh, capped at the cache TTL
+        """
+        now = time.monotonic()
+        fresh_for = min(self.ttl if ttl is None else min(ttl, self.ttl), valid_for)
+        with self._lock:
+            self._data[key] = (value, now + fresh_for, now + valid_for)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _get_entry(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[2] < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one execution
+
+    The first caller for a key runs the function; callers that arrive while
+    it is running wait for it and receive the same result.
+    """
+
+    def __init__(self, timeout=10):
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Run fn() once for all concurrent callers of key
+
+        Waiters that time out, or whose leader raised, get None.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = {'event': threading.Event(), 'result': None}
+                self._calls[key] = call
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            call['event'].wait(self.timeout)
+            return call['result']
+
+        try:
+            call['result'] = fn()
+            return call['result']
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call['event'].set()
@@ -300,7 +300,7 @@ function updateRecentCheckins(projectId) {
                             check.images.forEach(image => {
                                 html += `
                                     <a href="/checkin/image/${image.id}" class="gallery-image-link">
-                                        <img src="${image.thumbnail_url}" alt="Check-in image" class="gallery-image">
+                                        <img src="${image.thumbnail_url}" alt="Check-in image" class="gallery-image" data-image-id="${image.id}" data-image-status="${image.status}"${imageLayoutAttributes(image)} loading="lazy" decoding="async">
                                     </a>
                                 `;
                             });
@@ -321,6 +321,9 @@ function updateRecentCheckins(projectId) {
                     
                     // Re-apply the gallery enhancements
                     enhanceCheckInGalleries();
+                    
+                    // Swap in thumbnails once background processing finishes
+                    pollPendingImages();
                 } else {
                     // No check-ins
                     let html = '<p class="text-center">No recent check-ins yet.</p>';
@@ -337,6 +340,65 @@ function updateRecentCheckins(projectId) {
         });
 }
 
+// width/height reserve the image's box before it loads; the inline
+// placeholder is painted behind it until then
+function imageLayoutAttributes(image) {
+    let attributes = '';
+    if (image.width && image.height) {
+        attributes += ` width="${image.width}" height="${image.height}"`;
+    }
+    if (image.placeholder) {
+        attributes += ` style="background: center / cover no-repeat url('${image.placeholder}');"`;
+    }
+    return attributes;
+}
+
+// Poll the status of images that are still being processed in the background
+// and swap in their thumbnails once they are ready
+let pendingImagesTimer = null;
+function pollPendingImages(attempt = 0) {
+    clearTimeout(pendingImagesTimer);
+    pendingImagesTimer = null;
+    
+    const pendingImages = document.querySelectorAll('img[data-image-status="processing"]');
+    if (pendingImages.length === 0) {
+        return;
+    }
+    
+    const imageIds = [...new Set(Array.from(pendingImages, img => img.dataset.imageId))];
+    fetch(`/checkin/api/images/status?ids=${imageIds.join(',')}`)
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) {
+                return;
+            }
+            pendingImages.forEach(img => {
+                const image = data.images[img.dataset.imageId];
+                if (image && image.status !== 'processing') {
+                    if (image.placeholder) {
+                        img.style.background = `center / cover no-repeat url('${image.placeholder}')`;
+                    }
+                    img.src = image.thumbnail_url;
+                    img.dataset.imageStatus = image.status;
+                }
+            });
+        })
+        .catch(error => {
+            console.error('Error polling image status:', error);
+        })
+        .finally(() => {
+            // Back off from 2s to 10s between polls, give up after ~5 minutes
+            if (attempt < 40 && !pendingImagesTimer) {
+                const delay = Math.min(2000 + attempt * 500, 10000);
+                pendingImagesTimer = setTimeout(() => pollPendingImages(attempt + 1), delay);
+            }
+        });
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    pollPendingImages();
+});
+
 // Function to enhance image galleries - extracted to be reusable
 function enhanceCheckInGalleries() {
     // Find all thumbnail containers in the recent check-ins section
@@ -462,7 +524,9 @@ function submitCheckinWithImages(e) {
         if (data.success) {
             // Show success message
             let message = 'Check-in successful!';
-            if (data.images_added) {
+            if (data.images_processing) {
+                message += ` ${data.images_processing} image(s) are being processed.`;
+            } else if (data.images_added) {
                 message += ` Uploaded ${data.images_added} image(s).`;
             }
             showToast(message, 'success');
@@ -545,6 +609,7 @@ document.addEventListener('DOMContentLoaded', function() {
                         
                         // Enhance any image galleries in the new content
                         enhanceCheckInGalleries();
+                        pollPendingImages();
                     } else {
                         showToast(data.message || 'Failed to load check-ins', 'danger');
                     }
@@ -1,9 +1,16 @@
 # app/utils/image_utils.py
-from PIL import Image, ExifTags
+from PIL import Image, ImageChops, ImageFilter, ImageStat
 from io import BytesIO
 import os
+import math
+import base64
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from flask import current_app
 import logging
+from app.services.memory_budget import MemoryBudgetExceeded, get_decode_budget
 
 # Replace pyheif with pillow_heif
 try:
@@ -16,242 +23,694 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
-def process_image(image_data, max_width=1200, quality=100, format='JPEG'):
+# Process-wide pool for image processing, shared by all requests
+_image_pool = None
+_image_pool_pid = None
+_image_pool_lock = threading.Lock()
+
+# libheif decoding threads, applied to pillow_heif once per process
+_heif_threads = None
+_heif_threads_lock = threading.Lock()
+
+# Process-wide adaptive encoder, so chosen qualities are shared by all requests
+_image_encoder = None
+_image_encoder_pid = None
+_image_encoder_lock = threading.Lock()
+
+# EXIF orientation -> transpose that makes the image upright
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+CONTENT_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+    'AVIF': 'image/avif',
+}
+
+# Fast downscaling: resize() first shrinks by an integer factor with reduce()
+# while the image stays at least this many times larger than the target,
+# then finishes with LANCZOS (same trade-off as Image.thumbnail)
+REDUCING_GAP = 3.0
+
+# Longest side of the inline placeholder painted while an image loads; the
+# browser's upscaling blurs it. ~100-150 bytes as WebP, ~350 as JPEG.
+PLACEHOLDER_SIZE = 24
+
+def prepare_image(image_data, max_width=1200, thumbnail_size=None, quality=100, format='JPEG', fast=None,
+                  renditions=None, rendition_quality=80, encoder=None, max_pixels=None, budget=None,
+                  heif_direct=None):
     """
-    Process an image for storage:
-    1. Resize large images while maintaining aspect ratio
-    2. Optionally convert format
-    3. Handle EXIF rotation
-    4. Strip EXIF metadata for privacy
-    5. Preserve maximum original image quality
+    Decode an uploaded image once and derive everything that gets stored:
+    1. Decode the image (this also validates it)
+    2. Resize to max_width, then apply the EXIF orientation to the small result
+    3. Derive the renditions, or the thumbnail, from the resized image
+    4. Encode all of them without EXIF metadata
+    
+    Resizing before rotating means no full-resolution copy is made besides
+    the decoded image itself. With the fast path, JPEGs are not even decoded
+    at full resolution: the decoder scales them down by 2/4/8 (draft mode)
+    to no less than the target size, and resizing uses reduce() before the
+    final LANCZOS pass.
     
     Args:
-        image_data (bytes): Raw image data
-        max_width (int): Maximum width to resize to
+        image_data (bytes or file): Raw image data, or a readable, seekable
+                                    file (e.g. the spooled upload)
+        max_width (int): Maximum width of the stored image (after orientation)
+        thumbnail_size (tuple): (width, height) box, uses config default if None
         quality (int): JPEG/WebP quality (1-100)
         format (str): Target format ('JPEG', 'PNG', 'WEBP')
+        fast (bool): Use draft/reduce downscaling, defaults to IMAGE_FAST_DOWNSCALE
+        renditions (list): (width, format) pairs to render for srcset, e.g.
+                           [(320, 'WEBP'), (320, 'JPEG'), ...]; they replace
+                           the thumbnail
+        rendition_quality (int): Quality of the renditions
+        encoder (AdaptiveEncoder): Chooses the quality of each output instead
+                                   of quality/rendition_quality
+        max_pixels (int): Larger images are rejected before decoding,
+                          defaults to MAX_IMAGE_PIXELS
+        budget (MemoryBudget): Decode-memory budget the decoded pixels are
+                               reserved from, defaults to the process-wide one
+        heif_direct (bool): Decode HEIC/HEIF with libheif directly rather
+                            than through the Pillow plugin, defaults to
+                            IMAGE_HEIF_DECODE_THREADS being non-zero
         
     Returns:
-        tuple: (processed_image_data, new_content_type, width, height)
+        dict: data, content_type, width, height, thumbnail (bytes or None),
+              renditions (list of dicts with width, height, content_type and
+              data, smallest first) and placeholder (data: URI or None), or
+              None if the data is not a decodable image
+    
+    Raises:
+        MemoryBudgetExceeded: if the decode-memory budget had no room in time
     """
+    if thumbnail_size is None:
+        thumbnail_size = current_app.config.get('THUMBNAIL_SIZE', (300, 300))
+    if fast is None:
+        fast = current_app.config.get('IMAGE_FAST_DOWNSCALE', True)
+    if max_pixels is None:
+        max_pixels = current_app.config.get('MAX_IMAGE_PIXELS')
+    if budget is None:
+        budget = get_decode_budget()
+    if heif_direct is None:
+        heif_direct = heif_decode_threads() > 0
+    renditions = renditions or []
+    
+    # Renditions are derived from the resized image, so decode for the larger of the two
+    decode_width = max([max_width] + [width for width, _ in renditions])
+    img, orientation = _open_image(image_data, draft_width=decode_width if fast else None, max_pixels=max_pixels,
+                                   heif_direct=heif_direct)
+    if img is None:
+        return None
+    
+    # The decoded pixels count against the budget until only the resized image is left
+    weight = budget.acquire(_decoded_size(img))
     try:
-        # With pillow_heif registered, we can directly open HEIC files with PIL
-        img = Image.open(BytesIO(image_data))
-        
-        # Handle EXIF rotation but don't keep the EXIF data
-        img = correct_image_orientation(img)
-        
-        # Create a new image with same pixel data but no EXIF metadata
-        if format == 'JPEG' and img.mode == 'RGBA':
-            # Convert RGBA to RGB if saving as JPEG
-            clean_img = Image.new('RGB', img.size)
-        else:
-            clean_img = Image.new(img.mode, img.size)
-        
-        # Copy the pixel data (without metadata)
-        clean_img.paste(img)
-        
-        # Use our clean image from now on
-        img = clean_img
-        
-        # Get original dimensions
-        original_width, original_height = img.size
-        
-        # Resize if width exceeds max_width
-        if original_width > max_width:
-            ratio = max_width / original_width
-            new_height = int(original_height * ratio)
-            img = img.resize((max_width, new_height), Image.LANCZOS)
-        
-        # Save the processed image to bytes
-        output = BytesIO()
-        
-        # Save with appropriate format and settings, but no EXIF data
-        # Maximum quality (100) to preserve all original quality
-        if format == 'JPEG':
-            img.save(output, format=format, quality=quality, optimize=True, exif=bytes())
-            content_type = 'image/jpeg'
-        elif format == 'PNG':
-            img.save(output, format=format, optimize=True)
-            content_type = 'image/png'
-        elif format == 'WEBP':
-            img.save(output, format=format, quality=quality)
-            content_type = 'image/webp'
-        else:
-            # Default to JPEG
-            img.save(output, format='JPEG', quality=quality, optimize=True, exif=bytes())
-            content_type = 'image/jpeg'
-        
-        # Get current dimensions after processing
-        width, height = img.size
-        
-        # Get the processed image data
-        processed_data = output.getvalue()
-        
-        return processed_data, content_type, width, height
+        img = _load_image(img, format)
+        if img is None:
+            return None
+        upright = _render_upright(img, orientation, decode_width, fast)
+        del img
+    except Exception as e:
+        logger.error(f"Error processing image: {str(e)}")
+        return None
+    finally:
+        budget.release(weight)
     
+    try:
+        rendition = _fit_width(upright, max_width, fast)
+        data = _encode(rendition, format, quality, encoder)
     except Exception as e:
         logger.error(f"Error processing image: {str(e)}")
-        # Return original data on error
-        return image_data, None, None, None
+        return None
+    
+    encoded_renditions = []
+    thumbnail = None
+    if renditions:
+        try:
+            encoded_renditions = _render_renditions(upright, renditions, rendition_quality, fast, encoder)
+        except Exception as e:
+            logger.error(f"Error creating renditions: {str(e)}")
+    else:
+        try:
+            thumbnail = _encode(_fit_within(rendition, thumbnail_size, fast), 'JPEG', 95, encoder)
+        except Exception as e:
+            logger.error(f"Error creating thumbnail: {str(e)}")
+    
+    placeholder = None
+    try:
+        placeholder = image_placeholder(rendition)
+    except Exception as e:
+        logger.error(f"Error creating placeholder: {str(e)}")
+    
+    width, height = rendition.size
+    return {
+        'data': data,
+        'content_type': CONTENT_TYPES.get(format, 'image/jpeg'),
+        'width': width,
+        'height': height,
+        'thumbnail': thumbnail,
+        'renditions': encoded_renditions,
+        'placeholder': placeholder
+    }
 
-def correct_image_orientation(img):
+def image_placeholder(img):
     """
-    Correct image orientation based on EXIF data
+    Tiny inline version of an upright image, painted while the real one loads
     
     Args:
-        img: PIL Image object
+        img (PIL.Image): Upright image
         
     Returns:
-        PIL Image object with correct orientation
+        str: data: URI of a WebP (JPEG if this Pillow can't write WebP) at
+             most PLACEHOLDER_SIZE pixels on the longest side
     """
-    try:
-        # Extract EXIF data
-        exif = img._getexif()
-        
-        if (exif):
-            # Find orientation tag
-            orientation_key = None
-            for key, value in ExifTags.TAGS.items():
-                if value == 'Orientation':
-                    orientation_key = key
-                    break
-            
-            if orientation_key and orientation_key in exif:
-                orientation = exif[orientation_key]
-                
-                # Rotate based on orientation value
-                if orientation == 2:
-                    img = img.transpose(Image.FLIP_LEFT_RIGHT)
-                elif orientation == 3:
-                    img = img.rotate(180)
-                elif orientation == 4:
-                    img = img.transpose(Image.FLIP_TOP_BOTTOM)
-                elif orientation == 5:
-                    img = img.transpose(Image.FLIP_LEFT_RIGHT).rotate(90)
-                elif orientation == 6:
-                    img = img.rotate(270)
-                elif orientation == 7:
-                    img = img.transpose(Image.FLIP_LEFT_RIGHT).rotate(270)
-                elif orientation == 8:
-                    img = img.rotate(90)
-    
-    except (AttributeError, KeyError, IndexError) as e:
-        # Some images don't have EXIF data or have corrupt data
-        logger.warning(f"Error processing EXIF orientation: {str(e)}")
-    
-    return img
+    Image.init()  # WebP is registered lazily
+    format = 'WEBP' if 'WEBP' in Image.SAVE else 'JPEG'
+    small = _fit_within(img, (PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), fast=True)
+    if small.mode != 'RGB':
+        small = small.convert('RGB')
+    data = _encode_image(small, format, quality=40)
+    return f"data:{CONTENT_TYPES[format]};base64,{base64.b64encode(data).decode('ascii')}"
 
-def create_thumbnail(image_data, size=None):
+def image_metadata(image_data, max_pixels=None, budget=None):
     """
-    Create a thumbnail from image data
+    Dimensions and placeholder of an already processed image, e.g. one read
+    back from storage to backfill older CheckInImage rows
+    
+    Only the header is needed for the dimensions; JPEGs are then decoded at
+    1/8 scale for the placeholder.
     
     Args:
-        image_data (bytes): Raw image data
-        size (tuple): (width, height) for thumbnail, uses config default if None
+        image_data (bytes or file): Stored image
+        max_pixels (int): Reject larger images, defaults to MAX_IMAGE_PIXELS
+        budget (MemoryBudget): Decode-memory budget, defaults to the process-wide one
         
     Returns:
-        bytes: Thumbnail image data
+        dict: width, height and placeholder, or None if the data is not a decodable image
     """
-    if size is None:
-        size = current_app.config.get('THUMBNAIL_SIZE', (300, 300))
+    if max_pixels is None:
+        max_pixels = current_app.config.get('MAX_IMAGE_PIXELS')
+    if budget is None:
+        budget = get_decode_budget()
     
-    try:
-        # Open the image
-        img = Image.open(BytesIO(image_data))
-        
-        # Handle EXIF rotation
-        img = correct_image_orientation(img)
-        
-        # Create a clean image without EXIF data
-        if img.mode == 'RGBA':
-            clean_img = Image.new('RGB', img.size)
-        else:
-            clean_img = Image.new(img.mode, img.size)
-            
-        # Copy the pixel data (without metadata)
-        clean_img.paste(img)
-        img = clean_img
-        
-        # Create thumbnail (maintains aspect ratio)
-        img.thumbnail(size, Image.LANCZOS)
-        
-        # Save thumbnail to bytes
-        output = BytesIO()
-        
-        # Save optimized JPEG with no EXIF data - higher quality for thumbnails
-        img.save(output, format='JPEG', quality=95, optimize=True, exif=bytes())
-        
-        return output.getvalue()
+    img, orientation = _open_image(image_data, max_pixels=max_pixels)
+    if img is None:
+        return None
+    width, height = img.size
+    if orientation in (5, 6, 7, 8):
+        width, height = height, width
+    _draft(img, orientation, box=(PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
     
+    try:
+        with budget.reserve(_decoded_size(img)):
+            img = _load_image(img)
+            if img is None:
+                return None
+            img = _render_upright(img, orientation, PLACEHOLDER_SIZE, fast=True)
+        return {'width': width, 'height': height, 'placeholder': image_placeholder(img)}
+    except MemoryBudgetExceeded:
+        raise
     except Exception as e:
-        logger.error(f"Error creating thumbnail: {str(e)}")
+        logger.error(f"Error reading image metadata: {str(e)}")
         return None
 
-def get_image_dimensions(image_data):
+def rendition_config():
+    """Rendition set from IMAGE_RENDITION_WIDTHS x IMAGE_RENDITION_FORMATS
+    
+    Formats this Pillow build cannot write (e.g. AVIF without a plugin) are skipped.
+    
+    Returns:
+        list: (width, format) pairs, empty when renditions are disabled
     """
-    Get image dimensions from image data
+    widths = current_app.config.get('IMAGE_RENDITION_WIDTHS') or []
+    Image.init()  # Load all format plugins so Image.SAVE is complete
+    formats = []
+    for format in current_app.config.get('IMAGE_RENDITION_FORMATS') or []:
+        if format in CONTENT_TYPES and format in Image.SAVE:
+            formats.append(format)
+        else:
+            logger.warning(f"Image rendition format {format} is not supported, skipping it")
+    return [(int(width), format) for width in widths for format in formats]
+
+def _render_renditions(img, renditions, quality, fast=False, encoder=None):
+    """Encode (width, format) renditions of an upright image
+    
+    Widths beyond the image's own are rendered at its width, once. Each
+    width is resized from the next larger one, so every resize is cheap.
+    """
+    formats_by_width = {}
+    for width, format in renditions:
+        formats_by_width.setdefault(min(width, img.size[0]), []).append(format)
+    
+    encoded = {}
+    source = img
+    for width in sorted(formats_by_width, reverse=True):
+        source = _fit_width(source, width, fast)
+        encoded[width] = [{
+            'width': source.size[0],
+            'height': source.size[1],
+            'content_type': CONTENT_TYPES[format],
+            'data': _encode(source, format, quality, encoder)
+        } for format in dict.fromkeys(formats_by_width[width])]
+    return [rendition for width in sorted(encoded) for rendition in encoded[width]]
+
+def _get_image_pool():
+    """Get the process-wide image processing pool, built on first use
+    
+    Pillow releases the GIL while decoding, resampling and encoding, so
+    threads use several cores. The pool size (IMAGE_PROCESSING_THREADS,
+    default: CPU count) caps image work across all concurrent requests of
+    a worker process.
+    """
+    global _image_pool, _image_pool_pid
+    
+    pid = os.getpid()
+    if _image_pool_pid == pid:
+        return _image_pool
+    
+    with _image_pool_lock:
+        if _image_pool_pid != pid:
+            threads = int(current_app.config.get('IMAGE_PROCESSING_THREADS') or os.cpu_count() or 1)
+            _image_pool = ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix='image')
+            _image_pool_pid = pid
+        return _image_pool
+
+def heif_decode_threads():
+    """
+    libheif decoding threads per HEIC/HEIF image (IMAGE_HEIF_DECODE_THREADS)
+    
+    pillow_heif reads the thread count from a process-wide option, so it is
+    set here once, on first use, rather than per image, where concurrent
+    decodes would race on it.
+    
+    Returns:
+        int: Thread count; 0 means HEIC/HEIF go through the Pillow plugin
+    """
+    global _heif_threads
+    
+    if _heif_threads is not None:
+        return _heif_threads
+    
+    with _heif_threads_lock:
+        if _heif_threads is None:
+            threads = max(0, int(current_app.config.get('IMAGE_HEIF_DECODE_THREADS', 4)))
+            if threads and HEIC_SUPPORT:
+                pillow_heif.options.DECODE_THREADS = threads
+            _heif_threads = threads
+        return _heif_threads
+
+def prepare_images(images_data, timeout=None, **kwargs):
+    """Run prepare_image() on several images in parallel
     
     Args:
-        image_data (bytes): Raw image data
+        images_data (list): Raw image data (bytes or file) of each image
+        timeout (float): Seconds each image may take, counted from submission
+                         (including time spent waiting for a free thread);
+                         defaults to IMAGE_PROCESSING_TIMEOUT
+        **kwargs: Passed to prepare_image()
         
     Returns:
-        tuple: (width, height) or None if error
+        list: prepare_image() results in input order; None for images that
+              are invalid, failed or timed out
     """
-    try:
-        img = Image.open(BytesIO(image_data))
-        return img.size
-    except Exception as e:
-        logger.error(f"Error getting image dimensions: {str(e)}")
-        return None
+    if timeout is None:
+        timeout = float(current_app.config.get('IMAGE_PROCESSING_TIMEOUT', 20))
+    # Resolve config here; pool threads run without an app context
+    kwargs.setdefault('thumbnail_size', current_app.config.get('THUMBNAIL_SIZE', (300, 300)))
+    kwargs.setdefault('fast', current_app.config.get('IMAGE_FAST_DOWNSCALE', True))
+    kwargs.setdefault('renditions', rendition_config())
+    kwargs.setdefault('rendition_quality', current_app.config.get('IMAGE_RENDITION_QUALITY', 80))
+    kwargs.setdefault('encoder', get_image_encoder())
+    kwargs.setdefault('max_pixels', current_app.config.get('MAX_IMAGE_PIXELS') or 0)  # 0: no limit
+    kwargs.setdefault('budget', get_decode_budget())
+    kwargs.setdefault('heif_direct', heif_decode_threads() > 0)
+    
+    pool = _get_image_pool()
+    deadline = time.monotonic() + timeout
+    futures = [pool.submit(prepare_image, image_data, **kwargs) for image_data in images_data]
+    
+    results = []
+    for index, future in enumerate(futures):
+        try:
+            results.append(future.result(timeout=max(0, deadline - time.monotonic())))
+        except FutureTimeoutError:
+            # Frees the slot if the image hasn't started; a running one finishes unobserved
+            future.cancel()
+            logger.error(f"Image {index + 1} of {len(futures)} timed out after {timeout}s")
+            results.append(None)
+        except MemoryBudgetExceeded as e:
+            logger.error(f"Image {index + 1} of {len(futures)} skipped, decode memory exhausted: {str(e)}")
+            results.append(None)
+        except Exception as e:
+            logger.error(f"Error processing image {index + 1} of {len(futures)}: {str(e)}")
+            results.append(None)
+    return results
 
-def is_valid_image_old(file_data, allowed_extensions=None):
-    """Validate if data is a valid image"""
-    if allowed_extensions is None:
-        allowed_extensions = current_app.config.get(
-            'ALLOWED_IMAGE_EXTENSIONS', 
-            ['jpg', 'jpeg', 'png', 'gif', 'webp', 'heic', 'heif']
-        )
+def _open_image(image_data, draft_width=None, draft_box=None, max_pixels=None, heif_direct=False):
+    """
+    Parse an image header without decoding any pixel data
     
-    # With pillow_heif, we can use PIL directly for all formats
+    Args:
+        image_data (bytes or file): Raw image data
+        draft_width (int): Upright width the image will be shrunk to; JPEGs
+                           are then decoded at a reduced scale that is still
+                           at least that large
+        draft_box (tuple): Like draft_width, for fitting an upright (width, height) box
+        max_pixels (int): Reject images with more pixels (decompression bombs)
+        heif_direct (bool): Open HEIC/HEIF with pillow_heif directly instead
+                            of through the Pillow plugin
+    
+    Returns:
+        tuple: (unloaded PIL Image, or HeifImage for the HEIF fast path,
+               EXIF orientation) or (None, None) if unreadable or too large
+    """
     try:
-        img = Image.open(BytesIO(file_data))
-        img.verify()  # Verify it's an image
+        fp = _as_file(image_data)
+        if heif_direct and HEIC_SUPPORT and pillow_heif.is_supported(fp):
+            return _open_heif(fp, max_pixels)
         
-        # Check if format is allowed
-        format_lower = img.format.lower() if img.format else ""
-        if format_lower == "jpeg":
-            format_lower = "jpg"
-        elif format_lower == "heif":  # pillow_heif uses "heif" for both heic and heif
-            return any(ext.lower() in ['heic', 'heif'] for ext in allowed_extensions)
-            
-        return format_lower in [ext.lower() for ext in allowed_extensions]
+        # With pillow_heif registered, we can directly open HEIC files with PIL
+        img = Image.open(fp)
+        if max_pixels and img.size[0] * img.size[1] > max_pixels:
+            logger.warning(f"Image rejected: {img.size[0]}x{img.size[1]} exceeds {max_pixels} pixels")
+            return None, None
+        orientation = img.getexif().get(0x0112, 1)
+        if draft_width or draft_box:
+            _draft(img, orientation, draft_width, draft_box)
     except Exception as e:
-        # Special case for HEIC detection if pillow-heif fails
-        if HEIC_SUPPORT:
-            # Try checking file signature
-            try:
-                first_bytes = file_data[:12]
-                is_heic = (b'ftyp' in first_bytes and 
-                          (b'heic' in first_bytes or b'heix' in first_bytes or 
-                          b'hevc' in first_bytes or b'hevx' in first_bytes))
-                
-                if is_heic and any(ext.lower() in ['heic', 'heif'] for ext in allowed_extensions):
-                    logger.warning(f"HEIC identified by signature but not by PIL")
-                    return True
-            except Exception:
-                pass
-                
         logger.warning(f"Image validation error: {str(e)}")
-        return False
+        return None, None
+    return img, orientation
 
-''' 临时解决iPhone相册图片上传问题 '''
-def is_valid_image(image_data, allowed_extensions):
+def _open_heif(fp, max_pixels=None):
+    """
+    Open the primary image of a HEIC/HEIF file without going through Pillow
+    
+    Only the container is parsed here; the HEVC data is decoded on first
+    access to .data, by libheif using heif_decode_threads() threads (iPhone
+    photos are grids of 512px tiles, decoded in parallel). Thumbnails, depth maps and
+    other auxiliary images in the file are never decoded. libheif has no
+    reduced-scale decode like JPEG's draft mode.
+    
+    Returns:
+        tuple: (HeifImage, 1) or (None, None) if too large; libheif applies
+               the rotation and mirroring while decoding, so the pixels come
+               out upright
+    """
+    heif_file = pillow_heif.open_heif(fp, convert_hdr_to_8bit=True)
+    primary = heif_file[heif_file.primary_index]
+    width, height = primary.size
+    if max_pixels and width * height > max_pixels:
+        logger.warning(f"Image rejected: {width}x{height} exceeds {max_pixels} pixels")
+        return None, None
+    return primary, 1
+
+def _load_image(img, format='JPEG'):
+    """
+    Decode an opened image into a mode the target format can store
+    
+    Returns:
+        PIL Image or None if the pixel data is corrupt
+    """
     try:
-        # Try to open as image, which validates it's a real image
-        img = Image.open(BytesIO(image_data))
-        img.verify()  # Verify it's a valid image
-        return True
+        if isinstance(img, Image.Image):
+            img.load()
+        else:
+            # HEIF fast path: wrap libheif's output buffer, no EXIF or plugin handling
+            img = Image.frombuffer(img.mode, img.size, img.data, 'raw', img.mode, img.stride, 1)
     except Exception as e:
-        current_app.logger.error(f"Image validation error: {str(e)}")
-        return False
\ No newline at end of file
+        logger.warning(f"Image validation error: {str(e)}")
+        return None
+    
+    # JPEG only stores L/RGB/CMYK; alpha is dropped like the old paste onto RGB did
+    if format in ('JPEG', None) or format not in CONTENT_TYPES:
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+    elif img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+    
+    return img
+
+def _decoded_size(img):
+    """Bytes the pixels of an opened image take once decoded (width * height * bands)
+    
+    Read after draft(), so JPEGs are counted at their reduced decode size.
+    """
+    width, height = img.size
+    return width * height * Image.getmodebands(img.mode)
+
+def _as_file(image_data):
+    """A rewound file for Image.open: uploads are passed as files, other callers pass bytes"""
+    if hasattr(image_data, 'read'):
+        image_data.seek(0)
+        return image_data
+    return BytesIO(image_data)
+
+def _draft(img, orientation, width=None, box=None):
+    """Ask the JPEG decoder for the smallest 1/2, 1/4 or 1/8 scale still covering the target
+
+    A no-op for other formats.
+    """
+    stored_width, stored_height = img.size
+    swaps_axes = orientation in (5, 6, 7, 8)
+    upright_width, upright_height = (stored_height, stored_width) if swaps_axes else (stored_width, stored_height)
+    
+    if box is not None:
+        scale = min(box[0] / upright_width, box[1] / upright_height)
+    else:
+        scale = width / upright_width
+    if scale >= 1:
+        return
+    
+    requested = (math.ceil(stored_width * scale), math.ceil(stored_height * scale))
+    img.draft(None, requested)
+
+def _render_upright(img, orientation, max_width, fast=False):
+    """Resize so the upright width is at most max_width, then apply the orientation"""
+    transpose = ORIENTATION_TRANSPOSE.get(orientation)
+    swaps_axes = orientation in (5, 6, 7, 8)
+    
+    width, height = img.size
+    upright_width = height if swaps_axes else width
+    if upright_width > max_width:
+        ratio = max_width / upright_width
+        if swaps_axes:
+            size = (max(1, int(width * ratio)), max_width)
+        else:
+            size = (max_width, max(1, int(height * ratio)))
+        img = img.resize(size, Image.LANCZOS, reducing_gap=REDUCING_GAP if fast else None)
+    
+    if transpose is not None:
+        img = img.transpose(transpose)
+    return img
+
+def _fit_width(img, width, fast=False):
+    """Downscale to at most width, keeping the aspect ratio; never upscales"""
+    if img.size[0] <= width:
+        return img
+    return img.resize(
+        (width, max(1, round(img.size[1] * width / img.size[0]))),
+        Image.LANCZOS,
+        reducing_gap=REDUCING_GAP if fast else None
+    )
+
+def _fit_within(img, size, fast=False):
+    """Downscale to fit the (width, height) box, keeping the aspect ratio; never upscales"""
+    width, height = img.size
+    scale = min(size[0] / width, size[1] / height)
+    if scale >= 1:
+        return img
+    return img.resize(
+        (max(1, round(width * scale)), max(1, round(height * scale))),
+        Image.LANCZOS,
+        reducing_gap=REDUCING_GAP if fast else None
+    )
+
+def _encode_image(img, format='JPEG', quality=100):
+    """Encode without EXIF metadata"""
+    output = BytesIO()
+    if format == 'PNG':
+        img.save(output, format=format, optimize=True)
+    elif format in ('WEBP', 'AVIF'):
+        img.save(output, format=format, quality=quality)
+    else:
+        img.save(output, format='JPEG', quality=quality, optimize=True, exif=bytes())
+    return output.getvalue()
+
+def _encode(img, format, quality, encoder=None):
+    """Encode with the adaptive encoder if there is one (lossless PNG always uses _encode_image)"""
+    if encoder is None or format == 'PNG':
+        return _encode_image(img, format, quality)
+    return encoder.encode(img, format, max_quality=quality)
+
+def psnr(a, b):
+    """Peak signal-to-noise ratio between two same-sized images in dB (higher is closer)"""
+    stat = ImageStat.Stat(ImageChops.difference(a.convert('RGB'), b.convert('RGB')))
+    mse = sum(value / stat.count[0] for value in stat.sum2) / len(stat.sum2)
+    return float('inf') if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+class AdaptiveEncoder:
+    """
+    Chooses the JPEG/WebP quality of each output instead of a fixed setting
+    
+    Modes:
+    - budget: the highest quality whose output fits bytes_per_pixel bytes
+      per pixel (e.g. 0.25 -> ~270 KB at 1200x900, ~19 KB at 320x240)
+    - psnr: the lowest quality that stays at least min_psnr dB from the
+      uncompressed image
+    
+    Qualities are found by binary search between min_quality and
+    max_quality, or the lower cap the caller passes (so a rendition never
+    gets more bytes than its fixed quality would give it). The result is
+    cached per (format, size class, detail class, cap), where the detail
+    class is the edge density of a 64px preview.
+    Similar images then start from the cached quality and usually need a
+    single encode; only a cached quality that misses the target triggers a
+    new search.
+    """
+    
+    # A cached budget quality is kept while its output uses at least this share of the budget
+    MIN_BUDGET_USE = 0.8
+    
+    def __init__(self, mode='budget', bytes_per_pixel=0.25, min_psnr=40.0, min_quality=50, max_quality=95,
+                 cache_size=1024):
+        if mode not in ('budget', 'psnr'):
+            raise ValueError(f"Unknown encoder mode: {mode}")
+        self.mode = mode
+        self.bytes_per_pixel = bytes_per_pixel
+        self.min_psnr = min_psnr
+        self.min_quality = min_quality
+        self.max_quality = max_quality
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def encode(self, img, format='JPEG', max_quality=None):
+        """Encode img, choosing the quality for the configured target
+        
+        Args:
+            img: PIL Image
+            format (str): 'JPEG', 'WEBP' or 'AVIF'
+            max_quality (int): Upper bound below the encoder's own, e.g. the
+                               quality a rendition would get in fixed mode
+        
+        Returns:
+            bytes: Encoded image
+        """
+        high = min(self.max_quality, max_quality or self.max_quality)
+        key = self._cache_key(img, format) + (high,)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+        
+        if self.mode == 'budget':
+            budget = self.bytes_per_pixel * img.size[0] * img.size[1]
+            accept = lambda data: len(data) <= budget
+        else:
+            accept = lambda data: psnr(img, Image.open(BytesIO(data))) >= self.min_psnr
+        
+        if cached is not None:
+            data = _encode_image(img, format, cached)
+            if accept(data):
+                # In budget mode, a quality far below the budget means the cached class fits poorly
+                if self.mode == 'psnr' or len(data) >= self.MIN_BUDGET_USE * budget or cached >= high:
+                    self.hits += 1
+                    return data
+                quality, data = self._search(img, format, accept, cached + 1, high, best=(cached, data))
+            elif self.mode == 'budget':
+                quality, data = self._search(img, format, accept, self.min_quality, cached - 1, fallback=(cached, data))
+            else:
+                quality, data = self._search(img, format, accept, cached + 1, high, fallback=(cached, data))
+        else:
+            quality, data = self._search(img, format, accept, min(self.min_quality, high), high)
+        
+        self.misses += 1
+        with self._lock:
+            self._cache[key] = quality
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return data
+    
+    def _search(self, img, format, accept, low, high, best=None, fallback=None):
+        """Binary search [low, high] for the best accepted quality
+        
+        Budget mode wants the highest quality that is accepted (smaller
+        output at lower quality), psnr mode the lowest.
+        
+        Args:
+            best: (quality, data) already known to be accepted
+            fallback: (quality, data) already known to be rejected, just outside [low, high]
+        
+        Returns:
+            tuple: (quality, data); the quality closest to acceptable if none is
+        """
+        while low <= high:
+            quality = (low + high) // 2
+            data = _encode_image(img, format, quality)
+            if accept(data):
+                best = (quality, data)
+                if self.mode == 'budget':
+                    low = quality + 1
+                else:
+                    high = quality - 1
+            else:
+                fallback = (quality, data)
+                if self.mode == 'budget':
+                    high = quality - 1
+                else:
+                    low = quality + 1
+        
+        if best is not None:
+            return best
+        # Nothing met the target: the smallest (budget) or best (psnr) output tried
+        return fallback
+    
+    @staticmethod
+    def _cache_key(img, format):
+        """(format, size class, detail class) of an image
+        
+        Size classes are powers of two of the pixel count. The detail class
+        is the mean edge strength of a 64px grayscale preview, so flat
+        screenshots and noisy night shots don't share a quality.
+        """
+        preview = img.convert('L').resize((64, 64), Image.BILINEAR, reducing_gap=2.0)
+        detail = ImageStat.Stat(preview.filter(ImageFilter.FIND_EDGES)).mean[0]
+        size_class = int(math.log2(max(1, img.size[0] * img.size[1])))
+        return format, size_class, int(detail // 4)
+
+def get_image_encoder():
+    """Get the process-wide AdaptiveEncoder for IMAGE_ENCODE_MODE
+    
+    Returns:
+        AdaptiveEncoder or None in 'fixed' mode (use the configured qualities)
+    """
+    global _image_encoder, _image_encoder_pid
+    
+    pid = os.getpid()
+    if _image_encoder_pid == pid:
+        return _image_encoder
+    
+    with _image_encoder_lock:
+        if _image_encoder_pid != pid:
+            mode = current_app.config.get('IMAGE_ENCODE_MODE', 'budget')
+            _image_encoder = None if mode == 'fixed' else AdaptiveEncoder(
+                mode=mode,
+                bytes_per_pixel=float(current_app.config.get('IMAGE_BYTES_PER_PIXEL', 0.25)),
+                min_psnr=float(current_app.config.get('IMAGE_MIN_PSNR', 40.0)),
+                min_quality=int(current_app.config.get('IMAGE_MIN_QUALITY', 50)),
+                max_quality=int(current_app.config.get('IMAGE_MAX_QUALITY', 95))
+            )
+            _image_encoder_pid = pid
+        return _image_encoder
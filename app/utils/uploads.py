@@ -0,0 +1,85 @@
+# app/utils/uploads.py
+import os
+from tempfile import SpooledTemporaryFile
+from flask import Request, current_app
+
+
+class LimitedSpooledFile(SpooledTemporaryFile):
+    """
+    Buffer for one uploaded file that spools to disk and enforces a size limit
+
+    Werkzeug writes each multipart file part into the stream returned by
+    Request._get_file_stream while it parses the body. Parts up to
+    max_size stay in memory and larger ones move to a temporary file.
+    Once a part exceeds limit, the rest of it is read off the wire and
+    dropped instead of buffered. The part is marked oversized so the view
+    can skip it, and the other files of the request are still processed.
+    """
+
+    def __init__(self, max_size, limit=None):
+        """
+        Args:
+            max_size: Bytes kept in memory before spooling to a temporary file
+            limit: Maximum file size in bytes, None for no limit
+        """
+        super().__init__(max_size=max_size, mode='w+b')
+        self.limit = limit
+        self.size = 0
+        self.oversized = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.oversized:
+            return len(data)
+        if self.limit is not None and self.size > self.limit:
+            # Free what was buffered so far; the file is rejected anyway
+            self.oversized = True
+            self.seek(0)
+            self.truncate()
+            return len(data)
+        return super().write(data)
+
+
+class UploadRequest(Request):
+    """
+    Request class with streaming, size-checked file uploads
+
+    MAX_CONTENT_LENGTH caps the whole request body; Werkzeug answers 413
+    without reading a larger body. Each file is buffered in a
+    LimitedSpooledFile holding at most UPLOAD_SPOOL_THRESHOLD bytes in
+    memory and at most MAX_IMAGE_SIZE bytes in total.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        config = current_app.config
+        return LimitedSpooledFile(
+            max_size=int(config.get('UPLOAD_SPOOL_THRESHOLD', 1024 * 1024)),
+            limit=config.get('MAX_IMAGE_SIZE')
+        )
+
+
+def upload_size(file_storage):
+    """Size of an uploaded file in bytes, including any part dropped for being too large
+
+    Args:
+        file_storage: werkzeug FileStorage
+
+    Returns:
+        int: File size
+    """
+    stream = file_storage.stream
+    if isinstance(stream, LimitedSpooledFile):
+        return stream.size
+
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+
+def upload_stream(file_storage):
+    """The uploaded file's buffer, rewound, to hand to the image pipeline without copying it"""
+    stream = file_storage.stream
+    stream.seek(0)
+    return stream
@@ -13,22 +13,68 @@ class Config:
     TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN', '')
     TELEGRAM_BOT_USERNAME = os.environ.get('TELEGRAM_BOT_USERNAME', '')
     
+    # Image storage backend: s3, local (single-node installs) or memory (tests, benchmarks)
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 's3')
+    LOCAL_STORAGE_PATH = os.environ.get('LOCAL_STORAGE_PATH', '')  # Defaults to instance/uploads
+    
     # AWS S3 configuration
     AWS_ACCESS_KEY = os.environ.get('AWS_ACCESS_KEY', '')
     AWS_SECRET_KEY = os.environ.get('AWS_SECRET_KEY', '')
     AWS_REGION = os.environ.get('AWS_REGION', '')
     S3_BUCKET_NAME = os.environ.get('S3_BUCKET_NAME', '')
+    S3_MAX_POOL_CONNECTIONS = int(os.environ.get('S3_MAX_POOL_CONNECTIONS', 20))  # botocore HTTP pool size per worker
+    S3_IO_CONCURRENCY = int(os.environ.get('S3_IO_CONCURRENCY', 10))  # Parallel S3 uploads/deletes per worker
+    S3_OBJECT_CACHE_CONTROL = os.environ.get('S3_OBJECT_CACHE_CONTROL', 'public, max-age=31536000, immutable')  # Keys are unique per upload; signatures guard access
     
     # AWS CloudFront configuration
     USE_CLOUDFRONT = os.environ.get('USE_CLOUDFRONT', 'False').lower() in ('true', '1', 't', 'yes')
     CLOUDFRONT_DOMAIN = os.environ.get('CLOUDFRONT_DOMAIN', '')
     CLOUDFRONT_KEY_PAIR_ID = os.environ.get('CLOUDFRONT_KEY_PAIR_ID', '')
     CLOUDFRONT_PRIVATE_KEY_PATH = os.environ.get('CLOUDFRONT_PRIVATE_KEY_PATH', '')
+    # Signed-cookie mode: one cookie per path instead of a signature per image URL.
+    # Requires the distribution to be served from a subdomain of CLOUDFRONT_COOKIE_DOMAIN.
+    CLOUDFRONT_SIGNED_COOKIES = os.environ.get('CLOUDFRONT_SIGNED_COOKIES', 'False').lower() in ('true', '1', 't', 'yes')
+    CLOUDFRONT_COOKIE_DOMAIN = os.environ.get('CLOUDFRONT_COOKIE_DOMAIN', '')  # e.g. .example.com
+    CLOUDFRONT_COOKIE_PATHS = os.environ.get('CLOUDFRONT_COOKIE_PATHS', 'checkins/*,thumbnails/checkins/*,renditions/checkins/*')
+    CLOUDFRONT_COOKIE_TTL = int(os.environ.get('CLOUDFRONT_COOKIE_TTL', 24 * 60 * 60))  # Seconds
     
     # Image processing configuration
     MAX_IMAGE_SIZE = int(os.environ.get('MAX_IMAGE_SIZE', 5 * 1024 * 1024))  # 5MB default
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 32 * 1024 * 1024))  # Whole request body; larger requests get a 413
+    UPLOAD_SPOOL_THRESHOLD = int(os.environ.get('UPLOAD_SPOOL_THRESHOLD', 1024 * 1024))  # Uploaded files above this are buffered on disk
+    MAX_IMAGE_PIXELS = int(os.environ.get('MAX_IMAGE_PIXELS', 60_000_000))  # Checked from the header; larger images are rejected undecoded
     ALLOWED_IMAGE_EXTENSIONS = ['jpg', 'jpeg', 'png', 'gif', 'webp', 'heic', 'heif']  # Add iPhone formats
     THUMBNAIL_SIZE = (300, 300)  # Default thumbnail dimensions
+    # Let the JPEG decoder downscale by 2/4/8 and use reduce() before the final LANCZOS pass
+    IMAGE_FAST_DOWNSCALE = os.environ.get('IMAGE_FAST_DOWNSCALE', 'True').lower() in ('true', '1', 't', 'yes')
+    IMAGE_PROCESSING_THREADS = int(os.environ.get('IMAGE_PROCESSING_THREADS', 0))  # Images processed at once per worker process, 0 = CPU count
+    IMAGE_PROCESSING_TIMEOUT = float(os.environ.get('IMAGE_PROCESSING_TIMEOUT', 20))  # Seconds per image, including waiting for a thread
+    # Cap on decoded pixel memory (width * height * bands) per process; further decodes queue for room
+    IMAGE_DECODE_MEMORY_BUDGET = int(os.environ.get('IMAGE_DECODE_MEMORY_BUDGET', 512 * 1024 * 1024))
+    IMAGE_DECODE_WAIT_TIMEOUT = float(os.environ.get('IMAGE_DECODE_WAIT_TIMEOUT', 10))  # Seconds to queue for room, 0 = fail fast
+    # HEIC/HEIF are decoded by libheif directly with this many threads (tiles in parallel); 0 = through the Pillow plugin
+    IMAGE_HEIF_DECODE_THREADS = int(os.environ.get('IMAGE_HEIF_DECODE_THREADS', 4))
+    # Responsive renditions for srcset, rendered from the same decode; empty widths = legacy 300px thumbnail only
+    IMAGE_RENDITION_WIDTHS = [int(w) for w in os.environ.get('IMAGE_RENDITION_WIDTHS', '320,640,1200').split(',') if w.strip()]
+    IMAGE_RENDITION_FORMATS = [f.strip().upper() for f in os.environ.get('IMAGE_RENDITION_FORMATS', 'WEBP,JPEG').split(',') if f.strip()]
+    IMAGE_RENDITION_QUALITY = int(os.environ.get('IMAGE_RENDITION_QUALITY', 80))
+    # Encoder quality: budget (fit IMAGE_BYTES_PER_PIXEL), psnr (stay above IMAGE_MIN_PSNR dB) or fixed (the qualities above)
+    IMAGE_ENCODE_MODE = os.environ.get('IMAGE_ENCODE_MODE', 'budget')
+    IMAGE_BYTES_PER_PIXEL = float(os.environ.get('IMAGE_BYTES_PER_PIXEL', 0.25))
+    IMAGE_MIN_PSNR = float(os.environ.get('IMAGE_MIN_PSNR', 40.0))
+    IMAGE_MIN_QUALITY = int(os.environ.get('IMAGE_MIN_QUALITY', 50))
+    IMAGE_MAX_QUALITY = int(os.environ.get('IMAGE_MAX_QUALITY', 95))
+    
+    # Background image processing: inline (in the request) or queue (flask process-images workers)
+    IMAGE_PROCESSING_MODE = os.environ.get('IMAGE_PROCESSING_MODE', 'inline')
+    IMAGE_STAGING_PATH = os.environ.get('IMAGE_STAGING_PATH', '')  # Shared by web and workers, defaults to instance/staging
+    IMAGE_QUEUE_MAX_DEPTH = int(os.environ.get('IMAGE_QUEUE_MAX_DEPTH', 500))  # Queued images before uploads get a 503
+    IMAGE_QUEUE_RETRY_AFTER = int(os.environ.get('IMAGE_QUEUE_RETRY_AFTER', 30))  # Seconds, sent with the 503
+    IMAGE_WORKER_PROCESSES = int(os.environ.get('IMAGE_WORKER_PROCESSES', 2))
+    IMAGE_WORKER_POLL_INTERVAL = float(os.environ.get('IMAGE_WORKER_POLL_INTERVAL', 1.0))  # Seconds between polls of an empty queue
+    IMAGE_WORKER_LEASE = int(os.environ.get('IMAGE_WORKER_LEASE', 300))  # Seconds before a crashed worker's image is retried
+    IMAGE_MAX_ATTEMPTS = int(os.environ.get('IMAGE_MAX_ATTEMPTS', 3))
+    IMAGE_STAGING_MAX_AGE = int(os.environ.get('IMAGE_STAGING_MAX_AGE', 7 * 24 * 60 * 60))  # Seconds before orphaned staged uploads are removed
     
     # Backup configuration
     AUTO_BACKUP_ENABLED = os.environ.get('AUTO_BACKUP_ENABLED', 'True').lower() in ('true', '1', 't')
@@ -37,6 +83,7 @@ class Config:
     # Miscellaneous
     TIMEZONE_DEFAULT = os.environ.get('TIMEZONE_DEFAULT', 'UTC')
     ITEMS_PER_PAGE = int(os.environ.get('ITEMS_PER_PAGE', 10))
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')  # /metrics requires "Authorization: Bearer <token>"; disabled if unset
     
     # Redis configuration for URL caching
     REDIS_HOST = os.environ.get('REDIS_HOST')
@@ -45,6 +92,23 @@ class Config:
     REDIS_SSL = os.environ.get('REDIS_SSL', 'False').lower() == 'true'
     REDIS_DB = int(os.environ.get('REDIS_DB', 0))
     REDIS_URL = os.environ.get('REDIS_URL')
+    REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 50))  # Shared pool size per worker
+    REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 0.8))  # Seconds
+    
+    # In-process URL cache in front of Redis
+    URL_LOCAL_CACHE_SIZE = int(os.environ.get('URL_LOCAL_CACHE_SIZE', 10000))  # Max URLs per worker
+    URL_LOCAL_CACHE_TTL = int(os.environ.get('URL_LOCAL_CACHE_TTL', 300))  # Seconds before re-checking Redis
+    URL_CACHE_GENERATION_REFRESH = int(os.environ.get('URL_CACHE_GENERATION_REFRESH', 30))  # Seconds
+    URL_EXPIRY_BUCKET = int(os.environ.get('URL_EXPIRY_BUCKET', 86400))  # Align URL expiry to buckets of this many seconds (0 disables)
+    
+    # Redis circuit breaker
+    REDIS_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('REDIS_BREAKER_FAILURE_THRESHOLD', 3))  # Consecutive failures before skipping Redis
+    REDIS_BREAKER_PROBE_INTERVAL = float(os.environ.get('REDIS_BREAKER_PROBE_INTERVAL', 1.0))  # Seconds, doubles after each failed probe
+    REDIS_BREAKER_MAX_PROBE_INTERVAL = float(os.environ.get('REDIS_BREAKER_MAX_PROBE_INTERVAL', 30.0))  # Seconds
+    
+    # Project leaderboards
+    LEADERBOARD_SIZE = int(os.environ.get('LEADERBOARD_SIZE', 10))  # Entries per leaderboard
+    LEADERBOARD_REDIS_TTL = int(os.environ.get('LEADERBOARD_REDIS_TTL', 3600))  # Seconds before the Redis sorted sets are rebuilt
 
 class DevelopmentConfig(Config):
     # Development-specific settings
@@ -0,0 +1,34 @@
+"""Add processing state to checkin images
+
+Revision ID: 3c1e7a9d2b40
+Revises: fdd889c742ea
+Create Date: 2026-10-18 10:12:31.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1e7a9d2b40'
+down_revision = 'fdd889c742ea'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('checkin_images', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('status', sa.String(length=20), nullable=False, server_default='ready'))
+        batch_op.add_column(sa.Column('staged_path', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('claimed_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.create_index(batch_op.f('ix_checkin_images_status'), ['status'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('checkin_images', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_checkin_images_status'))
+        batch_op.drop_column('attempts')
+        batch_op.drop_column('claimed_at')
+        batch_op.drop_column('staged_path')
+        batch_op.drop_column('status')
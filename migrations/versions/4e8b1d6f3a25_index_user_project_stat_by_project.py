@@ -0,0 +1,28 @@
+"""Index user project stats by project
+
+Revision ID: 4e8b1d6f3a25
+Revises: 9d4a6c2e5f17
+Create Date: 2026-10-18 18:22:10.517264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4e8b1d6f3a25'
+down_revision = '9d4a6c2e5f17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user_project_stat', schema=None) as batch_op:
+        batch_op.create_index('ix_user_project_stat_project_last_checkin', ['project_id', 'last_checkin_date'], unique=False)
+        batch_op.create_index('ix_user_project_stat_project_highest_streak', ['project_id', 'highest_streak'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user_project_stat', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_project_stat_project_highest_streak')
+        batch_op.drop_index('ix_user_project_stat_project_last_checkin')
@@ -0,0 +1,26 @@
+"""Index check-ins by user, project and date
+
+Revision ID: 6a3f9c1d8e42
+Revises: 4e8b1d6f3a25
+Create Date: 2026-10-18 19:40:52.204118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6a3f9c1d8e42'
+down_revision = '4e8b1d6f3a25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('check_in', schema=None) as batch_op:
+        batch_op.create_index('ix_check_in_user_project_date', ['user_id', 'project_id', 'check_date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('check_in', schema=None) as batch_op:
+        batch_op.drop_index('ix_check_in_user_project_date')
@@ -0,0 +1,26 @@
+"""Add renditions to checkin images
+
+Revision ID: 7b2f4e8c1a93
+Revises: 3c1e7a9d2b40
+Create Date: 2026-10-18 13:40:08.215533
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b2f4e8c1a93'
+down_revision = '3c1e7a9d2b40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('checkin_images', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('renditions', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('checkin_images', schema=None) as batch_op:
+        batch_op.drop_column('renditions')
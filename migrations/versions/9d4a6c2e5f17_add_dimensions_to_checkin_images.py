@@ -0,0 +1,30 @@
+"""Add dimensions and placeholder to checkin images
+
+Revision ID: 9d4a6c2e5f17
+Revises: 7b2f4e8c1a93
+Create Date: 2026-10-18 16:05:42.381907
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4a6c2e5f17'
+down_revision = '7b2f4e8c1a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('checkin_images', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('width', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('height', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('placeholder', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('checkin_images', schema=None) as batch_op:
+        batch_op.drop_column('placeholder')
+        batch_op.drop_column('height')
+        batch_op.drop_column('width')
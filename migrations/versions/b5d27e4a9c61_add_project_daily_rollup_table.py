@@ -0,0 +1,34 @@
+"""Add project daily rollup table
+
+Revision ID: b5d27e4a9c61
+Revises: 6a3f9c1d8e42
+Create Date: 2026-10-18 20:31:07.618350
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d27e4a9c61'
+down_revision = '6a3f9c1d8e42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('project_daily_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('project_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('checkins', sa.Integer(), nullable=False),
+    sa.Column('distinct_users', sa.Integer(), nullable=False),
+    sa.Column('latest_users', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('project_id', 'day', name='uq_project_daily_rollup')
+    )
+    # Existing check-ins are rolled up by `flask rebuild-stats`
+
+
+def downgrade():
+    op.drop_table('project_daily_rollup')
@@ -0,0 +1,33 @@
+"""Add user calendar table
+
+Revision ID: c8e41f7b2d93
+Revises: b5d27e4a9c61
+Create Date: 2026-10-18 21:12:44.905127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8e41f7b2d93'
+down_revision = 'b5d27e4a9c61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_calendar',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('project_id', sa.Integer(), nullable=False),
+    sa.Column('year', sa.Integer(), nullable=False),
+    sa.Column('days', sa.LargeBinary(length=46), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'project_id', 'year', name='uq_user_calendar')
+    )
+    # Existing check-ins are filled in by `flask rebuild-stats`
+
+
+def downgrade():
+    op.drop_table('user_calendar')
@@ -0,0 +1,28 @@
+"""Index user project stats for leaderboards
+
+Revision ID: e7a19d3c5b28
+Revises: c8e41f7b2d93
+Create Date: 2026-10-18 22:03:51.330846
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a19d3c5b28'
+down_revision = 'c8e41f7b2d93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user_project_stat', schema=None) as batch_op:
+        batch_op.create_index('ix_user_project_stat_project_current_streak', ['project_id', 'current_streak'], unique=False)
+        batch_op.create_index('ix_user_project_stat_project_total_checkins', ['project_id', 'total_checkins'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user_project_stat', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_project_stat_project_total_checkins')
+        batch_op.drop_index('ix_user_project_stat_project_current_streak')
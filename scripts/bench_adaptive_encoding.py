@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# scripts/bench_adaptive_encoding.py
+"""
+Benchmark for adaptive image encoding over a sample corpus.
+
+Runs prepare_image() with the configured renditions on every image, once
+per encoder setting, and reports bytes stored and encode time:
+
+- fixed:        q100 full image, IMAGE_RENDITION_QUALITY renditions (the old behaviour)
+- budget cold:  AdaptiveEncoder in budget mode with an empty quality cache
+- budget warm:  the same encoder again, with the qualities cached by the first pass
+- psnr:         AdaptiveEncoder in psnr mode
+
+Fidelity is the PSNR of each full image against the fixed (q100) one.
+Without --corpus, a synthetic corpus of photos, screenshots and noisy
+shots is generated.
+
+Usage:
+    python scripts/bench_adaptive_encoding.py [--corpus DIR] [--count 12]
+"""
+import os
+import sys
+import time
+import argparse
+from io import BytesIO
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw, ImageFilter
+
+
+def synthetic_corpus(count):
+    """JPEGs of varying size and detail, from flat screenshots to noisy night shots"""
+    corpus = []
+    for i in range(count):
+        size = [(4032, 3024), (3024, 4032), (1920, 1080), (1170, 2532)][i % 4]
+        noise = [4, 12, 24, 48][(i // 4) % 4]
+        img = Image.merge('RGB', (
+            Image.radial_gradient('L').resize(size),
+            Image.effect_noise(size, noise).filter(ImageFilter.GaussianBlur(3 + 2 * (i % 3))),
+            Image.linear_gradient('L').resize(size)
+        ))
+        draw = ImageDraw.Draw(img)
+        for j in range(0, size[0], 97 + 13 * i):
+            draw.line([(j, 0), (size[0] - j, size[1])], fill=(255, 255 - j % 255, j % 255), width=3)
+        output = BytesIO()
+        img.save(output, format='JPEG', quality=92)
+        corpus.append((f"synthetic-{i:02d}.jpg", output.getvalue()))
+    return corpus
+
+
+def load_corpus(directory):
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                corpus.append((name, f.read()))
+    return corpus
+
+
+def run(label, corpus, renditions, encoder, rendition_quality, reference=None):
+    from app.utils.image_utils import prepare_image, psnr
+
+    total_bytes = 0
+    full_bytes = 0
+    fidelity = []
+    outputs = []
+    start = time.perf_counter()
+    for name, data in corpus:
+        result = prepare_image(data, renditions=renditions, rendition_quality=rendition_quality, encoder=encoder)
+        if result is None:
+            print(f"  skipped {name}: not an image")
+            outputs.append(None)
+            continue
+        outputs.append(result['data'])
+        full_bytes += len(result['data'])
+        total_bytes += len(result['data']) + sum(len(r['data']) for r in result['renditions'])
+    elapsed = time.perf_counter() - start
+
+    if reference is not None:
+        for data, reference_data in zip(outputs, reference):
+            if data is not None and reference_data is not None:
+                fidelity.append(psnr(Image.open(BytesIO(data)), Image.open(BytesIO(reference_data))))
+
+    line = (f"{label:<12} {total_bytes / 1024:8.0f} KB (full {full_bytes / 1024:6.0f} KB)"
+            f"  {elapsed * 1000 / len(corpus):7.1f} ms/image")
+    if fidelity:
+        line += f"  PSNR mean {sum(fidelity) / len(fidelity):5.1f} dB, min {min(fidelity):5.1f} dB"
+    if encoder is not None:
+        line += f"  cache hits {encoder.hits}/{encoder.hits + encoder.misses}"
+    print(line)
+    return total_bytes, elapsed, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help='Directory of sample images (default: synthetic corpus)')
+    parser.add_argument('--count', type=int, default=12, help='Size of the synthetic corpus')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.count)
+
+    from app import create_app
+    from app.utils.image_utils import AdaptiveEncoder, rendition_config
+
+    app = create_app()
+    app.logger.setLevel('WARNING')
+    with app.app_context():
+        config = app.config
+        renditions = rendition_config()
+        quality = config.get('IMAGE_RENDITION_QUALITY', 80)
+        print(f"{len(corpus)} images, renditions {sorted({w for w, _ in renditions})} x {sorted({f for _, f in renditions})}")
+
+        fixed_bytes, fixed_time, reference = run('fixed', corpus, renditions, None, quality)
+
+        def new_encoder(mode):
+            return AdaptiveEncoder(
+                mode=mode,
+                bytes_per_pixel=config.get('IMAGE_BYTES_PER_PIXEL', 0.25),
+                min_psnr=config.get('IMAGE_MIN_PSNR', 40.0),
+                min_quality=config.get('IMAGE_MIN_QUALITY', 50),
+                max_quality=config.get('IMAGE_MAX_QUALITY', 95)
+            )
+
+        budget = new_encoder('budget')
+        results = [
+            ('budget cold', run('budget cold', corpus, renditions, budget, quality, reference)),
+            ('budget warm', run('budget warm', corpus, renditions, budget, quality, reference)),
+            ('psnr', run('psnr', corpus, renditions, new_encoder('psnr'), quality, reference)),
+        ]
+
+    print()
+    for label, (total_bytes, elapsed, _) in results:
+        print(f"{label:<12} saves {100 * (1 - total_bytes / fixed_bytes):5.1f}% of bytes, "
+              f"encode time {elapsed / fixed_time:4.2f}x of fixed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# scripts/bench_cloudfront_signing.py
+"""
+Micro-benchmark for CloudFront URL signing on a cold URL cache.
+
+Compares the old behaviour (read + parse the PEM key and build a new
+CloudFrontSigner for every URL) with the cached signer used by S3Service.
+A throwaway RSA key is generated, so no AWS access is needed.
+
+Usage:
+    python scripts/bench_cloudfront_signing.py [--iterations 2000]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from botocore.signers import CloudFrontSigner
+
+CLOUDFRONT_DOMAIN = 'bench.cloudfront.net'
+KEY_PAIR_ID = 'KBENCHMARK'
+
+
+def write_test_key(directory):
+    """Generate a 2048-bit RSA key like the ones CloudFront key groups use"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+    path = os.path.join(directory, 'pk-bench.pem')
+    with open(path, 'wb') as f:
+        f.write(key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.TraditionalOpenSSL,
+            encryption_algorithm=serialization.NoEncryption()
+        ))
+    return path
+
+
+def sign_uncached(key_path, s3_key):
+    """The pre-cache code path: load the key and build a signer per URL"""
+    with open(key_path, 'rb') as key_file:
+        private_key = serialization.load_pem_private_key(
+            key_file.read(),
+            password=None,
+            backend=default_backend()
+        )
+
+    def rsa_signer(message):
+        return private_key.sign(message, padding.PKCS1v15(), hashes.SHA1())
+
+    signer = CloudFrontSigner(KEY_PAIR_ID, rsa_signer)
+    return signer.generate_presigned_url(
+        f"https://{CLOUDFRONT_DOMAIN}/{s3_key}",
+        date_less_than=datetime.utcnow() + timedelta(days=30)
+    )
+
+
+def run(label, fn, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(f"checkins/1/1/20250101000000_{i:08d}.jpg")
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {iterations / elapsed:10.1f} URLs/s  ({elapsed * 1000 / iterations:.3f} ms/URL)")
+    return iterations / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        key_path = write_test_key(tmp)
+
+        # Configure the app for signed CloudFront URLs without Redis,
+        # so every call is a cache miss
+        os.environ.update({
+            'AWS_REGION': os.environ.get('AWS_REGION') or 'us-east-1',
+            'S3_BUCKET_NAME': os.environ.get('S3_BUCKET_NAME') or 'bench-bucket',
+            'USE_CLOUDFRONT': 'True',
+            'CLOUDFRONT_DOMAIN': CLOUDFRONT_DOMAIN,
+            'CLOUDFRONT_KEY_PAIR_ID': KEY_PAIR_ID,
+            'CLOUDFRONT_PRIVATE_KEY_PATH': key_path,
+        })
+        for var in ('REDIS_HOST', 'REDIS_URL'):
+            os.environ.pop(var, None)
+
+        from app import create_app
+        from app.services.s3_service import S3Service
+
+        app = create_app()
+        app.logger.setLevel('WARNING')
+        with app.app_context():
+            s3_service = S3Service()
+            before = run('before', lambda k: sign_uncached(key_path, k), args.iterations)
+            after = run('after', s3_service.get_cloudfront_url, args.iterations)
+
+    print(f"speedup    {after / before:10.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# scripts/bench_heic_decode.py
+"""
+Benchmark for the HEIC fast path over a sample corpus.
+
+Runs prepare_image() with the configured renditions on every HEIC/HEIF
+image, once through the generic Pillow plugin (heif_direct=False, the
+old path) and once through the direct libheif path per thread count, and
+reports the time per image, split into decode and resize/encode.
+
+iPhone photos are grids of 512px tiles that libheif decodes in parallel,
+so the thread counts only matter for real photos on multi-core machines.
+The synthetic corpus (used without --corpus) is made of single-tile
+images, so it measures the per-image overhead of each path.
+
+Usage:
+    python scripts/bench_heic_decode.py [--corpus DIR] [--count 6] [--threads 1,2,4]
+"""
+import os
+import sys
+import time
+import argparse
+from io import BytesIO
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw, ImageFilter
+
+
+def synthetic_corpus(count):
+    """12 MP HEICs with the orientations and detail of phone photos"""
+    corpus = []
+    for i in range(count):
+        size = (4032, 3024)
+        img = Image.merge('RGB', (
+            Image.radial_gradient('L').resize(size),
+            Image.effect_noise(size, 12 + 8 * (i % 4)).filter(ImageFilter.GaussianBlur(2 + i % 3)),
+            Image.linear_gradient('L').resize(size)
+        ))
+        draw = ImageDraw.Draw(img)
+        for j in range(0, size[0], 89 + 17 * i):
+            draw.line([(j, 0), (size[0] - j, size[1])], fill=(255, 255 - j % 255, j % 255), width=3)
+        exif = img.getexif()
+        exif[0x0112] = 6 if i % 2 else 1  # Portrait shots are stored rotated
+        output = BytesIO()
+        img.save(output, format='HEIF', quality=85, exif=exif.tobytes())
+        corpus.append((f"synthetic-{i:02d}.heic", output.getvalue()))
+    return corpus
+
+
+def load_corpus(directory):
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path) and os.path.splitext(name)[1].lower() in ('.heic', '.heif', '.avif'):
+            with open(path, 'rb') as f:
+                corpus.append((name, f.read()))
+    return corpus
+
+
+def measure(data, renditions, quality, heif_threads):
+    """Seconds to decode the image, and to run all of prepare_image() on it"""
+    import pillow_heif
+    from app.utils.image_utils import prepare_image, _open_image, _load_image
+
+    # The app sets this process-wide option once; the benchmark runs one decode at a time
+    heif_direct = heif_threads > 0
+    if heif_direct:
+        pillow_heif.options.DECODE_THREADS = heif_threads
+
+    start = time.perf_counter()
+    img, _ = _open_image(data, heif_direct=heif_direct)
+    if img is None or _load_image(img) is None:
+        return None
+    decode = time.perf_counter() - start
+    del img
+
+    start = time.perf_counter()
+    prepare_image(data, renditions=renditions, rendition_quality=quality, heif_direct=heif_direct)
+    return decode, time.perf_counter() - start
+
+
+def run(settings, corpus, renditions, quality, repeat):
+    """Time every setting on every image, alternating settings per image so drift hits all alike"""
+    times = {label: [] for label, _ in settings}
+    for _ in range(repeat):
+        for name, data in corpus:
+            for label, heif_threads in settings:
+                result = measure(data, renditions, quality, heif_threads)
+                if result is None:
+                    print(f"  skipped {name}: not decodable")
+                    break
+                times[label].append(result)
+
+    totals = {}
+    for label, results in times.items():
+        if not results:
+            continue
+        decode = sum(d for d, _ in results) / len(results)
+        total = sum(t for _, t in results) / len(results)
+        totals[label] = total
+        print(f"{label:<16} decode {decode * 1000:7.1f} ms  resize+encode {(total - decode) * 1000:7.1f} ms"
+              f"  total {total * 1000:7.1f} ms/image")
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help='Directory of sample HEIC/HEIF images (default: synthetic corpus)')
+    parser.add_argument('--count', type=int, default=6, help='Size of the synthetic corpus')
+    parser.add_argument('--threads', default='1,2,4', help='libheif thread counts to try')
+    parser.add_argument('--repeat', type=int, default=2, help='Passes over the corpus per setting')
+    args = parser.parse_args()
+
+    from app import create_app
+    from app.utils.image_utils import HEIC_SUPPORT, rendition_config
+
+    if not HEIC_SUPPORT:
+        sys.exit('pillow-heif is not installed')
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.count)
+    if not corpus:
+        sys.exit('No HEIC/HEIF images found')
+
+    app = create_app()
+    app.logger.setLevel('WARNING')
+    with app.app_context():
+        renditions = rendition_config()
+        quality = app.config.get('IMAGE_RENDITION_QUALITY', 80)
+        print(f"{len(corpus)} images, {os.cpu_count()} CPUs, renditions {sorted({w for w, _ in renditions})}")
+
+        settings = [('pillow plugin', 0)]
+        settings.extend((f"direct {t} thr", int(t)) for t in args.threads.split(',') if t.strip())
+        totals = run(settings, corpus, renditions, quality, args.repeat)
+
+    print()
+    plugin = totals.get('pillow plugin')
+    for label, total in totals.items():
+        if plugin and label != 'pillow plugin':
+            print(f"{label}: {plugin / total:4.2f}x the speed of the plugin path")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# scripts/bench_streaks.py
+"""
+Benchmark for streak recomputation over a synthetic check-in table.
+
+Builds a SQLite database of --rows check-ins, spread over users and
+projects with random gaps and same-day duplicates, then times:
+
+- orm walk:     loading a user's CheckIn objects and walking them in Python
+                (what delete_checkin used to do), per user
+- sql:          user_streaks(), the gaps-and-islands window query, per user
+- bulk python:  bulk_streaks() over the whole table with the plain loop
+- bulk numpy:   bulk_streaks() with NumPy (skipped when not installed)
+
+The per-user modes run on a --sample of users; the bulk modes cover every
+user and check their results against each other and the sample.
+
+Usage:
+    python scripts/bench_streaks.py [--rows 10000000] [--users 50000] [--sample 200]
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+from datetime import date, timedelta
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def build_database(path, rows, users, projects, seed=1):
+    """Fill the check_in table with runs of consecutive days separated by gaps"""
+    from app import create_app, db
+
+    app = create_app(bench_config(path))
+    with app.app_context():
+        db.create_all()
+
+    rng = random.Random(seed)
+    start = date(2020, 1, 1)
+    per_pair = max(1, rows // (users * projects))
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA journal_mode=OFF')
+    connection.execute('PRAGMA synchronous=OFF')
+
+    def generate():
+        written = 0
+        for user_id in range(1, users + 1):
+            for project_id in range(1, projects + 1):
+                day = start + timedelta(days=rng.randrange(30))
+                for _ in range(per_pair):
+                    if written >= rows:
+                        return
+                    yield user_id, project_id, day.isoformat(), f"{day.isoformat()} 08:00:00.000000"
+                    written += 1
+                    roll = rng.random()
+                    if roll < 0.05:
+                        continue  # a second check-in on the same day
+                    day += timedelta(days=1 if roll < 0.85 else rng.randrange(2, 10))
+
+    connection.executemany(
+        'INSERT INTO check_in (user_id, project_id, check_date, check_time) VALUES (?, ?, ?, ?)', generate()
+    )
+    connection.commit()
+    count = connection.execute('SELECT count(*) FROM check_in').fetchone()[0]
+    connection.execute('ANALYZE')
+    connection.close()
+    return count
+
+
+def bench_config(path):
+    from config import Config
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{path}"
+    return BenchConfig
+
+
+def orm_walk(user_id, project_id):
+    """The old delete_checkin recompute"""
+    from app.models.models import CheckIn
+
+    checkins = CheckIn.query.filter_by(user_id=user_id, project_id=project_id).order_by(CheckIn.check_date).all()
+    current = highest = 0
+    last = None
+    for checkin in checkins:
+        if last is None or (checkin.check_date - last).days == 1:
+            current += 1
+        elif checkin.check_date != last:
+            current = 1
+        highest = max(highest, current)
+        last = checkin.check_date
+    return {'total_checkins': len(checkins), 'current_streak': current, 'highest_streak': highest,
+            'last_checkin_date': last}
+
+
+def timed(label, count, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {elapsed:8.2f} s  ({elapsed * 1000 / count:8.3f} ms/user)")
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10_000_000, help='Check-ins to generate')
+    parser.add_argument('--users', type=int, default=50_000, help='Users to spread them over')
+    parser.add_argument('--projects', type=int, default=2, help='Projects per user')
+    parser.add_argument('--sample', type=int, default=200, help='Users timed in the per-user modes')
+    parser.add_argument('--database', help='Reuse or create this SQLite file (default: a temporary one)')
+    args = parser.parse_args()
+
+    path = args.database or os.path.join(tempfile.mkdtemp(), 'bench_streaks.db')
+    if not os.path.exists(path):
+        start = time.perf_counter()
+        count = build_database(path, args.rows, args.users, args.projects)
+        print(f"Built {count} check-ins in {time.perf_counter() - start:.1f} s ({path})")
+
+    from app import create_app, db
+    from app.services import streaks
+
+    app = create_app(bench_config(path))
+    app.logger.setLevel('WARNING')
+    with app.app_context():
+        pairs = db.session.execute(db.text('SELECT DISTINCT user_id, project_id FROM check_in')).all()
+        sample = random.Random(2).sample(pairs, min(args.sample, len(pairs)))
+        print(f"{len(pairs)} user/project pairs, {len(sample)} sampled for the per-user modes\n")
+
+        walked, walk_time = timed('orm walk', len(sample), lambda: [orm_walk(*pair) for pair in sample])
+        queried, sql_time = timed('sql', len(sample), lambda: [streaks.user_streaks(*pair) for pair in sample])
+        assert walked == queried, 'sql results differ from the orm walk'
+
+        bulk, python_time = timed('bulk python', len(pairs), streaks.bulk_streaks, None, False)
+        assert [bulk[tuple(pair)] for pair in sample] == queried, 'bulk results differ from the orm walk'
+        if streaks.NUMPY_AVAILABLE:
+            vectorized, _ = timed('bulk numpy', len(pairs), streaks.bulk_streaks, None, True)
+            assert vectorized == bulk, 'numpy results differ from the python loop'
+        else:
+            print('bulk numpy   skipped, NumPy is not installed')
+
+    print(f"\nsql is {walk_time / sql_time:.1f}x the orm walk per user; a full rebuild with the orm walk "
+          f"would take ~{walk_time / len(sample) * len(pairs):.0f} s vs {python_time:.0f} s in bulk")
+
+
+if __name__ == '__main__':
+    main()
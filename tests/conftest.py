@@ -0,0 +1,132 @@
+import os
+import sys
+import fnmatch
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from config import Config
+from app import create_app, db
+from app.services.s3_service import reset_s3_service
+from app.services.storage import reset_storage
+
+@pytest.fixture
+def make_app():
+    """Factory for apps on an in-memory SQLite database with the tables created
+
+    Keyword arguments override config values, e.g. make_app(STORAGE_BACKEND='memory').
+    CSRF protection and Redis are off, and each app gets fresh storage backends.
+    """
+    def build(**overrides):
+        class TestConfig(Config):
+            SQLALCHEMY_DATABASE_URI = 'sqlite://'
+            WTF_CSRF_ENABLED = False
+            REDIS_HOST = None
+            REDIS_URL = None
+        for key, value in overrides.items():
+            setattr(TestConfig, key, value)
+        reset_storage()
+        reset_s3_service()
+        app = create_app(TestConfig)
+        with app.app_context():
+            db.create_all()
+        return app
+
+    yield build
+    reset_storage()
+    reset_s3_service()
+
+@pytest.fixture
+def app(make_app):
+    """An app with the default test config"""
+    return make_app()
+
+class FakeRedis:
+    """In-memory stand-in for the Redis commands the app uses
+
+    Values and sorted-set members come back as bytes, like redis-py.
+    Every call to the server is logged in round_trips: a command's name,
+    or ('pipeline', [command names]) for an executed pipeline.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.sorted_sets = {}
+        self.round_trips = []
+
+    def __getattr__(self, name):
+        command = getattr(type(self), f"_{name}", None)
+        if command is None:
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            self.round_trips.append(name)
+            return command(self, *args, **kwargs)
+        return call
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def scan_iter(self, match=None, count=None):
+        self.round_trips.append('scan')
+        return iter([key.encode() for key in list(self.values) if fnmatch.fnmatch(key, match or '*')])
+
+    def _get(self, key):
+        return self.values.get(key)
+
+    def _mget(self, keys):
+        return [self.values.get(key) for key in keys]
+
+    def _set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = str(value).encode()
+        return True
+
+    def _setex(self, key, seconds, value):
+        self.values[key] = str(value).encode()
+        return True
+
+    def _incr(self, key):
+        self.values[key] = str(int(self.values.get(key, 0)) + 1).encode()
+        return int(self.values[key])
+
+    def _exists(self, key):
+        return int(key in self.values or key in self.sorted_sets)
+
+    def _expire(self, key, seconds):
+        return self._exists(key)
+
+    def _delete(self, *keys):
+        for key in keys:
+            key = key.decode() if isinstance(key, bytes) else key
+            self.values.pop(key, None)
+            self.sorted_sets.pop(key, None)
+
+    def _zadd(self, key, mapping):
+        self.sorted_sets.setdefault(key, {}).update({str(m).encode(): float(v) for m, v in mapping.items()})
+
+    def _zrem(self, key, member):
+        self.sorted_sets.get(key, {}).pop(str(member).encode(), None)
+
+    def _zscore(self, key, member):
+        return self.sorted_sets.get(key, {}).get(str(member).encode())
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    def execute(self):
+        self.client.round_trips.append(('pipeline', [name for name, _, _ in self.commands]))
+        return [getattr(type(self.client), f"_{name}")(self.client, *args, **kwargs)
+                for name, args, kwargs in self.commands]
+
+@pytest.fixture
+def fake_redis():
+    """A FakeRedis; patch it in where the code under test looks up its client"""
+    return FakeRedis()
@@ -0,0 +1,90 @@
+from datetime import date, datetime, timedelta
+
+from app import db
+from app.models.models import CheckIn, Project, ProjectMember, ProjectStat, User, UserCalendar
+from app.checkin.routes import update_user_project_stats
+from app.services.checkin_calendar import (
+    CALENDAR_BYTES, bitmap_dates, checked_in_on, heatmap, mark_day, rebuild_calendars
+)
+
+def check_in(user_id, project_id, day):
+    db.session.add(CheckIn(user_id=user_id, project_id=project_id, check_date=day,
+                           check_time=datetime.combine(day, datetime.min.time())))
+    update_user_project_stats(user_id, project_id, day)
+    db.session.commit()
+
+def calendars():
+    return sorted((c.user_id, c.project_id, c.year, c.days) for c in UserCalendar.query)
+
+def test_calendar_bits(app):
+    with app.app_context():
+        days = [date(2024, 1, 1), date(2024, 2, 29), date(2024, 12, 31)]
+        assert checked_in_on(1, 1, days) is None
+        for day in days:
+            mark_day(1, 1, day)
+        mark_day(1, 1, date(2024, 5, 5))
+        mark_day(1, 1, date(2024, 5, 5), checked_in=False)
+        mark_day(1, 1, date(2023, 5, 5), checked_in=False)
+        db.session.commit()
+        
+        bitmap = UserCalendar.query.one().days
+        assert len(bitmap) == CALENDAR_BYTES
+        assert bitmap_dates(bitmap, 2024) == days
+        assert checked_in_on(1, 1, [date(2024, 12, 31)]) is True
+        assert checked_in_on(1, 1, [date(2024, 5, 5)]) is False
+        assert checked_in_on(1, 1, [date(2024, 5, 5), date(2025, 1, 1)]) is None
+        assert heatmap(1, 1, 2024)['days'] == ['2024-01-01', '2024-02-29', '2024-12-31']
+        assert heatmap(1, 1, 2020)['total_days'] == 0
+
+def test_checkins_and_deletes_keep_calendars_in_step_with_a_rebuild(app):
+    client = app.test_client()
+    with app.app_context():
+        db.session.add(Project(id=1, name='P', creator_id=1))
+        db.session.add(ProjectStat(project_id=1))
+        db.session.add(User(id=1, username='a', email='a@example.com', password_hash='x'))
+        db.session.add(ProjectMember(user_id=1, project_id=1, role='creator'))
+        db.session.commit()
+        today = datetime.utcnow().date()
+        
+        for day in (today - timedelta(days=400), today - timedelta(days=1), today, today):
+            check_in(1, 1, day)
+        check_in(2, 1, today)
+        
+        with client.session_transaction() as session:
+            session['_user_id'] = '1'
+        # One of today's two check-ins goes, the day stays; yesterday's only one clears its bit
+        for checkin in (CheckIn.query.filter_by(user_id=1, check_date=today).first(),
+                        CheckIn.query.filter_by(user_id=1, check_date=today - timedelta(days=1)).one()):
+            response = client.post(f"/checkin/delete_checkin/{checkin.id}", headers={'X-Requested-With': 'XMLHttpRequest'})
+            assert response.get_json()['success']
+        
+        response = client.get(f"/checkin/api/project/1/heatmap?year={today.year}").get_json()
+        assert today.isoformat() in response['days']
+        assert (today - timedelta(days=1)).isoformat() not in response['days']
+        # User 2 isn't a friend
+        assert client.get('/checkin/api/project/1/heatmap?user=2').status_code == 404
+        
+        incremental = calendars()
+        assert rebuild_calendars(1) == len(incremental)
+        assert calendars() == incremental
+
+def test_second_checkin_is_refused_before_its_day_is_marked(app):
+    client = app.test_client()
+    with app.app_context():
+        db.session.add(Project(id=1, name='P', creator_id=1))
+        db.session.add(ProjectStat(project_id=1))
+        db.session.add(User(id=1, username='a', email='a@example.com', password_hash='x'))
+        db.session.add(ProjectMember(user_id=1, project_id=1, role='creator'))
+        now = datetime.utcnow()
+        # The calendar still has today clear: the first check-in is committed but its stats
+        # (and the bit) are not written yet, e.g. while its images are processed
+        mark_day(1, 1, now.date() - timedelta(days=10))
+        db.session.add(CheckIn(user_id=1, project_id=1, check_date=now.date(), check_time=now))
+        db.session.commit()
+        assert checked_in_on(1, 1, [now.date()]) is False
+        
+        with client.session_transaction() as session:
+            session['_user_id'] = '1'
+        response = client.post('/checkin/api/checkin', json={'project_id': 1})
+        assert response.status_code == 400
+        assert CheckIn.query.count() == 1
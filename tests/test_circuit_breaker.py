@@ -0,0 +1,59 @@
+import threading
+
+import pytest
+from app.services import circuit_breaker
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+def fail():
+    raise ConnectionError('down')
+
+def probe_thread(breaker):
+    return next(thread for thread in threading.enumerate() if thread.name == f"{breaker.name}-probe")
+
+def test_trips_at_the_threshold_and_rejects_without_calling():
+    # The probe hangs until the test is done, then succeeds
+    recovered = threading.Event()
+    breaker = CircuitBreaker('trip-test', probe=recovered.wait, failure_threshold=3, probe_interval=0.01)
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            breaker.call(fail)
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.call(lambda: None)
+    assert breaker.consecutive_failures == 0
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            breaker.call(fail)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    calls = []
+    with pytest.raises(CircuitOpenError):
+        breaker.call(calls.append, 1)
+    assert calls == []
+    assert not breaker.allow_request()
+    metrics = breaker.metrics()
+    assert (metrics['trips'], metrics['total_failures'], metrics['rejected_calls']) == (1, 5, 2)
+    recovered.set()
+    probe_thread(breaker).join(timeout=5)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_probe_backs_off_and_closes_the_circuit(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(circuit_breaker.time, 'sleep', sleeps.append)
+    probes = iter([fail, fail, fail, fail, lambda: None])
+    breaker = CircuitBreaker('probe-test', probe=lambda: next(probes)(), probe_interval=1.0, max_probe_interval=5.0)
+
+    breaker.trip()
+    probe_thread(breaker).join(timeout=5)
+    assert sleeps == [1.0, 2.0, 4.0, 5.0, 5.0]
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request()
+    assert breaker.metrics()['open_for_seconds'] == 0
+
+def test_metrics_endpoint_needs_the_token(make_app):
+    assert make_app(METRICS_TOKEN='').test_client().get('/metrics').status_code == 404
+
+    client = make_app(METRICS_TOKEN='s3cret').test_client()
+    assert client.get('/metrics').status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer s3cret'}).status_code == 200
@@ -0,0 +1,75 @@
+import os
+import tempfile
+from datetime import datetime
+from io import BytesIO
+
+from PIL import Image
+from app import db
+from app.models.models import CheckIn, CheckInImage
+from app.services import image_queue
+from app.services.image_backfill import backfill_image_metadata
+from app.services.storage import get_storage
+
+def jpeg(size=(1600, 1200)):
+    output = BytesIO()
+    Image.new('RGB', size, 'red').save(output, format='JPEG')
+    return output.getvalue()
+
+def queue_image(data, s3_key):
+    now = datetime.utcnow()
+    checkin = CheckIn(user_id=1, project_id=1, check_date=now.date(), check_time=now)
+    db.session.add(checkin)
+    db.session.commit()
+    image = checkin.add_image(s3_key, 'a.jpg', 'image/jpeg', len(data), status='processing',
+                              staged_path=image_queue.stage_upload(data))
+    db.session.commit()
+    return image.id
+
+def test_worker_processes_queued_images(make_app):
+    with tempfile.TemporaryDirectory() as staging_dir:
+        app = make_app(STORAGE_BACKEND='memory', IMAGE_STAGING_PATH=staging_dir, IMAGE_MAX_ATTEMPTS=2)
+        with app.test_request_context():
+            good = queue_image(jpeg(), 'checkins/1/1/good.jpg')
+            bad = queue_image(b'not an image', 'checkins/1/1/bad.jpg')
+            assert image_queue.queue_depth() == 2
+            assert image_queue.has_capacity(498) and not image_queue.has_capacity(499)
+            
+            assert image_queue.run_worker(once=True) == 2
+            
+            assert db.session.get(CheckInImage, good).status == 'ready'
+            assert db.session.get(CheckInImage, bad).status == 'failed'
+            assert os.listdir(staging_dir) == []
+            renditions = db.session.get(CheckInImage, good).renditions
+            assert [(r['width'], r['content_type']) for r in renditions] == [
+                (320, 'image/webp'), (320, 'image/jpeg'), (640, 'image/webp'), (640, 'image/jpeg'),
+                (1200, 'image/webp'), (1200, 'image/jpeg')
+            ]
+            assert renditions[0]['key'] == 'renditions/checkins/1/1/good_320w.webp'
+            assert set(get_storage().files) == {'checkins/1/1/good.jpg'} | {r['key'] for r in renditions}
+            assert image_queue.claim_next_image() is None
+            
+            ready = db.session.get(CheckInImage, good)
+            assert (ready.width, ready.height) == (1200, 900)
+            assert ready.placeholder.startswith('data:image/')
+
+def test_backfill_records_dimensions_of_older_images(make_app):
+    with tempfile.TemporaryDirectory() as staging_dir:
+        app = make_app(STORAGE_BACKEND='memory', IMAGE_STAGING_PATH=staging_dir, IMAGE_MAX_ATTEMPTS=2)
+        with app.test_request_context():
+            storage = get_storage()
+            now = datetime.utcnow()
+            checkin = CheckIn(user_id=1, project_id=1, check_date=now.date(), check_time=now)
+            db.session.add(checkin)
+            db.session.commit()
+            for index, size in enumerate([(1200, 900), (600, 800)]):
+                storage.upload_file(jpeg(size), f"checkins/1/1/old{index}.jpg", 'image/jpeg')
+                checkin.add_image(f"checkins/1/1/old{index}.jpg", 'a.jpg', 'image/jpeg', 1)
+            checkin.add_image('checkins/1/1/missing.jpg', 'a.jpg', 'image/jpeg', 1)
+            db.session.commit()
+            
+            assert backfill_image_metadata(concurrency=2, batch_size=2) == (2, 1)
+            
+            images = CheckInImage.query.order_by(CheckInImage.id).all()
+            assert [(image.width, image.height) for image in images] == [(1200, 900), (600, 800), (None, None)]
+            assert all(image.placeholder.startswith('data:image/') for image in images[:2])
+            assert backfill_image_metadata() == (0, 1)
@@ -0,0 +1,142 @@
+import math
+from io import BytesIO
+
+from flask import Flask
+from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageStat
+from app.utils.image_utils import AdaptiveEncoder, prepare_image, prepare_images
+
+def make_photo(size=(2400, 1800), orientation=1, mode='RGB'):
+    """A JPEG (or PNG for modes JPEG can't store) with a red left half"""
+    img = Image.new('RGB', size, (0, 0, 255))
+    img.paste((255, 0, 0), (0, 0, size[0] // 2, size[1]))
+    img = img.convert(mode)
+    output = BytesIO()
+    if mode == 'RGB':
+        exif = img.getexif()
+        exif[0x0112] = orientation
+        img.save(output, format='JPEG', quality=95, exif=exif.tobytes())
+    else:
+        img.save(output, format='PNG')
+    return output.getvalue()
+
+def test_prepare_image_applies_orientation_without_cropping():
+    app = Flask(__name__)
+    with app.app_context():
+        # Orientation 6: stored landscape, displayed rotated 90° clockwise
+        result = prepare_image(make_photo(orientation=6), thumbnail_size=(300, 300))
+    
+    assert (result['width'], result['height']) == (1200, 1600)
+    assert result['content_type'] == 'image/jpeg'
+    
+    img = Image.open(BytesIO(result['data']))
+    assert img.size == (1200, 1600)
+    assert not img.getexif()
+    # The red left half ends up on top
+    assert img.getpixel((600, 200))[0] > 200
+    assert img.getpixel((600, 1400))[2] > 200
+    
+    thumbnail = Image.open(BytesIO(result['thumbnail']))
+    assert thumbnail.size == (225, 300)
+
+def test_prepare_image_handles_alpha_and_rejects_garbage():
+    app = Flask(__name__)
+    with app.app_context():
+        result = prepare_image(make_photo(size=(800, 600), mode='RGBA'))
+        assert (result['width'], result['height']) == (800, 600)
+        assert Image.open(BytesIO(result['data'])).mode == 'RGB'
+        
+        assert prepare_image(b'not an image') is None
+        
+        # Decompression bombs are rejected from the header; files work like bytes
+        assert prepare_image(BytesIO(make_photo(size=(800, 600))), max_pixels=400 * 300) is None
+        assert prepare_image(BytesIO(make_photo(size=(800, 600))))['width'] == 800
+
+def test_prepare_images_keeps_upload_order():
+    app = Flask(__name__)
+    app.config['IMAGE_PROCESSING_THREADS'] = 3
+    sizes = [(1600, 1200), (400, 300), (900, 1200), (640, 480)]
+    with app.app_context():
+        results = prepare_images([make_photo(size=size) for size in sizes[:2]] + [b'not an image'] + [make_photo(size=size) for size in sizes[2:]])
+    
+    assert results[2] is None
+    del results[2]
+    assert [(result['width'], result['height']) for result in results] == [(1200, 900), (400, 300), (900, 1200), (640, 480)]
+
+def test_prepare_image_renders_renditions_from_one_decode():
+    app = Flask(__name__)
+    renditions = [(width, format) for width in (320, 640, 1200) for format in ('WEBP', 'JPEG')]
+    with app.app_context():
+        result = prepare_image(make_photo(size=(1200, 900), orientation=6), renditions=renditions)
+    
+    # Upright 900x1200: the 1200 rendition is capped at the image width
+    assert result['thumbnail'] is None
+    assert [(r['width'], r['height'], r['content_type']) for r in result['renditions']] == [
+        (320, 426, 'image/webp'), (320, 426, 'image/jpeg'),
+        (640, 853, 'image/webp'), (640, 853, 'image/jpeg'),
+        (900, 1200, 'image/webp'), (900, 1200, 'image/jpeg')
+    ]
+    assert Image.open(BytesIO(result['renditions'][0]['data'])).format == 'WEBP'
+
+def make_detailed_photo(size=(3000, 2250)):
+    """A JPEG with gradients, fine noise and sharp diagonal edges"""
+    img = Image.merge('RGB', (
+        Image.radial_gradient('L').resize(size),
+        Image.effect_noise(size, 64).filter(ImageFilter.GaussianBlur(2)),
+        Image.linear_gradient('L').resize(size)
+    ))
+    draw = ImageDraw.Draw(img)
+    for x in range(0, size[0], 97):
+        draw.line([(x, 0), (x + 400, size[1])], fill=(255, 255, 255), width=3)
+    output = BytesIO()
+    img.save(output, format='JPEG', quality=90)
+    return output.getvalue()
+
+def psnr(a, b):
+    """Peak signal-to-noise ratio of two RGB images in dB"""
+    mse = sum(rms ** 2 for rms in ImageStat.Stat(ImageChops.difference(a, b)).rms) / 3
+    return float('inf') if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+def test_fast_downscale_matches_full_decode():
+    app = Flask(__name__)
+    data = make_detailed_photo()
+    with app.app_context():
+        fast = prepare_image(data, thumbnail_size=(300, 300), fast=True)
+        reference = prepare_image(data, thumbnail_size=(300, 300), fast=False)
+    
+    for output in ('data', 'thumbnail'):
+        fast_img = Image.open(BytesIO(fast[output])).convert('RGB')
+        reference_img = Image.open(BytesIO(reference[output])).convert('RGB')
+        assert fast_img.size == reference_img.size
+        # 40 dB is visually indistinguishable; the fast path measures ~44 dB
+        assert psnr(fast_img, reference_img) > 40
+
+def test_budget_encoder_fits_budget_and_reuses_quality():
+    img = Image.open(BytesIO(make_detailed_photo(size=(1200, 900)))).convert('RGB')
+    encoder = AdaptiveEncoder(mode='budget', bytes_per_pixel=0.15)
+    
+    data = encoder.encode(img, 'JPEG')
+    assert len(data) <= 0.15 * 1200 * 900
+    assert len(data) < len(AdaptiveEncoder(mode='budget', bytes_per_pixel=1).encode(img, 'JPEG'))
+    assert (encoder.hits, encoder.misses) == (0, 1)
+    
+    # Same source characteristics: the cached quality is tried first and kept
+    assert encoder.encode(img, 'JPEG') == data
+    assert (encoder.hits, encoder.misses) == (1, 1)
+
+def test_heif_fast_path_matches_plugin_path():
+    app = Flask(__name__)
+    source = Image.open(BytesIO(make_photo(size=(1600, 1200), orientation=6)))
+    output = BytesIO()
+    source.save(output, format='HEIF', quality=90, exif=source.getexif().tobytes())
+    heic = output.getvalue()
+    
+    with app.app_context():
+        fast = prepare_image(heic, renditions=[(320, 'JPEG')], heif_direct=True)
+        plugin = prepare_image(heic, renditions=[(320, 'JPEG')], heif_direct=False)
+        assert prepare_image(heic, max_pixels=1000, heif_direct=True) is None
+    
+    # Rotated upright by libheif; the red left half ends up on top
+    assert (fast['width'], fast['height']) == (plugin['width'], plugin['height']) == (1200, 1600)
+    img = Image.open(BytesIO(fast['data']))
+    assert img.getpixel((600, 200))[0] > 200
+    assert psnr(img, Image.open(BytesIO(plugin['data']))) > 45
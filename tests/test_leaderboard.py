@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta
+
+from app import db
+from app.models.models import CheckIn, FriendRelationship, Project, ProjectMember, ProjectStat, User
+from app.checkin.routes import get_visible_user_ids, record_checkin_scores, update_user_project_stats
+from app.services import leaderboard as leaderboards
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.leaderboard import leaderboard
+
+def check_in_days(user_id, project_id, last_day, count):
+    for offset in range(count - 1, -1, -1):
+        day = last_day - timedelta(days=offset)
+        db.session.add(CheckIn(user_id=user_id, project_id=project_id, check_date=day,
+                               check_time=datetime.combine(day, datetime.min.time())))
+        user_stats = update_user_project_stats(user_id, project_id, day)
+        db.session.commit()
+        record_checkin_scores(user_stats)
+
+def builds(redis):
+    """How many times the sorted sets were (re)built from the database"""
+    return sum(1 for trip in redis.round_trips if isinstance(trip, tuple) and 'set' in trip[1])
+
+def ranking(board):
+    return [(entry['username'], entry['score']) for entry in board['entries']]
+
+def test_leaderboard_ranks_visible_users_from_the_database(app):
+    client = app.test_client()
+    with app.app_context():
+        db.session.add(Project(id=1, name='P', creator_id=1))
+        db.session.add(ProjectStat(project_id=1))
+        for user_id in range(1, 6):
+            db.session.add(User(id=user_id, username=f"u{user_id}", email=f"u{user_id}@example.com", password_hash='x'))
+            if user_id != 5:
+                db.session.add(ProjectMember(user_id=user_id, project_id=1, role='member'))
+        # 2 and 3 are friends of 1; 4 is only a member, 5 a friend outside the project
+        for friend_id, status in ((2, 'accepted'), (3, 'accepted'), (4, 'pending'), (5, 'accepted')):
+            db.session.add(FriendRelationship(requester_id=1, addressee_id=friend_id, status=status))
+        db.session.commit()
+        today = datetime.utcnow().date()
+        
+        check_in_days(1, 1, today, 1)
+        check_in_days(2, 1, today - timedelta(days=1), 3)  # still alive
+        check_in_days(3, 1, today - timedelta(days=3), 5)  # broken
+        check_in_days(4, 1, today, 10)
+        
+        visible = get_visible_user_ids(1, 1)
+        assert visible == [1, 2, 3]
+        board = leaderboard(1, visible, 'current_streak', today=today)
+        assert board['source'] == 'database'
+        assert ranking(board) == [('u2', 3), ('u1', 1)]
+        assert ranking(leaderboard(1, visible, 'highest_streak', today=today)) == [('u3', 5), ('u2', 3), ('u1', 1)]
+        assert ranking(leaderboard(1, visible, 'total_checkins', limit=2, today=today)) == [('u3', 5), ('u2', 3)]
+        
+        with client.session_transaction() as session:
+            session['_user_id'] = '1'
+        response = client.get('/checkin/api/project/1/leaderboard?metric=highest_streak&limit=1').get_json()
+        assert [entry['rank'] for entry in response['entries']] == [1]
+        assert response['entries'][0]['user_id'] == 3
+        assert client.get('/checkin/api/project/1/leaderboard?metric=notes').status_code == 400
+        assert client.get('/checkin/api/project/2/leaderboard').status_code == 404
+        page = client.get('/checkin/leaderboard?project=1')
+        assert page.status_code == 200
+        assert b'u4' not in page.data
+
+def test_leaderboard_in_redis_matches_the_database(app, fake_redis, monkeypatch):
+    redis = fake_redis
+    breaker = CircuitBreaker('redis-test', probe=lambda: None)
+    monkeypatch.setattr(leaderboards, 'get_redis_client', lambda: redis)
+    monkeypatch.setattr(leaderboards, 'get_redis_breaker', lambda: breaker)
+    with app.app_context():
+        db.session.add(Project(id=1, name='P', creator_id=1))
+        db.session.add(ProjectStat(project_id=1))
+        for user_id in (1, 2, 3):
+            db.session.add(User(id=user_id, username=f"u{user_id}", email=f"u{user_id}@example.com", password_hash='x'))
+        db.session.commit()
+        today = datetime.utcnow().date()
+        users = [1, 2, 3]
+        
+        check_in_days(2, 1, today - timedelta(days=1), 3)
+        # Writes before the first read are dropped by the build
+        assert ranking(leaderboard(1, users, 'total_checkins', today=today)) == [('u2', 3)]
+        assert builds(redis) == 1
+        
+        # Then kept current incrementally
+        check_in_days(1, 1, today, 1)
+        check_in_days(3, 1, today - timedelta(days=3), 5)
+        check_in_days(3, 1, today - timedelta(days=3), 1)  # a second check-in that day
+        for metric in leaderboards.METRICS:
+            board = leaderboard(1, users, metric, today=today)
+            assert board['source'] == 'redis'
+            expected = leaderboards._ranked_from_database(1, users, metric, 10, today - timedelta(days=1))
+            assert [(entry['user_id'], entry['score']) for entry in board['entries']] == expected
+        assert ranking(leaderboard(1, users, 'current_streak', today=today)) == [('u2', 3), ('u1', 1)]
+        assert ranking(leaderboard(1, users, 'total_checkins', today=today)) == [('u3', 6), ('u2', 3), ('u1', 1)]
+        assert builds(redis) == 1
+        
+        # An expired leaderboard being rebuilt by another request is read from the database
+        leaderboards.invalidate(1)
+        redis.set(leaderboards._build_lock_key(1), 1, nx=True)
+        board = leaderboard(1, users, 'highest_streak', today=today)
+        assert (board['source'], builds(redis)) == ('database', 1)
+        assert ranking(board) == [('u3', 5), ('u2', 3), ('u1', 1)]
+        redis.delete(leaderboards._build_lock_key(1))
+        board = leaderboard(1, users, 'highest_streak', today=today)
+        assert (board['source'], builds(redis)) == ('redis', 2)
+        assert ranking(board) == [('u3', 5), ('u2', 3), ('u1', 1)]
+        assert leaderboards._build_lock_key(1) not in redis.values
+        
+        # A rebuild between a check-in's commit and its score write counts it once
+        db.session.add(CheckIn(user_id=1, project_id=1, check_date=today,
+                               check_time=datetime.combine(today, datetime.min.time())))
+        user_stats = update_user_project_stats(1, 1, today)
+        db.session.commit()
+        leaderboards.invalidate(1)
+        leaderboard(1, users, 'total_checkins', today=today)
+        record_checkin_scores(user_stats)
+        assert builds(redis) == 3
+        assert ranking(leaderboard(1, users, 'total_checkins', today=today)) == [('u3', 6), ('u2', 3), ('u1', 2)]
+        
+        breaker.trip()
+        assert leaderboard(1, users, 'highest_streak', today=today)['source'] == 'database'
@@ -0,0 +1,53 @@
+import time
+import threading
+
+import pytest
+from app.services.memory_budget import MemoryBudget, MemoryBudgetExceeded
+
+def test_reservations_fail_fast_and_clamp():
+    budget = MemoryBudget('test', capacity=100, timeout=0)
+    assert budget.acquire(60) == 60
+    with pytest.raises(MemoryBudgetExceeded):
+        budget.acquire(50)
+    budget.release(60)
+    
+    # Larger than the whole budget: runs alone instead of never
+    with budget.reserve(1000):
+        assert budget.in_use == 100
+    assert budget.in_use == 0
+    
+    metrics = budget.metrics()
+    assert metrics['peak_in_use_bytes'] == 100
+    assert metrics['rejections'] == 1
+    assert metrics['reservations'] == 2
+
+def test_waiters_are_served_in_order():
+    budget = MemoryBudget('test', capacity=100, timeout=5)
+    held = budget.acquire(100)
+    order = []
+    
+    def reserve(name, weight):
+        with budget.reserve(weight):
+            order.append(name)
+    
+    large = threading.Thread(target=reserve, args=('large', 80))
+    large.start()
+    while not budget.metrics()['waiting']:
+        time.sleep(0.01)
+    small = threading.Thread(target=reserve, args=('small', 30))
+    small.start()
+    while budget.metrics()['waiting'] < 2:
+        time.sleep(0.01)
+    
+    budget.release(held)
+    large.join()
+    small.join()
+    assert order == ['large', 'small']
+    assert budget.in_use == 0
+
+def test_wait_times_out():
+    budget = MemoryBudget('test', capacity=100, timeout=0.05)
+    budget.acquire(100)
+    with pytest.raises(MemoryBudgetExceeded):
+        budget.acquire(1)
+    assert budget.metrics()['waiting'] == 0
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+from app import db
+from app.models.models import CheckIn, Project, ProjectDailyRollup, ProjectStat, User, UserProjectStat
+from app.checkin.routes import update_user_project_stats
+from app.services.project_stats import (
+    active_users, adjust_project_stats, daily_rollups, rebuild_daily_rollups, reconcile_project_stats
+)
+
+def check_in(user_id, project_id, day):
+    db.session.add(CheckIn(user_id=user_id, project_id=project_id, check_date=day,
+                           check_time=datetime.combine(day, datetime.min.time())))
+    update_user_project_stats(user_id, project_id, day)
+    db.session.commit()
+
+def project_stat(project_id):
+    stat = ProjectStat.query.filter_by(project_id=project_id).one()
+    db.session.refresh(stat)
+    return stat.total_checkins, stat.active_users, stat.highest_streak
+
+def test_checkins_update_project_stats_incrementally(app):
+    with app.app_context():
+        db.session.add(Project(id=1, name='P', creator_id=1))
+        db.session.add(ProjectStat(project_id=1))
+        db.session.commit()
+        today = datetime.utcnow().date()
+        
+        for offset in (3, 2, 1):
+            check_in(1, 1, today - timedelta(days=offset))
+        check_in(2, 1, today)
+        check_in(2, 1, today)
+        assert project_stat(1) == (5, 2, 3)
+        assert UserProjectStat.query.filter_by(user_id=1, project_id=1).one().total_checkins == 3
+        assert reconcile_project_stats(1, today=today) == {'projects': 0, 'users': 0}
+        
+        # A delete that lowers the only 3-day streak looks the maximum up again
+        stats = UserProjectStat.query.filter_by(user_id=1, project_id=1).one()
+        stats.highest_streak = 2
+        adjust_project_stats(1, -1, was_active=True, now_active=True, highest_streak=2, lowered_streak=True)
+        db.session.commit()
+        assert project_stat(1) == (4, 2, 2)
+        
+        # The reconciler fixes drift and users that went inactive
+        assert reconcile_project_stats(1, today=today + timedelta(days=31)) == {'projects': 1, 'users': 0}
+        assert project_stat(1) == (5, 0, 2)
+
+def test_missing_project_stat_is_built_from_scratch(app):
+    with app.app_context():
+        db.session.add(Project(id=2, name='Q', creator_id=1))
+        db.session.commit()
+        check_in(1, 2, datetime.utcnow().date())
+        assert project_stat(2) == (1, 1, 1)
+
+def rollups(project_id):
+    return sorted((r.day, r.checkins, r.distinct_users, r.latest_users)
+                  for r in ProjectDailyRollup.query.filter_by(project_id=project_id))
+
+def test_daily_rollups_follow_checkins_and_deletes(app):
+    client = app.test_client()
+    with app.app_context():
+        db.session.add(Project(id=1, name='P', creator_id=1))
+        db.session.add(ProjectStat(project_id=1))
+        db.session.add(User(id=1, username='a', email='a@example.com', password_hash='x'))
+        db.session.commit()
+        today = datetime.utcnow().date()
+        
+        for offset in (2, 1, 0):
+            check_in(1, 1, today - timedelta(days=offset))
+        check_in(2, 1, today)
+        check_in(1, 1, today)
+        assert rollups(1) == [
+            (today - timedelta(days=2), 1, 1, 0),
+            (today - timedelta(days=1), 1, 1, 0),
+            (today, 3, 2, 2)
+        ]
+        assert active_users(1, today) == 2
+        assert daily_rollups(1, days=2, today=today) == [
+            {'date': (today - timedelta(days=1)).isoformat(), 'checkins': 1, 'users': 1},
+            {'date': today.isoformat(), 'checkins': 3, 'users': 2}
+        ]
+        
+        # Deleting both of user 1's check-ins of today moves their last check-in back a day
+        with client.session_transaction() as session:
+            session['_user_id'] = '1'
+        for checkin in CheckIn.query.filter_by(user_id=1, check_date=today).all():
+            response = client.post(f"/checkin/delete_checkin/{checkin.id}", headers={'X-Requested-With': 'XMLHttpRequest'})
+            assert response.get_json()['success']
+        incremental = rollups(1)
+        assert incremental[-2:] == [(today - timedelta(days=1), 1, 1, 1), (today, 1, 1, 1)]
+        assert active_users(1, today + timedelta(days=30)) == 1
+        
+        assert rebuild_daily_rollups(1) == 3
+        assert rollups(1) == incremental
@@ -0,0 +1,209 @@
+import os
+import json
+import base64
+import tempfile
+
+from botocore.stub import Stubber
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from app import db
+from app.models.models import User
+from app.services import s3_service
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.s3_service import CLOUDFRONT_COOKIE_NAMES, S3Service
+
+DAY = 24 * 60 * 60
+WEEK = 7 * DAY
+
+S3_CONFIG = {
+    'STORAGE_BACKEND': 's3',
+    'AWS_ACCESS_KEY': 'test',
+    'AWS_SECRET_KEY': 'test',
+    'AWS_REGION': 'us-east-1',
+    'S3_BUCKET_NAME': 'bucket',
+    'USE_CLOUDFRONT': False,
+    'URL_EXPIRY_BUCKET': DAY
+}
+
+def make_cloudfront_app(make_app, key_dir):
+    """An app issuing CloudFront signed cookies, with a fresh signing key"""
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    key_path = os.path.join(key_dir, 'cloudfront.pem')
+    with open(key_path, 'wb') as f:
+        f.write(private_key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL, serialization.NoEncryption()
+        ))
+    app = make_app(**dict(
+        S3_CONFIG,
+        USE_CLOUDFRONT=True,
+        CLOUDFRONT_DOMAIN='cdn.example.com',
+        CLOUDFRONT_KEY_PAIR_ID='K2JCJMDEHXQW5F',
+        CLOUDFRONT_PRIVATE_KEY_PATH=key_path,
+        CLOUDFRONT_SIGNED_COOKIES=True,
+        CLOUDFRONT_COOKIE_DOMAIN='.example.com',
+        CLOUDFRONT_COOKIE_TTL=DAY
+    ))
+    return app, private_key.public_key()
+
+def cloudfront_b64decode(value):
+    return base64.b64decode(value.replace('-', '+').replace('_', '=').replace('~', '/'))
+
+def set_cookies(response):
+    """(name, path) of the CloudFront cookies a response sets, and of those it deletes"""
+    issued, deleted = set(), set()
+    for header in response.headers.getlist('Set-Cookie'):
+        name = header.split('=', 1)[0]
+        if name not in CLOUDFRONT_COOKIE_NAMES:
+            continue
+        assert 'Domain=example.com' in header
+        path = next(part.split('=', 1)[1] for part in header.split('; ') if part.startswith('Path='))
+        (deleted if 'Max-Age=0' in header else issued).add((name, path))
+    return issued, deleted
+
+def test_url_expiry_is_aligned_to_buckets(make_app, monkeypatch):
+    now = 100 * DAY + 3600
+    monkeypatch.setattr(s3_service.time, 'time', lambda: now)
+    with make_app(**S3_CONFIG).app_context():
+        service = S3Service()
+        # Every URL signed during a day expires a window after that day ends
+        assert service._url_expires_at(WEEK) == 101 * DAY + WEEK
+        now += DAY - 3601
+        assert service._url_expires_at(WEEK) == 101 * DAY + WEEK
+        now += 1
+        assert service._url_expires_at(WEEK) == 102 * DAY + WEEK
+        # Buckets are never longer than the window
+        now += 30
+        assert service._url_expires_at(600) == 101 * DAY + 600 + 600
+
+        service.url_expiry_bucket = 0
+        assert service._url_expires_at(WEEK) == now + WEEK
+        assert service._cache_ttl(WEEK) == int(WEEK * 0.9)
+
+def test_cache_ttl_is_spread_past_the_bucket_end(make_app, monkeypatch):
+    now = 100 * DAY + 3600
+    monkeypatch.setattr(s3_service.time, 'time', lambda: now)
+    with make_app(**S3_CONFIG).app_context():
+        service = S3Service()
+        bucket_end = 101 * DAY
+        ttls = {service._cache_ttl(WEEK) for _ in range(50)}
+        assert len(ttls) > 1
+        for ttl in ttls:
+            assert bucket_end - now <= ttl <= bucket_end - now + WEEK * s3_service.URL_CACHE_TTL_JITTER
+            # Whoever reads the cached URL last still has most of its window left
+            assert service._url_expires_at(WEEK) - (now + ttl) >= service._remaining_validity(WEEK)
+
+def test_signed_cookies_cover_each_path_with_its_own_policy(make_app):
+    with tempfile.TemporaryDirectory() as key_dir:
+        app, public_key = make_cloudfront_app(make_app, key_dir)
+        with app.app_context():
+            service = S3Service()
+            assert service.use_signed_cookies
+            cookies, expires_at = service.get_signed_cookies()
+    
+    assert expires_at == service._url_expires_at(DAY)
+    assert [path for path, _ in cookies] == ['/checkins/', '/thumbnails/checkins/', '/renditions/checkins/']
+    assert service.signed_cookie_paths() == [path for path, _ in cookies]
+    for (path, values), resource in zip(cookies, service.cloudfront_cookie_paths):
+        assert tuple(values) == CLOUDFRONT_COOKIE_NAMES
+        policy = cloudfront_b64decode(values['CloudFront-Policy'])
+        statement = json.loads(policy)['Statement'][0]
+        assert statement['Resource'] == f"https://cdn.example.com/{resource}"
+        assert statement['Condition']['DateLessThan']['AWS:EpochTime'] == expires_at
+        public_key.verify(cloudfront_b64decode(values['CloudFront-Signature']), policy,
+                          padding.PKCS1v15(), hashes.SHA1())
+    
+    assert service._covered_by_signed_cookies('checkins/1/2/20250101_ab12cd34.jpg')
+    assert service._covered_by_signed_cookies('/thumbnails/checkins/1/2/20250101_ab12cd34.jpg')
+    assert service._covered_by_signed_cookies('renditions/checkins/1/2/20250101_ab12cd34_640w.webp')
+    assert not service._covered_by_signed_cookies('exports/1.zip')
+    service.use_signed_cookies = False
+    assert not service._covered_by_signed_cookies('checkins/1/2/20250101_ab12cd34.jpg')
+
+def test_cookies_are_refreshed_late_in_their_window_and_cleared_at_logout(make_app):
+    with tempfile.TemporaryDirectory() as key_dir:
+        app, _ = make_cloudfront_app(make_app, key_dir)
+        with app.app_context():
+            db.session.add(User(id=1, username='a', email='a@example.com', password_hash='x'))
+            db.session.commit()
+        client = app.test_client()
+        grant = {(name, path) for path in ('/checkins/', '/thumbnails/checkins/', '/renditions/checkins/')
+                 for name in CLOUDFRONT_COOKIE_NAMES}
+        
+        assert set_cookies(client.get('/')) == (set(), set())
+        with client.session_transaction() as session:
+            session['_user_id'] = '1'
+        assert set_cookies(client.get('/'))[0] == grant
+        assert set_cookies(client.get('/')) == (set(), set())
+        
+        # Re-issued once less than a quarter of the TTL is left
+        with client.session_transaction() as session:
+            session['cloudfront_cookies_expire'] = s3_service.time.time() + DAY // 4 - 60
+        assert set_cookies(client.get('/'))[0] == grant
+        
+        response = client.get('/auth/logout')
+        assert set_cookies(response) == (set(), grant)
+        with client.session_transaction() as session:
+            assert 'cloudfront_cookies_expire' not in session
+
+def test_a_page_of_urls_costs_one_lookup_and_one_write(make_app, fake_redis):
+    with make_app(**S3_CONFIG).app_context():
+        service = S3Service()
+        service.redis_client = fake_redis
+        service.redis_breaker = CircuitBreaker('redis-test', probe=lambda: None)
+        keys = [f"checkins/1/1/20250101_{n:08d}.jpg" for n in range(5)]
+        for key in keys[:2]:
+            fake_redis.values[service._url_cache_key(key)] = f"https://cached.example.com/{key}".encode()
+        fake_redis.round_trips.clear()
+        
+        urls = service.get_file_urls(keys + keys[:1] + [None])
+        assert list(urls) == keys
+        assert [urls[key] for key in keys[:2]] == [f"https://cached.example.com/{key}" for key in keys[:2]]
+        for key in keys[2:]:
+            assert urls[key].startswith(f"https://bucket.s3.amazonaws.com/{key}?")
+        assert fake_redis.round_trips == ['mget', ('pipeline', ['setex'] * 3)]
+        assert all(fake_redis.values[service._url_cache_key(key)] == urls[key].encode() for key in keys)
+        
+        # Now every URL is in the worker's own cache
+        fake_redis.round_trips.clear()
+        assert service.get_file_urls(keys) == urls
+        assert fake_redis.round_trips == []
+        
+        # Thumbnails of a page: legacy thumbnails and renditions resolve in the same single batch
+        service._local_urls.clear()
+        rendition = {'key': 'renditions/checkins/1/1/20250101_00000004_320w.jpg', 'width': 320, 'height': 240,
+                     'content_type': 'image/jpeg'}
+        thumbnails = service.get_thumbnail_urls(keys, renditions={keys[4]: [rendition]})
+        assert thumbnails[keys[0]].startswith(f"https://bucket.s3.amazonaws.com/thumbnails/{keys[0]}?")
+        assert thumbnails[keys[4]].startswith(f"https://bucket.s3.amazonaws.com/{rendition['key']}?")
+        assert fake_redis.round_trips == ['mget', ('pipeline', ['setex'] * 5)]
+
+def test_deletes_are_batched_and_failed_keys_reported(make_app, fake_redis):
+    # One I/O worker, so the batches reach the stubbed client in order
+    with make_app(**dict(S3_CONFIG, S3_IO_CONCURRENCY=1)).app_context():
+        service = S3Service()
+        service.redis_client = fake_redis
+        service.redis_breaker = CircuitBreaker('redis-test', probe=lambda: None)
+        service._url_namespace()
+        fake_redis.round_trips.clear()
+        keys = [f"checkins/1/1/20250101_{n:08d}.jpg" for n in range(1500)]
+        
+        with Stubber(service.s3_client) as stubber:
+            for batch, response in ((keys[:1000], {}), (keys[1000:], {'Errors': [
+                {'Key': keys[1001], 'Code': 'AccessDenied', 'Message': 'Access Denied'},
+                {'Key': keys[1499], 'Code': 'InternalError', 'Message': 'Internal Error'}
+            ]})):
+                stubber.add_response('delete_objects', response, {
+                    'Bucket': 'bucket',
+                    'Delete': {'Objects': [{'Key': key} for key in batch], 'Quiet': True}
+                })
+            assert service.delete_keys(keys + keys[:10] + [None]) == [keys[1001], keys[1499]]
+            stubber.assert_no_pending_responses()
+            
+            # A batch whose request fails is reported whole
+            stubber.add_client_error('delete_objects', 'SlowDown', http_status_code=503)
+            assert service.delete_keys(keys[:3]) == keys[:3]
+            stubber.assert_no_pending_responses()
+        
+        # Cached URLs of all deleted keys go in one pipeline per call
+        assert [trip[0] for trip in fake_redis.round_trips] == ['pipeline', 'pipeline']
+        assert service.delete_keys([]) == []
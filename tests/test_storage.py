@@ -0,0 +1,91 @@
+import os
+import tempfile
+from datetime import date, datetime
+
+import pytest
+from app import db
+from app.models.models import CheckIn, CheckInImage, FriendRelationship, Project, ProjectMember, User
+from app.services.local_storage import LocalStorageBackend
+from app.services.storage import get_storage
+
+def add_image(s3_key, renditions=None):
+    """A private image of user 1, whose friend is user 2; user 3 shares the project only"""
+    db.session.add(Project(id=1, name='P', creator_id=1))
+    for user_id in (1, 2, 3):
+        db.session.add(User(id=user_id, username=f"u{user_id}", email=f"u{user_id}@example.com", password_hash='x'))
+        db.session.add(ProjectMember(user_id=user_id, project_id=1))
+    db.session.add(FriendRelationship(requester_id=1, addressee_id=2, status='accepted'))
+    checkin = CheckIn(id=1, user_id=1, project_id=1, check_date=date(2025, 1, 1), check_time=datetime(2025, 1, 1))
+    db.session.add(checkin)
+    db.session.add(CheckInImage(checkin_id=1, s3_key=s3_key, content_type='image/jpeg', file_size=10,
+                                renditions=renditions))
+    db.session.commit()
+
+def log_in(client, user_id):
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+
+def check_backend(app):
+    with app.test_request_context():
+        storage = get_storage()
+        key = storage.generate_s3_key(1, 2, 'photo.HEIC')
+        assert key.startswith('checkins/1/2/') and key.endswith('.heic')
+        
+        rendition = storage.rendition_key(key, 640, 'image/webp')
+        results = storage.upload_many([
+            (b'0123456789', key, 'image/jpeg'),
+            (b'thumb', f"thumbnails/{key}", 'image/jpeg'),
+            (b'small', rendition, 'image/webp')
+        ])
+        assert [r['success'] for r in results] == [True, True, True]
+        assert results[0]['file_size'] == 10
+        add_image(key, [{'key': rendition, 'width': 640, 'height': 480, 'content_type': 'image/webp'}])
+        
+        url = storage.get_file_url(key)
+        thumbnail_url = storage.get_file_url(f"thumbnails/{key}")
+        rendition_url = storage.get_file_url(rendition)
+        assert storage.get_thumbnail_urls([key]) == {key: thumbnail_url}
+    
+    client = app.test_client()
+    # Only the owner and their friends see a private image; other keys don't exist
+    assert client.get(url).status_code == 302
+    log_in(client, 3)
+    for refused in (url, thumbnail_url, rendition_url, url.replace('.heic', '.png')):
+        assert client.get(refused).status_code == 404
+    log_in(client, 2)
+    assert client.get(thumbnail_url).data == b'thumb'
+    assert client.get(rendition_url).data == b'small'
+    log_in(client, 1)
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.data == b'0123456789'
+    assert response.mimetype == 'image/jpeg'
+    assert 'immutable' in response.headers['Cache-Control']
+    
+    # Conditional and range requests
+    assert client.get(url, headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    partial = client.get(url, headers={'Range': 'bytes=2-5'})
+    assert partial.status_code == 206
+    assert partial.data == b'2345'
+    
+    with app.test_request_context():
+        storage = get_storage()
+        assert storage.delete_keys(storage.image_keys([key])) == []
+    assert client.get(url).status_code == 404
+    assert client.get(thumbnail_url).status_code == 404
+
+def test_memory_backend(make_app):
+    check_backend(make_app(STORAGE_BACKEND='memory'))
+
+def test_local_backend(make_app):
+    with tempfile.TemporaryDirectory() as root:
+        app = make_app(STORAGE_BACKEND='local', LOCAL_STORAGE_PATH=root)
+        check_backend(app)
+        
+        # Keys may not escape the storage root
+        with app.app_context():
+            storage = LocalStorageBackend(root)
+            assert storage._path('checkins/1/1/photo.jpg') == os.path.join(root, 'checkins', '1', '1', 'photo.jpg')
+            for key in ('../config.py', 'checkins/../../config.py', '/etc/passwd'):
+                with pytest.raises(ValueError):
+                    storage._path(key)
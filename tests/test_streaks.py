@@ -0,0 +1,77 @@
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+from app import db
+from app.models.models import CheckIn, UserProjectStat
+from app.services import streaks
+
+def walk(days):
+    """The per-check-in loop delete_checkin used to run"""
+    current = highest = 0
+    last = None
+    for day in sorted(days):
+        if last is None or (day - last).days == 1:
+            current += 1
+        elif day != last:
+            current = 1
+        highest = max(highest, current)
+        last = day
+    return current, highest, last
+
+def add_random_checkins(seed=7):
+    rng = random.Random(seed)
+    expected = {}
+    start = date(2025, 1, 1)
+    for user_id in range(1, 6):
+        for project_id in (1, 2):
+            days = [start + timedelta(days=rng.randrange(60)) for _ in range(rng.randrange(0, 40))]
+            days += [start + timedelta(days=70 + offset) for offset in range(user_id)]  # a run at the end
+            for day in days:
+                db.session.add(CheckIn(user_id=user_id, project_id=project_id, check_date=day,
+                                       check_time=datetime.combine(day, datetime.min.time())))
+            expected[(user_id, project_id)] = (len(days),) + walk(days)
+    db.session.commit()
+    return expected
+
+def as_tuple(stats):
+    return (stats['total_checkins'], stats['current_streak'], stats['highest_streak'], stats['last_checkin_date'])
+
+def test_sql_and_bulk_modes_match_the_python_walk(app):
+    with app.app_context():
+        expected = add_random_checkins()
+        
+        for (user_id, project_id), values in expected.items():
+            assert as_tuple(streaks.user_streaks(user_id, project_id)) == values
+        
+        bulk = streaks.bulk_streaks(use_numpy=False)
+        assert {key: as_tuple(stats) for key, stats in bulk.items()} == expected
+        assert set(streaks.bulk_streaks(project_id=2, use_numpy=False)) == {key for key in expected if key[1] == 2}
+        assert as_tuple(streaks.user_streaks(9, 1)) == (0, 0, 0, None)
+
+def test_unknown_databases_walk_days_in_python(app, monkeypatch):
+    assert streaks.day_ordinal(CheckIn.check_date, 'oracle') is None
+    monkeypatch.setattr(streaks, 'day_ordinal', lambda column, dialect_name: None)
+    with app.app_context():
+        expected = add_random_checkins(seed=3)
+        for (user_id, project_id), values in expected.items():
+            assert as_tuple(streaks.user_streaks(user_id, project_id)) == values
+
+@pytest.mark.skipif(not streaks.NUMPY_AVAILABLE, reason='NumPy is not installed')
+def test_numpy_mode_matches_python_mode(app):
+    with app.app_context():
+        add_random_checkins(seed=11)
+        assert streaks.bulk_streaks(use_numpy=True) == streaks.bulk_streaks(use_numpy=False)
+
+def test_rebuild_rewrites_user_stats(app):
+    with app.app_context():
+        expected = add_random_checkins()
+        db.session.add(UserProjectStat(user_id=9, project_id=1, total_checkins=5, current_streak=5, highest_streak=5))
+        db.session.add(UserProjectStat(user_id=1, project_id=1, total_checkins=1))
+        db.session.commit()
+        
+        assert streaks.rebuild_user_stats(use_numpy=False) == len(expected) + 1
+        rows = {(s.user_id, s.project_id): (s.total_checkins, s.current_streak, s.highest_streak, s.last_checkin_date)
+                for s in UserProjectStat.query}
+        expected[(9, 1)] = (0, 0, 0, None)
+        assert rows == expected
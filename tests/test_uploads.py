@@ -0,0 +1,45 @@
+from io import BytesIO
+
+from flask import Flask, jsonify, request
+from app.utils.uploads import UploadRequest, upload_size, upload_stream
+
+def make_upload_app():
+    app = Flask(__name__)
+    app.request_class = UploadRequest
+    app.config.update(MAX_CONTENT_LENGTH=64 * 1024, MAX_IMAGE_SIZE=16 * 1024, UPLOAD_SPOOL_THRESHOLD=4 * 1024)
+    
+    @app.route('/upload', methods=['POST'])
+    def upload():
+        files = {}
+        for image in request.files.getlist('images'):
+            stream = image.stream
+            files[image.filename] = {
+                'size': upload_size(image),
+                'oversized': stream.oversized,
+                # Rolled over to a temporary file once past UPLOAD_SPOOL_THRESHOLD
+                'on_disk': not isinstance(stream._file, BytesIO),
+                'data': upload_stream(image).read().decode()
+            }
+        return jsonify(files)
+    
+    return app
+
+def test_uploads_are_spooled_and_size_checked_per_file():
+    client = make_upload_app().test_client()
+    response = client.post('/upload', data={'images': [
+        (BytesIO(b'a' * 1000), 'small.jpg'),
+        (BytesIO(b'b' * 8000), 'spooled.jpg'),
+        (BytesIO(b'c' * 20000), 'huge.jpg'),
+    ]})
+    files = response.get_json()
+    
+    assert files['small.jpg'] == {'size': 1000, 'oversized': False, 'on_disk': False, 'data': 'a' * 1000}
+    assert files['spooled.jpg']['on_disk'] and files['spooled.jpg']['data'] == 'b' * 8000
+    # The oversized part is counted but not kept
+    assert files['huge.jpg']['size'] == 20000 and files['huge.jpg']['oversized']
+    assert files['huge.jpg']['data'] == ''
+
+def test_request_above_max_content_length_is_rejected():
+    client = make_upload_app().test_client()
+    response = client.post('/upload', data={'images': [(BytesIO(b'x' * 70 * 1024), 'a.jpg')]})
+    assert response.status_code == 413
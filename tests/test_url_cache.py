@@ -0,0 +1,46 @@
+import time
+import threading
+
+from app.services.url_cache import TTLCache, SingleFlight
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1, valid_for=60)
+    cache.set('b', 2, valid_for=60)
+    cache.get('a')
+    cache.set('c', 3, valid_for=60)
+    
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+
+def test_ttl_cache_serves_stale_until_invalid():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set('url', 'https://example.com/a.jpg', valid_for=60, ttl=0)
+    time.sleep(0.01)
+    
+    assert cache.get('url') is None
+    assert cache.get_stale('url') == 'https://example.com/a.jpg'
+    
+    cache.set('expired', 'x', valid_for=0)
+    time.sleep(0.01)
+    assert cache.get_stale('expired') is None
+
+def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    calls = []
+    results = []
+    
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return 'signed'
+    
+    threads = [threading.Thread(target=lambda: results.append(flight.do('key', slow))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len(calls) == 1
+    assert results == ['signed'] * 8